@@ -44,3 +44,26 @@ class User:
         self.avatar_filename = avatar_filename
         self.share_progress = share_progress
         self.batches = batches
+
+
+class UserCredentials:
+    """Only what's needed to authenticate the user."""
+    def __init__(self, id: int, username: str, hashed_password: str) -> None:
+        self.id = id
+        self.username = username
+        self.hashed_password = hashed_password
+
+
+class UserProfile:
+    """The user, without the academic challenge batches."""
+    def __init__(
+            self,
+            id: int,
+            username: str,
+            avatar_filename: str | None,
+            share_progress: bool | None
+    ) -> None:
+        self.id = id
+        self.username = username
+        self.avatar_filename = avatar_filename
+        self.share_progress = share_progress
@@ -1,5 +1,9 @@
-from datetime import datetime, date
+import heapq
+import math
+from bisect import bisect_left
+from datetime import datetime, date, timedelta
 from enum import Enum
+from typing import Iterable, Iterator
 
 from repository.sql.models.models import STArchiveModel, STCurricularUnitModel, STEventModel, STFileModel, STGradeModel, WeekStudyTimeModel
 from router.study_tracker.dtos.input_dtos import CreateTaskInputDto, SlotToWorkInputDto
@@ -65,7 +69,7 @@ class Task():
         for sub_task in task_dto.subTasks:
             sub_tasks.append(Task.from_create_task_input_dto(sub_task))
         return Task(
-            id=None,
+            id=task_dto.id,
             title=task_dto.title,
             description=task_dto.description if task_dto.description is not None else "",
             deadline=datetime.fromtimestamp(task_dto.deadline) if task_dto.deadline is not None else None,
@@ -87,21 +91,82 @@ class DateInterval():
          self.end_date=end_date
 
     def collides_with_unavailable_block(self, block: UnavailableScheduleBlock):
-        block_start_hour = block.start_hour
-        block_end_hour = block.start_hour + block.duration
-        event_start_hour = self.start_date.time().hour
-        event_end_hour = self.end_date.time().hour
-
-        if event_start_hour < block_start_hour:
-            if event_end_hour <= block_start_hour:
-                return False
-            return True
-        if  event_start_hour == block_start_hour:
-            return True
-        if event_start_hour > block_start_hour and event_start_hour < block_end_hour:
+        return WeeklyIntervalIndex([block]).collides_with(self)
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+def get_minute_of_week(moment: datetime) -> int:
+    """Minutes since Monday 00:00 (week days follow datetime.weekday())."""
+    return moment.weekday() * MINUTES_PER_DAY + moment.hour * 60 + moment.minute
+
+class WeeklyIntervalIndex():
+    """
+    Unavailable schedule blocks, as sorted and merged [start, end[ minute of the week intervals.
+    Blocks wrapping past the end of the week (Sunday into Monday) are split in two.
+    Checking an interval is a binary search, O(log n).
+    """
+    def __init__(self, blocks: Iterable[UnavailableScheduleBlock]):
+        intervals: list[tuple[int, int]] = []
+        for block in blocks:
+            if block.duration <= 0:
+                continue
+            duration = block.duration * 60
+            if duration >= MINUTES_PER_WEEK:
+                intervals = [(0, MINUTES_PER_WEEK)]
+                break
+            start = (block.week_day * MINUTES_PER_DAY + block.start_hour * 60) % MINUTES_PER_WEEK
+            end = start + duration
+            if end > MINUTES_PER_WEEK:
+                intervals.append((start, MINUTES_PER_WEEK))
+                intervals.append((0, end - MINUTES_PER_WEEK))
+            else:
+                intervals.append((start, end))
+
+        self.starts: list[int] = []
+        self.ends: list[int] = []
+        for start, end in sorted(intervals):
+            if self.ends and start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def is_empty(self) -> bool:
+        return not self.starts
+
+    def overlaps(self, start: int, end: int) -> bool:
+        """Whether [start, end[, inside a single week, overlaps any interval."""
+        # Intervals are disjoint, so only the last one starting before `end` can overlap
+        index = bisect_left(self.starts, end) - 1
+        return index >= 0 and self.ends[index] > start
+
+    def occurrences(self, window_start: datetime, window_end: datetime) -> Iterator[DateInterval]:
+        """Lazily yields the concrete intervals, ordered, which overlap [window_start, window_end[."""
+        week_start = datetime.combine(window_start.date() - timedelta(days=window_start.weekday()), datetime.min.time())
+        while week_start < window_end:
+            for start, end in zip(self.starts, self.ends):
+                interval_start = week_start + timedelta(minutes=start)
+                interval_end = week_start + timedelta(minutes=end)
+                if interval_end > window_start and interval_start < window_end:
+                    yield DateInterval(interval_start, interval_end)
+            week_start += timedelta(weeks=1)
+
+    def collides_with(self, interval: DateInterval) -> bool:
+        """Whether the interval, of any length, at minute granularity, overlaps any unavailable block."""
+        if self.is_empty():
+            return False
+        start = get_minute_of_week(interval.start_date)
+        start_of_minute = interval.start_date.replace(second=0, microsecond=0)
+        duration = math.ceil((interval.end_date - start_of_minute).total_seconds() / 60)
+        if duration <= 0:
+            return False
+        if duration >= MINUTES_PER_WEEK:
             return True
-
-        return False
+        end = start + duration
+        if end <= MINUTES_PER_WEEK:
+            return self.overlaps(start, end)
+        return self.overlaps(start, MINUTES_PER_WEEK) or self.overlaps(0, end - MINUTES_PER_WEEK)
 
 """
 class ScheduleBlock():
@@ -120,8 +185,11 @@ class ScheduleBlock():
         )
 """
 
+# Color of the events created by the backend itself, such as task work slots
+DEFAULT_EVENT_COLOR = "#3399FF"
+
 class Event():
-    def __init__(self, id: int | None, title: str, date: DateInterval, tags: list[str], every_week: bool, every_day: bool, color: str,notes: str = ""):
+    def __init__(self, id: int | None, title: str, date: DateInterval, tags: list[str], every_week: bool, every_day: bool, color: str,notes: str = "", task_id: int | None = None):
         self.id=id
         self.title=title
         self.date=date
@@ -130,6 +198,58 @@ class Event():
         self.every_day=every_day
         self.color = color
         self.notes = notes
+        self.task_id = task_id # Set when this event is a work slot of a task
+
+    def is_recurrent(self) -> bool:
+        return self.every_week or self.every_day
+
+    def recurrence_step(self) -> timedelta | None:
+        if self.every_day:
+            return timedelta(days=1)
+        if self.every_week:
+            return timedelta(weeks=1)
+        return None
+
+    def occurrences(self, window_start: datetime | None, window_end: datetime, overlapping: bool = False) -> Iterator['Event']:
+        """
+        Lazily yields the concrete occurrences of this event which start inside [window_start, window_end[
+        or, when overlapping, which overlap it (e.g. an overnight event seen from the next day).
+        A non recurrent event has, at most, a single occurrence: itself.
+        window_start=None means "since the first occurrence".
+        """
+        step = self.recurrence_step()
+        first_start = self.date.start_date
+        if overlapping and window_start is not None:
+            # Ending after window_start is starting after window_start - duration
+            window_start = window_start - (self.date.end_date - self.date.start_date) + timedelta(microseconds=1)
+        if step is None:
+            if (window_start is None or first_start >= window_start) and first_start < window_end:
+                yield self
+            return
+
+        # Jump directly to the first occurrence inside the window, instead of walking the whole series
+        index = 0
+        if window_start is not None and window_start > first_start:
+            index = -((first_start - window_start) // step) # ceil division
+
+        duration = self.date.end_date - self.date.start_date
+        occurrence_start = first_start + index * step
+        while occurrence_start < window_end:
+            yield Event(
+                id=self.id,
+                title=self.title,
+                date=DateInterval(
+                    start_date=occurrence_start,
+                    end_date=occurrence_start + duration
+                ),
+                tags=self.tags,
+                every_week=self.every_week,
+                every_day=self.every_day,
+                color=self.color,
+                notes=self.notes,
+                task_id=self.task_id
+            )
+            occurrence_start += step
 
     @staticmethod
     def from_STEventModel(events: list[STEventModel]) -> list['Event']:
@@ -151,11 +271,79 @@ class Event():
                     every_week=event_result.every_week,
                     every_day=event_result.every_day,
                     notes=event_result.notes,
-                    color=event_result.color
+                    color=event_result.color,
+                    task_id=event_result.task_id
                 )
             )
         return today_events
 
+def expand_occurrences(events: Iterable[Event], window_start: datetime | None, window_end: datetime, overlapping: bool = False) -> Iterator[Event]:
+    """Lazily merges the occurrences of all events, inside (or, when overlapping, overlapping) the window, ordered by start date."""
+    return heapq.merge(
+        *(event.occurrences(window_start, window_end, overlapping) for event in events),
+        key=lambda occurrence: occurrence.date.start_date
+    )
+
+def get_outside_of_day_hours(window_start: datetime, window_end: datetime, day_start_hour: int, day_end_hour: int) -> Iterator[DateInterval]:
+    """Lazily yields, ordered, the parts of each day outside of [day_start_hour, day_end_hour[."""
+    day = datetime.combine(window_start.date(), datetime.min.time())
+    while day < window_end:
+        if day_start_hour > 0:
+            yield DateInterval(day, day + timedelta(hours=day_start_hour))
+        if day_end_hour < 24:
+            yield DateInterval(day + timedelta(hours=day_end_hour), day + timedelta(days=1))
+        day += timedelta(days=1)
+
+def propose_work_slots(
+    busy: Iterable[Iterable[DateInterval]],
+    window_start: datetime,
+    window_end: datetime,
+    effort: timedelta,
+    slot_length: timedelta,
+    max_per_day: timedelta | None = None
+) -> list[SlotToWork]:
+    """
+    Proposes the earliest work slots, inside [window_start, window_end[, adding up to `effort`.
+    `busy` are sources of intervals, each ordered by start date, which may overlap.
+    A sweep line over their merge finds the free gaps, in a single pass, which are cut into slots of, at most,
+    `slot_length`, and at most `max_per_day` per day. Gaps shorter than the next slot are skipped.
+    """
+    slots: list[SlotToWork] = []
+    remaining = effort
+    used_by_day: dict[date, timedelta] = {}
+
+    def fill(gap_start: datetime, gap_end: datetime):
+        nonlocal remaining
+        cursor = gap_start
+        while remaining > timedelta(0) and cursor < gap_end:
+            day = cursor.date()
+            next_day = datetime.combine(day + timedelta(days=1), datetime.min.time())
+            length = min(slot_length, remaining)
+            # Slots don't cross midnight, so each counts towards a single day
+            available = min(gap_end, next_day) - cursor
+            if max_per_day is not None:
+                available = min(available, max_per_day - used_by_day.get(day, timedelta(0)))
+            if available < length:
+                cursor = next_day
+                continue
+            slots.append(SlotToWork(start_time=cursor, end_time=cursor + length))
+            used_by_day[day] = used_by_day.get(day, timedelta(0)) + length
+            remaining -= length
+            cursor += length
+
+    cursor = window_start
+    for interval in heapq.merge(*busy, key=lambda interval: interval.start_date):
+        if remaining <= timedelta(0):
+            break
+        if interval.start_date > cursor:
+            fill(cursor, min(interval.start_date, window_end))
+        cursor = max(cursor, interval.end_date)
+        if cursor >= window_end:
+            break
+    if cursor < window_end:
+        fill(cursor, window_end)
+    return slots
+
 class File():
     def __init__(self, name: str, text: str):
         self.name=name
@@ -16,5 +16,9 @@ class AlreadyExistsException(Exception):
         super().__init__()
         
 class InvalidDate(Exception):
+    def __init__(self):
+        super().__init__()
+        
+class PasswordHashingBusyException(Exception):
     def __init__(self):
         super().__init__()
\ No newline at end of file
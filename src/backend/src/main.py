@@ -1,23 +1,36 @@
 import os
 import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
-from exception import AlreadyExistsException, InvalidDate, NotFoundException, NotAvailableScheduleBlockCollision, UsernameAlreadyExistsException
+from exception import AlreadyExistsException, InvalidDate, NotFoundException, NotAvailableScheduleBlockCollision, PasswordHashingBusyException, UsernameAlreadyExistsException
 from router import u_lisboa_auth
 from router.academic_challenge import academic_challenge
 from router.commons import common
 from router.gamification.badges import router as gamification_router
 
 from fastapi.middleware.cors import CORSMiddleware
-from router import tags
+from router import metrics, tags
 from router.study_tracker import study_tracker
+from repository.sql.models import database
+from middleware import RequestSessionMiddleware
+from service.gamification.events import GAMIFICATION_WORKER_ENABLED, gamification_worker
 from dotenv import load_dotenv
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if GAMIFICATION_WORKER_ENABLED:
+        gamification_worker.start()
+    yield
+    gamification_worker.stop()
+    # asyncpg connections belong to the event loop that opened them
+    await database.dispose_async_engine()
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS
 dev_mode = True
@@ -41,11 +54,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# One sync session (and connection) per request, shared by the routers and the repositories
+app.add_middleware(RequestSessionMiddleware)
+
 app.include_router(common.router)
 app.include_router(gamification_router) 
 app.include_router(academic_challenge.router)
 app.include_router(study_tracker.router)
 app.include_router(tags.router)
+app.include_router(metrics.router)
 # app.include_router(u_lisboa_auth.router)
 
 @app.exception_handler(NotFoundException)
@@ -81,4 +98,12 @@ async def invalid_date_exception_handler(request: Request, exc: InvalidDate):
     return JSONResponse(
         status_code=400, # Conflict
         content={"error": "Date is invalid"},
+    )
+
+@app.exception_handler(PasswordHashingBusyException)
+async def password_hashing_busy_exception_handler(request: Request, exc: PasswordHashingBusyException):
+    return JSONResponse(
+        status_code=429, # Too Many Requests
+        content={"error": "Too many login attempts at the moment, try again shortly"},
+        headers={"Retry-After": "1"},
     )
\ No newline at end of file
@@ -0,0 +1,28 @@
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from repository.sql.models import database
+
+
+class RequestSessionMiddleware:
+    """
+    Gives each HTTP request its own RequestSessionScope, so every database.session_scope() of the request
+    reuses the same session, and connection. The session is closed, returning the connection, once the response is sent.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        session_scope = database.RequestSessionScope()
+        token = database.request_session_scope.set(session_scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            database.request_session_scope.reset(token)
+            if session_scope.session is not None:
+                await run_in_threadpool(session_scope.close)
@@ -0,0 +1,28 @@
+import sqlmodel
+
+"""Adds st_event (user_id, start_date) index
+
+Revision ID: 3b7d2e91c0a4
+Revises: 8949de013992
+Create Date: 2026-10-18 10:12:41.204518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b7d2e91c0a4'
+down_revision: Union[str, None] = '8949de013992'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_st_event_user_id_start_date', 'st_event', ['user_id', 'start_date'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_st_event_user_id_start_date', table_name='st_event')
@@ -0,0 +1,74 @@
+import sqlmodel
+
+"""Adds ID sequences, replacing random ID generation
+
+Revision ID: a41c6f0e8d25
+Revises: 3b7d2e91c0a4
+Create Date: 2026-10-18 11:02:17.530961
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a41c6f0e8d25'
+down_revision: Union[str, None] = '3b7d2e91c0a4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Previous IDs were random, in [1, 2^31 - 1]. Sequences start right after, so they never collide.
+ID_SEQUENCE_START = 2147483648
+
+# Tables whose "id" is now taken from "<table>_id_seq"
+SEQUENCE_TABLES = ['user', 'st_event', 'st_task', 'batch', 'st_grade']
+
+# Columns holding one of those IDs, which need to grow to BIGINT
+BIGINT_COLUMNS = {
+    'user': ['id'],
+    'st_event': ['id', 'user_id'],
+    'st_task': ['id', 'user_id', 'parent_task_id', 'parent_user_id'],
+    'batch': ['id', 'user_id'],
+    'st_grade': ['id', 'user_id'],
+    'st_event_tag': ['event_id', 'user_id'],
+    'st_task_tag': ['task_id', 'user_id'],
+    'batch_day': ['batch_id', 'user_id'],
+    'challenge': ['batch_id', 'user_id'],
+    'user_tag_link': ['user_id'],
+    'daily_tag': ['user_id'],
+    'st_app_use_model': ['user_id'],
+    'st_week_day_planning': ['user_id'],
+    'st_schedule_block_not_available': ['user_id'],
+    'st_archive': ['user_id'],
+    'st_file': ['user_id'],
+    'st_curricular_unit': ['user_id'],
+    'daily_energy_status': ['user_id'],
+    'week_study_time': ['user_id'],
+    'user_badges': ['user_id'],
+    'user_metrics': ['user_id'],
+    'user_leagues': ['user_id'],
+}
+
+
+def upgrade() -> None:
+    for table, columns in BIGINT_COLUMNS.items():
+        for column in columns:
+            op.alter_column(table, column, type_=sa.BigInteger(), existing_type=sa.Integer())
+
+    for table in SEQUENCE_TABLES:
+        sequence = f'{table}_id_seq'
+        op.execute(f'CREATE SEQUENCE IF NOT EXISTS "{sequence}" AS BIGINT')
+        op.execute(f'ALTER SEQUENCE "{sequence}" AS BIGINT OWNED BY "{table}".id')
+        op.execute(
+            f'SELECT setval(\'"{sequence}"\', GREATEST({ID_SEQUENCE_START}, (SELECT COALESCE(MAX(id), 0) + 1 FROM "{table}")), false)'
+        )
+        op.alter_column(table, 'id', server_default=sa.text(f'nextval(\'"{sequence}"\')'))
+
+
+def downgrade() -> None:
+    # IDs taken from the sequences don't fit in INTEGER, so the columns are kept as BIGINT
+    for table in SEQUENCE_TABLES:
+        op.alter_column(table, 'id', server_default=None)
+        op.execute(f'DROP SEQUENCE IF EXISTS "{table}_id_seq"')
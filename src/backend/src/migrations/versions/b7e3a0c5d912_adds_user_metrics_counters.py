@@ -0,0 +1,42 @@
+import sqlmodel
+
+"""Adds the user_metrics counters the badge criteria depend on
+
+Revision ID: b7e3a0c5d912
+Revises: f5a2d9e04b17
+Create Date: 2026-10-18 21:05:44.630127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e3a0c5d912'
+down_revision: Union[str, None] = 'f5a2d9e04b17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COUNTERS = [
+    'total_pomodoro_cycles',
+    'total_tasks_completed',
+    'total_notepad_entries',
+    'total_forum_questions',
+    'total_forum_answers',
+    'total_events_added',
+    'simultaneous_tool_uses',
+]
+
+
+def upgrade() -> None:
+    # The server default only fills the existing rows
+    for column in COUNTERS:
+        op.add_column('user_metrics', sa.Column(column, sa.Integer(), server_default='0', nullable=False))
+        op.alter_column('user_metrics', column, server_default=None)
+
+
+def downgrade() -> None:
+    for column in reversed(COUNTERS):
+        op.drop_column('user_metrics', column)
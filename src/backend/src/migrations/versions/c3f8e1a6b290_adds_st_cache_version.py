@@ -0,0 +1,34 @@
+import sqlmodel
+
+"""Adds st_cache_version, the versions the study tracker caches are keyed by
+
+Revision ID: c3f8e1a6b290
+Revises: b7e3a0c5d912
+Create Date: 2026-10-18 23:12:40.218664
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3f8e1a6b290'
+down_revision: Union[str, None] = 'b7e3a0c5d912'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Users without a row are at version 0
+    op.create_table('st_cache_version',
+    sa.Column('user_id', sa.BigInteger(), nullable=False),
+    sa.Column('events_version', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('st_cache_version')
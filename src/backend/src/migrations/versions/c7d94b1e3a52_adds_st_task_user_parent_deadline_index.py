@@ -0,0 +1,28 @@
+import sqlmodel
+
+"""Adds st_task (user_id, parent_task_id, deadline) index
+
+Revision ID: c7d94b1e3a52
+Revises: a41c6f0e8d25
+Create Date: 2026-10-18 12:21:09.418302
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7d94b1e3a52'
+down_revision: Union[str, None] = 'a41c6f0e8d25'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_st_task_user_id_parent_task_id_deadline', 'st_task', ['user_id', 'parent_task_id', 'deadline'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_st_task_user_id_parent_task_id_deadline', table_name='st_task')
@@ -0,0 +1,31 @@
+import sqlmodel
+
+"""Adds st_event.task_id, linking work slot events to their task
+
+Revision ID: d2a6f3c81e47
+Revises: c7d94b1e3a52
+Create Date: 2026-10-18 13:04:55.871230
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2a6f3c81e47'
+down_revision: Union[str, None] = 'c7d94b1e3a52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing work slot events stay unlinked (NULL), and are still matched by the task title
+    op.add_column('st_event', sa.Column('task_id', sa.BigInteger(), nullable=True))
+    op.create_index('ix_st_event_user_id_task_id', 'st_event', ['user_id', 'task_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_st_event_user_id_task_id', table_name='st_event')
+    op.drop_column('st_event', 'task_id')
@@ -0,0 +1,30 @@
+import sqlmodel
+
+"""Adds st_cache_version.unavailable_blocks_version, the version of the unavailable blocks index cache
+
+Revision ID: d9a4b27c6e15
+Revises: c3f8e1a6b290
+Create Date: 2026-10-18 23:48:02.571930
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9a4b27c6e15'
+down_revision: Union[str, None] = 'c3f8e1a6b290'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The server default only fills the existing rows
+    op.add_column('st_cache_version', sa.Column('unavailable_blocks_version', sa.BigInteger(), server_default='0', nullable=False))
+    op.alter_column('st_cache_version', 'unavailable_blocks_version', server_default=None)
+
+
+def downgrade() -> None:
+    op.drop_column('st_cache_version', 'unavailable_blocks_version')
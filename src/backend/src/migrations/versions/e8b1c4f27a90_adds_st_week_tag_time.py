@@ -0,0 +1,50 @@
+import sqlmodel
+
+"""Adds st_week_tag_time, the minutes of the events of each tag, by ISO week
+
+Revision ID: e8b1c4f27a90
+Revises: d2a6f3c81e47
+Create Date: 2026-10-18 16:21:07.402915
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8b1c4f27a90'
+down_revision: Union[str, None] = 'd2a6f3c81e47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('st_week_tag_time',
+    sa.Column('user_id', sa.BigInteger(), nullable=False),
+    sa.Column('year', sa.Integer(), nullable=False),
+    sa.Column('week', sa.Integer(), nullable=False),
+    sa.Column('tag_id', sa.Integer(), nullable=False),
+    sa.Column('minutes', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['tag_id'], ['tags.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'year', 'week', 'tag_id')
+    )
+    # Backfill from the existing events. Recurrent ones are expanded when read
+    op.execute("""
+        INSERT INTO st_week_tag_time (user_id, year, week, tag_id, minutes)
+        SELECT e.user_id,
+            CAST(EXTRACT(isoyear FROM e.start_date) AS INTEGER),
+            CAST(EXTRACT(week FROM e.start_date) AS INTEGER),
+            t.tag_id,
+            CAST(SUM(TRUNC(EXTRACT(epoch FROM e.end_date - e.start_date) / 60)) AS INTEGER)
+        FROM st_event e
+        JOIN st_event_tag t ON t.event_id = e.id AND t.user_id = e.user_id
+        WHERE e.every_week = false AND e.every_day = false
+        GROUP BY 1, 2, 3, 4
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('st_week_tag_time')
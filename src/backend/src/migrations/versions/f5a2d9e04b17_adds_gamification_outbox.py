@@ -0,0 +1,43 @@
+import sqlmodel
+
+"""Adds gamification_outbox, the gamification events processed off the request
+
+Revision ID: f5a2d9e04b17
+Revises: e8b1c4f27a90
+Create Date: 2026-10-18 19:42:13.118350
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f5a2d9e04b17'
+down_revision: Union[str, None] = 'e8b1c4f27a90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('gamification_outbox',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('user_id', sa.BigInteger(), nullable=False),
+    sa.Column('action', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('context', postgresql.JSON(astext_type=sa.Text()), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('available_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_gamification_outbox_available_at_id', 'gamification_outbox', ['available_at', 'id'], unique=False)
+    op.create_index('ix_gamification_outbox_user_id_id', 'gamification_outbox', ['user_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_gamification_outbox_user_id_id', table_name='gamification_outbox')
+    op.drop_index('ix_gamification_outbox_available_at_id', table_name='gamification_outbox')
+    op.drop_table('gamification_outbox')
@@ -1,4 +1,3 @@
-import random
 from datetime import datetime
 
 from sqlmodel import Session, select
@@ -7,25 +6,14 @@ from repository.sql.academic_challenge.repo import AcademicChallengeRepo
 from repository.sql.models import database
 from repository.sql.models.models import BatchModel, ChallengeModel, BatchDayModel
 
-engine = database.get_engine()
-
 
 class AcademicChallengeSqlRepo(AcademicChallengeRepo):
 
     def create_new_batch(self, user_id: int, new_level: int, challenge_ids: list[int] | list[list[int]]) -> int:
-        with Session(engine) as session:
-
-            # Generates a random ID, that is not yet taken
-            random_generated_id: int = 0
-            while True:
-                random_generated_id: int = random.randint(1, database.POSTGRES_MAX_INTEGER_VALUE) # For some reason, automatic ID is not working
-                statement = select(BatchModel).where(BatchModel.id == random_generated_id)
-                result = session.exec(statement)
-                if result.first() is None:
-                    break
+        with database.session_scope() as session:
 
+            # The ID is taken from batch_id_seq, by the INSERT itself
             new_batch = BatchModel(
-                id=random_generated_id,
                 start_date=datetime.now(),
                 level=new_level,
                 user_id=user_id
@@ -83,13 +71,13 @@ class AcademicChallengeSqlRepo(AcademicChallengeRepo):
             session.add_all(batch_days)
             session.flush()
             session.add_all(challenges)
-            session.commit()
+            database.commit(session)
 
             return new_batch.id
 
     def complete_challenge(self, user_id: int, batch_id: int, batch_day_id: int, challenge_id: int,
                            completion_date: datetime):
-        with Session(engine) as session:
+        with database.session_scope() as session:
             statement = select(ChallengeModel).where(
                 ChallengeModel.user_id == user_id,
                 ChallengeModel.batch_id == batch_id,
@@ -103,10 +91,10 @@ class AcademicChallengeSqlRepo(AcademicChallengeRepo):
 
             existing_challenge.completion_date = completion_date
             session.add(existing_challenge)  # This is optional; changes are tracked automatically
-            session.commit()
+            database.commit(session)
 
     def edit_day_notes(self, user_id: int, batch_id: int, batch_day_id: int, notes: str, date: datetime):
-        with Session(engine) as session:
+        with database.session_scope() as session:
             statement = select(BatchDayModel).where(
                 BatchDayModel.user_id == user_id,
                 BatchDayModel.batch_id == batch_id,
@@ -120,4 +108,4 @@ class AcademicChallengeSqlRepo(AcademicChallengeRepo):
 
             existing_batch_day.notes = notes
             session.add(existing_batch_day)  # This is optional; changes are tracked automatically
-            session.commit()
+            database.commit(session)
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from domain.commons.user import User
+from domain.commons.user import User, UserCredentials, UserProfile
 
 class CommonsRepo(ABC):
     @abstractmethod
@@ -22,6 +22,18 @@ class CommonsRepo(ABC):
     def get_user_by_username(self, username: str) -> User | None:
         pass
 
+    @abstractmethod
+    def get_user_id_by_username(self, username: str) -> int | None:
+        pass
+
+    @abstractmethod
+    def get_user_credentials_by_username(self, username: str) -> UserCredentials | None:
+        pass
+
+    @abstractmethod
+    def get_user_profile_by_id(self, id: int) -> UserProfile | None:
+        pass
+
     @abstractmethod
     def update_share_progress_state(self, user_id: int, share_progress: bool):
         pass
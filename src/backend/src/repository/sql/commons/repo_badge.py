@@ -1,5 +1,7 @@
 from sqlmodel import Session, select
-from repository.sql.models.database import get_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.orm import selectinload
+from repository.sql.models.database import get_async_engine, get_engine, session_scope
 from repository.sql.models.models import Badge, UserBadge
 from datetime import datetime, timezone
 
@@ -7,17 +9,37 @@ class BadgeRepo:
     def __init__(self):
         self.engine = get_engine()
 
+    @staticmethod
+    def app_scope_badges_statement(app_scope: str):
+        """Selects the badges of an app scope, with their league. The common badges belong to every scope."""
+        statement = select(Badge).options(selectinload(Badge.league))
+        if app_scope and app_scope != "all":
+            if app_scope == "common":
+                statement = statement.where(Badge.app_scope == "common")
+            else:
+                statement = statement.where(
+                    (Badge.app_scope == "common") | (Badge.app_scope == app_scope)
+                )
+        return statement
+
+    @staticmethod
+    def user_badges_statement(user_id: int):
+        """Selects the user's badge links, with the badge and its league."""
+        return select(UserBadge)\
+            .where(UserBadge.user_id == user_id)\
+            .options(selectinload(UserBadge.badge).selectinload(Badge.league))
+
     def list_all(self) -> list[Badge]:
-        with Session(self.engine) as session:
+        with session_scope() as session:
             return session.exec(select(Badge)).all()
 
     def list_user(self, user_id: int) -> list[Badge]:
-        with Session(self.engine) as session:
+        with session_scope() as session:
             stmt = select(Badge).join(UserBadge).where(UserBadge.user_id == user_id)
             return session.exec(stmt).all()
 
     def assign(self, user_id: int, badge_code: str):
-        with Session(self.engine) as session:
+        with session_scope() as session:
             try:
                 badge = session.exec(select(Badge).where(Badge.code == badge_code)).first()
                 if not badge:
@@ -50,4 +72,17 @@ class BadgeRepo:
             except Exception as e:
                 session.rollback()
                 print(f"[BadgeRepo] ERRO FATAL ao atribuir medalha '{badge_code}' ao utilizador {user_id}: {e}")
-                raise
\ No newline at end of file
+                raise
+
+
+class AsyncBadgeRepo:
+    """AsyncSession (asyncpg) implementation of the badge reads, for the async endpoints."""
+
+    async def list_for_app_scope(self, app_scope: str) -> list[Badge]:
+        async with AsyncSession(get_async_engine()) as session:
+            return list((await session.exec(BadgeRepo.app_scope_badges_statement(app_scope))).all())
+
+    async def list_user(self, user_id: int) -> list[Badge]:
+        async with AsyncSession(get_async_engine()) as session:
+            user_badges = (await session.exec(BadgeRepo.user_badges_statement(user_id))).all()
+            return [user_badge.badge for user_badge in user_badges if user_badge.badge]
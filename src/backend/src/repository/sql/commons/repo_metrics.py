@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta
+from typing import Any
+
+from sqlalchemy import Date, case, cast, func, or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, select
+
+from repository.sql.models.models import UserMetric
+
+
+class UserMetricRepo:
+    """
+    Atomic writes of the user metrics. Each one is a single INSERT ... ON CONFLICT DO UPDATE ... RETURNING,
+    computed by the database from the current row, so concurrent updates of the same user are never lost,
+    and the metrics row is created on first use. Every method works inside the caller's transaction.
+    """
+
+    COUNTERS = frozenset({
+        "study_sessions_completed",
+        "total_pomodoro_cycles",
+        "total_tasks_completed",
+        "total_notepad_entries",
+        "total_forum_questions",
+        "total_forum_answers",
+        "total_events_added",
+        "total_points",
+    })
+
+    @staticmethod
+    def get_or_create(session: Session, user_id: int) -> UserMetric:
+        user_metrics = session.get(UserMetric, user_id)
+        if user_metrics is None:
+            session.execute(
+                insert(UserMetric)
+                    .values(UserMetricRepo._new_row(user_id))
+                    .on_conflict_do_nothing(index_elements=[UserMetric.user_id])
+            )
+            user_metrics = session.get(UserMetric, user_id)
+        return user_metrics
+
+    @staticmethod
+    def increment(session: Session, user_id: int, metric: str, amount: int = 1) -> tuple[UserMetric, int]:
+        """Adds `amount` to the counter. Returns the updated metrics and the counter's previous value."""
+        if metric not in UserMetricRepo.COUNTERS:
+            raise ValueError(f"Unknown counter metric '{metric}'")
+        column = UserMetric.__table__.c[metric]
+        user_metrics = UserMetricRepo._upsert(session, user_id, {metric: amount}, {metric: column + amount})
+        return user_metrics, getattr(user_metrics, metric) - amount
+
+    @staticmethod
+    def raise_to(session: Session, user_id: int, metric: str, value: int) -> tuple[UserMetric, int] | None:
+        """
+        Sets the metric to `value`, when it is higher (a running maximum). Returns the updated metrics and
+        the previous value, or None when the metric already was at least `value`.
+        """
+        column = UserMetric.__table__.c[metric]
+        # Subqueries in RETURNING see the row as it was before the statement
+        previous_metrics = UserMetric.__table__.alias("previous_metrics")
+        previous = func.coalesce(
+            select(previous_metrics.c[metric]).where(previous_metrics.c.user_id == user_id).scalar_subquery(), 0
+        )
+        row = UserMetricRepo._upsert(
+            session, user_id, {metric: value}, {metric: value}, where=column < value, extra_returning=previous
+        )
+        return None if row is None else (row[0], row[1])
+
+    @staticmethod
+    def add_completed_challenge(session: Session, user_id: int, challenge_code: str) -> UserMetric | None:
+        """Appends the challenge, unless it is already there. Returns the updated metrics, or None if it was."""
+        column = UserMetric.__table__.c.completed_challenges
+        return UserMetricRepo._upsert(
+            session, user_id,
+            {"completed_challenges": [challenge_code]},
+            {"completed_challenges": func.array_append(column, challenge_code)},
+            where=~column.any(challenge_code)
+        )
+
+    @staticmethod
+    def record_login(session: Session, user_id: int, now: datetime) -> UserMetric | None:
+        """
+        Extends the login streak, when the last login was the day before `now`, or restarts it. Returns the
+        updated metrics, or None when the user had already logged in that day, or later (a delayed login).
+        """
+        today = now.date()
+        last_login_date = cast(UserMetric.__table__.c.last_login_at, Date)
+        return UserMetricRepo._upsert(
+            session, user_id,
+            {"login_streak": 1, "last_login_at": now},
+            {
+                "login_streak": case(
+                    (last_login_date == today - timedelta(days=1), UserMetric.__table__.c.login_streak + 1),
+                    else_=1
+                ),
+                "last_login_at": now,
+            },
+            where=or_(last_login_date.is_(None), last_login_date < today)
+        )
+
+    @staticmethod
+    def _new_row(user_id: int) -> dict[str, Any]:
+        return UserMetric(user_id=user_id).model_dump()
+
+    @staticmethod
+    def _upsert(session: Session, user_id: int, insert_values: dict[str, Any], update_values: dict[str, Any], where=None, extra_returning=None):
+        statement = insert(UserMetric).values({**UserMetricRepo._new_row(user_id), **insert_values})
+        statement = statement.on_conflict_do_update(index_elements=[UserMetric.user_id], set_=update_values, where=where)
+        if extra_returning is None:
+            return session.scalars(
+                statement.returning(UserMetric),
+                execution_options={"populate_existing": True}
+            ).one_or_none()
+        return session.execute(
+            statement.returning(UserMetric, extra_returning),
+            execution_options={"populate_existing": True}
+        ).one_or_none()
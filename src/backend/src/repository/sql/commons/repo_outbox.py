@@ -0,0 +1,73 @@
+from datetime import timedelta
+from typing import Any
+
+from sqlmodel import Session, delete, func, select, tuple_, update
+
+from repository.sql.models.models import GamificationOutboxModel
+
+
+class GamificationOutboxRepo:
+    """SQL of the gamification outbox. Every method works inside the caller's transaction."""
+
+    @staticmethod
+    def add(session: Session, user_id: int, action: str, context: dict[str, Any] | None = None):
+        session.add(GamificationOutboxModel(user_id=user_id, action=action, context=context))
+
+    @staticmethod
+    def claim_next_user_events(session: Session, limit: int) -> list[GamificationOutboxModel]:
+        """
+        Locks the oldest available events of a single user, so they can be processed together.
+        SKIP LOCKED makes concurrent workers (threads or processes) claim different users, without waiting.
+        """
+        next_user_id = session.exec(
+            select(GamificationOutboxModel.user_id)
+                .where(GamificationOutboxModel.available_at <= func.now())
+                .order_by(GamificationOutboxModel.id)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+        ).first()
+        if next_user_id is None:
+            return []
+
+        return list(session.exec(
+            select(GamificationOutboxModel)
+                .where(GamificationOutboxModel.user_id == next_user_id)
+                .where(GamificationOutboxModel.available_at <= func.now())
+                .order_by(GamificationOutboxModel.id)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+        ).all())
+
+    @staticmethod
+    def delete(session: Session, event_ids: list[int]):
+        session.execute(delete(GamificationOutboxModel).where(GamificationOutboxModel.id.in_(event_ids)))
+
+    @staticmethod
+    def retry_later(session: Session, claimed_attempts: dict[int, int], backoff: timedelta, max_attempts: int) -> int:
+        """
+        Delays the claimed events (ID -> attempts, when claimed) by `backoff` times their attempts, and drops those
+        out of attempts, returning how many. The claim's transaction was rolled back, so the events are locked again
+        first. Those another worker claimed, processed or delayed since then are left to it.
+        """
+        event_ids = list(session.exec(
+            select(GamificationOutboxModel.id)
+                .where(tuple_(GamificationOutboxModel.id, GamificationOutboxModel.attempts).in_(list(claimed_attempts.items())))
+                .with_for_update(skip_locked=True)
+        ).all())
+        if not event_ids:
+            return 0
+
+        session.execute(
+            update(GamificationOutboxModel)
+                .where(GamificationOutboxModel.id.in_(event_ids))
+                .values(
+                    attempts=GamificationOutboxModel.attempts + 1,
+                    available_at=func.now() + (GamificationOutboxModel.attempts + 1) * backoff
+                )
+        )
+        dropped = session.execute(
+            delete(GamificationOutboxModel)
+                .where(GamificationOutboxModel.id.in_(event_ids))
+                .where(GamificationOutboxModel.attempts >= max_attempts)
+        )
+        return dropped.rowcount
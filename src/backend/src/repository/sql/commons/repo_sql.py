@@ -1,13 +1,11 @@
-import random
 from typing import Optional
-from sqlmodel import select, delete, Session
+from sqlmodel import select, delete, update, Session
 from sqlalchemy.engine import ScalarResult
 from sqlalchemy.orm import selectinload 
 
-from domain.commons.user import User, Batch, Challenge, BatchDay 
+from domain.commons.user import User, Batch, Challenge, BatchDay, UserCredentials, UserProfile 
 from exception import NotFoundException
 from repository.sql.commons.repo import CommonsRepo 
-from repository.sql.models import database 
 from repository.sql.models.models import BatchModel, UserModel, UserMetric, BatchDayModel, ChallengeModel 
 
 
@@ -26,14 +24,14 @@ class CommonsSqlRepo(CommonsRepo):
     @staticmethod
     def exists_user_by_username(db: Session, username: str) -> bool: 
         """Check if a user with the given username exists."""
-        statement = select(UserModel).where(UserModel.username == username)
+        statement = select(UserModel.id).where(UserModel.username == username)
         results = db.exec(statement) 
         return results.first() is not None
 
     @staticmethod
     def exists_user_by_id(db: Session, id: int) -> bool: 
         """Check if a user with the given ID exists."""
-        statement = select(UserModel).where(UserModel.id == id)
+        statement = select(UserModel.id).where(UserModel.id == id)
         results = db.exec(statement) 
         return results.first() is not None
     
@@ -72,16 +70,8 @@ class CommonsSqlRepo(CommonsRepo):
     
     @staticmethod
     def create_user(db: Session, username: str, hashed_password: str) -> UserModel: 
-        random_generated_id: int = 0
-        while True:
-            random_generated_id = random.randint(1, database.POSTGRES_MAX_INTEGER_VALUE)
-            statement = select(UserModel).where(UserModel.id == random_generated_id)
-            result = db.exec(statement) 
-            if result.first() is None:
-                break
-
+        # The ID is taken from user_id_seq, by the INSERT itself
         db_user = UserModel(
-            id=random_generated_id,
             username=username,
             hashed_password=hashed_password,
             avatar_filename=None,
@@ -103,6 +93,37 @@ class CommonsSqlRepo(CommonsRepo):
         result = db.exec(statement) 
         return CommonsSqlRepo.from_user_model_result(result)
 
+    @staticmethod
+    def get_user_id_by_username(db: Session, username: str) -> int | None: 
+        """Only selects the ID, without loading the user or any relationship."""
+        statement = select(UserModel.id).where(UserModel.username == username)
+        return db.exec(statement).first()
+
+    @staticmethod
+    def get_user_credentials_by_username(db: Session, username: str) -> UserCredentials | None: 
+        """Only selects the columns needed to authenticate the user."""
+        statement = select(UserModel.id, UserModel.username, UserModel.hashed_password)\
+            .where(UserModel.username == username)
+        row = db.exec(statement).first()
+        if row is None:
+            return None
+        return UserCredentials(id=row.id, username=row.username, hashed_password=row.hashed_password)
+
+    @staticmethod
+    def get_user_profile_by_id(db: Session, id: int) -> UserProfile | None: 
+        """Only selects the user's own columns, without the academic challenge batches."""
+        statement = select(UserModel.id, UserModel.username, UserModel.avatar_filename, UserModel.share_progress)\
+            .where(UserModel.id == id)
+        row = db.exec(statement).first()
+        if row is None:
+            return None
+        return UserProfile(
+            id=row.id,
+            username=row.username,
+            avatar_filename=row.avatar_filename,
+            share_progress=row.share_progress
+        )
+
     @staticmethod
     def get_user_by_username(db: Session, username: str) -> User | None: 
         statement = select(UserModel).where(UserModel.username == username).options(
@@ -121,6 +142,14 @@ class CommonsSqlRepo(CommonsRepo):
         db.commit() 
         db.refresh(user_model) 
 
+    @staticmethod
+    def update_user_password_hash(db: Session, user_id: int, hashed_password: str): 
+        statement = update(UserModel)\
+            .where(UserModel.id == user_id)\
+            .values(hashed_password=hashed_password)
+        db.execute(statement)
+        db.commit()
+
     @staticmethod
     def update_share_progress_state(db: Session, user_id: int, share_progress: bool): 
         statement = select(UserModel).where(UserModel.id == user_id)
@@ -0,0 +1,41 @@
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from domain.commons.user import UserProfile
+from repository.sql.commons.repo_tag import TagSqlRepo
+from repository.sql.models.models import TagModel, UserModel, UserTagLink
+
+
+class CommonsAsyncSqlRepo:
+    """AsyncSession (asyncpg) implementation of the commons read queries, for the async endpoints."""
+
+    @staticmethod
+    async def get_user_id_by_username(db: AsyncSession, username: str) -> int | None:
+        statement = select(UserModel.id).where(UserModel.username == username)
+        return (await db.exec(statement)).first()
+
+    @staticmethod
+    async def get_user_profile_by_id(db: AsyncSession, id: int) -> UserProfile | None:
+        statement = select(UserModel.id, UserModel.username, UserModel.avatar_filename, UserModel.share_progress)\
+            .where(UserModel.id == id)
+        row = (await db.exec(statement)).first()
+        if row is None:
+            return None
+        return UserProfile(
+            id=row.id,
+            username=row.username,
+            avatar_filename=row.avatar_filename,
+            share_progress=row.share_progress
+        )
+
+
+class TagAsyncSqlRepo:
+    """AsyncSession (asyncpg) implementation of the TagSqlRepo reads."""
+
+    @staticmethod
+    async def get_all_tags(db: AsyncSession) -> list[TagModel]:
+        return list((await db.exec(select(TagModel))).all())
+
+    @staticmethod
+    async def get_user_tags(db: AsyncSession, user_id: int) -> list[tuple[UserTagLink, TagModel]]:
+        return [(link, tag) for link, tag in (await db.exec(TagSqlRepo.user_tags_statement(user_id))).all()]
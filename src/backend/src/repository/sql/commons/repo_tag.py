@@ -0,0 +1,200 @@
+from sqlmodel import Session, select, func, or_
+from sqlalchemy.dialects.postgresql import insert
+
+from cache import TTLCache
+from repository.sql.models import database
+from repository.sql.models.models import TagModel, UserTagLink
+
+
+class TagCache:
+    """
+    Process-local, case insensitive, name <-> ID dictionary of the tags table.
+    Tags are almost static, so lookups only reach the database on a miss.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float) -> None:
+        self.ids_by_name: TTLCache[str, int] = TTLCache(max_size, ttl_seconds)
+        self.names_by_id: TTLCache[int, str] = TTLCache(max_size, ttl_seconds)
+
+    @staticmethod
+    def normalize(name: str) -> str:
+        return str(name).strip().lower()
+
+    def get_id(self, name: str) -> int | None:
+        return self.ids_by_name.get(TagCache.normalize(name))
+
+    def get_name(self, tag_id: int) -> str | None:
+        return self.names_by_id.get(tag_id)
+
+    def add(self, tag_id: int, name: str):
+        self.ids_by_name.set(TagCache.normalize(name), tag_id)
+        self.names_by_id.set(tag_id, name)
+
+    def invalidate(self, tag_id: int | None = None, name: str | None = None):
+        if name is not None:
+            cached_id = self.ids_by_name.get(TagCache.normalize(name))
+            self.ids_by_name.invalidate(TagCache.normalize(name))
+            if cached_id is not None:
+                self.names_by_id.invalidate(cached_id)
+        if tag_id is not None:
+            cached_name = self.names_by_id.get(tag_id)
+            self.names_by_id.invalidate(tag_id)
+            if cached_name is not None:
+                self.ids_by_name.invalidate(TagCache.normalize(cached_name))
+
+    def clear(self):
+        self.ids_by_name.clear()
+        self.names_by_id.clear()
+
+
+tag_cache = TagCache(max_size=4096, ttl_seconds=600)
+
+
+def uncommitted_tag_ids(db: Session) -> set[int]:
+    """The tags created in the session's open transaction. They are only cached once it commits."""
+    return db.info.setdefault("uncommitted_tag_ids", set())
+
+
+class TagSqlRepo:
+
+    @staticmethod
+    def user_tags_statement(user_id: int):
+        """Selects the user's tag links, each with its tag."""
+        return select(UserTagLink, TagModel)\
+            .join(TagModel, UserTagLink.tag_id == TagModel.id)\
+            .where(UserTagLink.user_id == user_id)
+
+    @staticmethod
+    def get_all_tags(db: Session) -> list[TagModel]:
+        return list(db.exec(select(TagModel)).all())
+
+    @staticmethod
+    def get_user_tags(db: Session, user_id: int) -> list[tuple[UserTagLink, TagModel]]:
+        return [(link, tag) for link, tag in db.exec(TagSqlRepo.user_tags_statement(user_id)).all()]
+
+    @staticmethod
+    def get_tags_by_ids_or_names(db: Session, ids: set[int], names: set[str]) -> list[TagModel]:
+        """Fetches, in a single query, the tags with any of the IDs or (lowercase) names."""
+        if not ids and not names:
+            return []
+        statement = select(TagModel).where(
+            or_(TagModel.id.in_(ids), func.lower(TagModel.name).in_(names))
+        )
+        tags = list(db.exec(statement).all())
+        uncommitted = uncommitted_tag_ids(db)
+        for tag in tags:
+            if tag.id not in uncommitted:
+                tag_cache.add(tag.id, tag.name)
+        return tags
+
+    @staticmethod
+    def get_tag_by_name(db: Session, name: str) -> TagModel | None:
+        """
+        Finds a tag by name (case insensitive), going through the tag cache first.
+        The returned tag is not attached to the session.
+        """
+        tag_id = tag_cache.get_id(name)
+        if tag_id is not None:
+            return TagModel(id=tag_id, name=tag_cache.get_name(tag_id) or TagCache.normalize(name))
+
+        tags = TagSqlRepo.get_tags_by_ids_or_names(db, set(), {TagCache.normalize(name)})
+        if not tags:
+            return None
+        db.expunge(tags[0])
+        return tags[0]
+
+    @staticmethod
+    def create_tags(db: Session, names: list[str]) -> list[TagModel]:
+        """Creates the tags, in a single statement. Names created meanwhile by others are fetched instead."""
+        if not names:
+            return []
+        statement = (
+            insert(TagModel)
+            .values([{"name": name} for name in names])
+            .on_conflict_do_nothing(index_elements=[TagModel.name])
+            .returning(TagModel)
+        )
+        created: list[TagModel] = list(db.scalars(statement).all())
+        if created:
+            # Cached after the commit, so a rollback doesn't leave names mapped to IDs that don't exist
+            created_tags = [(tag.id, tag.name) for tag in created]
+            uncommitted = uncommitted_tag_ids(db)
+            uncommitted.update(tag_id for tag_id, _ in created_tags)
+
+            def cache_created_tags():
+                for tag_id, name in created_tags:
+                    uncommitted.discard(tag_id)
+                    tag_cache.add(tag_id, name)
+            database.after_commit(cache_created_tags)
+
+        created_names = {tag.name for tag in created}
+        missing = {name for name in names if name not in created_names}
+        if missing:
+            created += TagSqlRepo.get_tags_by_ids_or_names(db, set(), missing)
+        return created
+
+    @staticmethod
+    def link_tags_to_user(db: Session, user_id: int, tag_ids: list[int]):
+        """Creates the missing user <-> tag links, in a single statement."""
+        if not tag_ids:
+            return
+        statement = (
+            insert(UserTagLink)
+            .values([{"user_id": user_id, "tag_id": tag_id, "is_custom": False} for tag_id in tag_ids])
+            .on_conflict_do_nothing(index_elements=[UserTagLink.user_id, UserTagLink.tag_id])
+        )
+        db.execute(statement)
+
+    @staticmethod
+    def resolve_tag_ids_by_value(db: Session, user_id: int, tag_values: list[str]) -> dict[str, int]:
+        """
+        Resolves a list of tag IDs and/or names (case insensitive) into a map of each input value to its tag ID.
+        A digit-only value is an ID first, and a name only when no tag has that ID.
+        Known tags come from the tag cache, the others from a single query.
+        Unknown names are created, and every resolved tag is linked to the user.
+        """
+        # Tags read or created here, which may not be cached (yet)
+        found_ids: set[int] = set()
+        checked_ids: set[int] = set()
+        ids_by_name: dict[str, int] = {}
+
+        def lookup(value: str) -> int | None:
+            value = str(value).strip()
+            if value.isdigit():
+                tag_id = int(value)
+                if tag_id in found_ids or tag_cache.get_name(tag_id) is not None:
+                    return tag_id
+                if tag_id not in checked_ids:
+                    return None
+            name = TagCache.normalize(value)
+            return ids_by_name.get(name) or tag_cache.get_id(name)
+
+        unresolved = [value for value in tag_values if lookup(value) is None]
+        if unresolved:
+            ids = {int(value) for value in map(str.strip, map(str, unresolved)) if value.isdigit()}
+            names = {TagCache.normalize(value) for value in unresolved}
+            for tag in TagSqlRepo.get_tags_by_ids_or_names(db, ids, names):
+                found_ids.add(tag.id)
+                ids_by_name[TagCache.normalize(tag.name)] = tag.id
+            checked_ids.update(ids)
+
+        missing_names = list(dict.fromkeys(
+            TagCache.normalize(value) for value in tag_values if lookup(value) is None
+        ))
+        for tag in TagSqlRepo.create_tags(db, missing_names):
+            ids_by_name[TagCache.normalize(tag.name)] = tag.id
+
+        resolved: dict[str, int] = {}
+        for value in tag_values:
+            tag_id = lookup(value)
+            if tag_id is not None:
+                resolved[value] = tag_id
+
+        TagSqlRepo.link_tags_to_user(db, user_id, list(dict.fromkeys(resolved.values())))
+        return resolved
+
+    @staticmethod
+    def resolve_tag_ids(db: Session, user_id: int, tag_values: list[str]) -> list[int]:
+        """Same as resolve_tag_ids_by_value, returning the distinct tag IDs in input order."""
+        resolved = TagSqlRepo.resolve_tag_ids_by_value(db, user_id, tag_values)
+        return list(dict.fromkeys(resolved[value] for value in tag_values if value in resolved))
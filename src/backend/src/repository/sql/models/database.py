@@ -1,9 +1,15 @@
 import os
-from typing import Generator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import AsyncGenerator, Callable, Generator, Iterator, TypeVar
 from dotenv import load_dotenv
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 from sqlmodel import Session, create_engine, SQLModel, select
+from starlette.concurrency import run_in_threadpool
 import logging
 from repository.sql.models.models import TagModel, Badge, League
+from repository.sql.models.pool import InstrumentedAsyncQueuePool, InstrumentedQueuePool, async_pool_metrics, sync_pool_metrics
 
 load_dotenv()
 
@@ -15,9 +21,176 @@ DATABASE_URL = os.environ.get("SQLALCHEMY_DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("SQLALCHEMY_DATABASE_URL não está definida no ambiente.")
 
-engine = create_engine(DATABASE_URL, echo=False)
+def get_env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes")
 
-POSTGRES_MAX_INTEGER_VALUE = 2147483647
+# Connection pool, per process (and per engine)
+POOL_SIZE = int(os.environ.get("SQLALCHEMY_POOL_SIZE", "5"))
+POOL_MAX_OVERFLOW = int(os.environ.get("SQLALCHEMY_POOL_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT_SECONDS = float(os.environ.get("SQLALCHEMY_POOL_TIMEOUT_SECONDS", "30"))
+POOL_RECYCLE_SECONDS = int(os.environ.get("SQLALCHEMY_POOL_RECYCLE_SECONDS", "1800"))
+POOL_PRE_PING = get_env_bool("SQLALCHEMY_POOL_PRE_PING", True)
+# 0 disables it
+STATEMENT_TIMEOUT_MS = int(os.environ.get("SQLALCHEMY_STATEMENT_TIMEOUT_MS", "0"))
+
+def get_pool_settings() -> dict:
+    return {
+        "pool_size": POOL_SIZE,
+        "max_overflow": POOL_MAX_OVERFLOW,
+        "pool_timeout": POOL_TIMEOUT_SECONDS,
+        "pool_recycle": POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": POOL_PRE_PING,
+    }
+
+def get_connect_args(is_async: bool) -> dict:
+    """Driver specific connection settings, for the statement timeout."""
+    if STATEMENT_TIMEOUT_MS <= 0:
+        return {}
+    if is_async:
+        return {"server_settings": {"statement_timeout": str(STATEMENT_TIMEOUT_MS)}}
+    return {"options": f"-c statement_timeout={STATEMENT_TIMEOUT_MS}"}
+
+engine = create_engine(
+    DATABASE_URL,
+    echo=False,
+    poolclass=InstrumentedQueuePool,
+    connect_args=get_connect_args(is_async=False),
+    **get_pool_settings()
+)
+
+# The I/O bound read endpoints use an asyncpg engine, instead of the threadpool, when enabled
+ASYNC_DATABASE_ENABLED = get_env_bool("SQLALCHEMY_ASYNC_ENABLED", False)
+
+def get_async_database_url(url: str) -> str:
+    """Same database, through the asyncpg driver."""
+    return make_url(url).set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+
+ASYNC_DATABASE_URL = os.environ.get("SQLALCHEMY_ASYNC_DATABASE_URL") or get_async_database_url(DATABASE_URL)
+
+# Only created when first used, so asyncpg is only required with SQLALCHEMY_ASYNC_ENABLED
+async_engine: AsyncEngine | None = None
+
+T = TypeVar("T")
+
+
+class RequestSessionScope:
+    """
+    The sync session of a single request, only opened when first needed,
+    so the routers and the repositories share one session, and one connection.
+    """
+
+    def __init__(self) -> None:
+        self.session: Session | None = None
+        # Set by get_unit_of_work: commits are deferred to the end of the request
+        self.unit_of_work = False
+        self.after_commit_callbacks: list[Callable[[], None]] = []
+
+    def get_session(self) -> Session:
+        if self.session is None:
+            self.session = Session(engine)
+        return self.session
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+
+# Set by RequestSessionMiddleware. Copied into the threadpool, along with the rest of the context
+request_session_scope: ContextVar[RequestSessionScope | None] = ContextVar("request_session_scope", default=None)
+
+@contextmanager
+def session_scope() -> Iterator[Session]:
+    """
+    The session of the current request or, outside of one, a new session closed on exit.
+    On error, the request session is rolled back, as closing a new session would.
+    """
+    scope = request_session_scope.get()
+    if scope is None:
+        with Session(engine) as session:
+            yield session
+        return
+
+    session = scope.get_session()
+    try:
+        yield session
+    except BaseException:
+        session.rollback()
+        raise
+
+def commit(session: Session):
+    """
+    Commits the repository's changes. Inside a unit of work, they are only flushed,
+    and committed all at once, with the rest of the request.
+    """
+    scope = request_session_scope.get()
+    if scope is not None and scope.unit_of_work and scope.session is session:
+        session.flush()
+    else:
+        session.commit()
+
+def after_commit(callback: Callable[[], None]):
+    """
+    Calls `callback` once the writes made so far are committed: at the end of the unit of work, or right away.
+    Meant for cache invalidations, so other requests can't cache the state from before the commit.
+    """
+    scope = request_session_scope.get()
+    if scope is not None and scope.unit_of_work:
+        scope.after_commit_callbacks.append(callback)
+    else:
+        callback()
+
+
+class UnitOfWork:
+    """All the writes of a request, in the single transaction of its session."""
+
+    def __init__(self, scope: RequestSessionScope) -> None:
+        self.scope = scope
+
+    @property
+    def session(self) -> Session:
+        return self.scope.get_session()
+
+    def commit(self):
+        if self.scope.session is not None:
+            self.scope.session.commit()
+        callbacks, self.scope.after_commit_callbacks = self.scope.after_commit_callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def rollback(self):
+        self.scope.after_commit_callbacks = []
+        if self.scope.session is not None:
+            self.scope.session.rollback()
+
+async def get_unit_of_work() -> AsyncGenerator[UnitOfWork, None]:
+    """
+    Dependency that turns the request into a unit of work: the repositories' commits (see commit) only flush,
+    and the request is committed once the route returns, or rolled back if it raises.
+    Usada com `FastAPI.Depends`, normalmente ao nível do router.
+    Async, so it doesn't cost async routes a thread. The commit only goes to the threadpool if a session was opened.
+    """
+    scope = request_session_scope.get()
+    if scope is None:
+        raise RuntimeError("The unit of work requires the RequestSessionMiddleware")
+
+    scope.unit_of_work = True
+    unit_of_work = UnitOfWork(scope)
+    try:
+        yield unit_of_work
+    except BaseException:
+        if scope.session is not None:
+            await run_in_threadpool(unit_of_work.rollback)
+        raise
+    else:
+        if scope.session is not None:
+            await run_in_threadpool(unit_of_work.commit)
+        else:
+            unit_of_work.commit()
+    finally:
+        scope.unit_of_work = False
 
 def create_db_and_tables():
     """Cria as tabelas na bd com base nos metadados do SQLModel."""
@@ -31,11 +204,43 @@ def get_engine():
 def get_session() -> Generator[Session, None, None]:
     """
     Dependency para fornecer uma sessão de banco de dados síncrona.
-    Usada com `FastAPI.Depends`.
+    Usada com `FastAPI.Depends`. Dentro de um pedido, é a sessão do pedido.
     """
-    with Session(engine) as session:
+    with session_scope() as session:
         yield session
 
+def get_async_engine() -> AsyncEngine:
+    """Retorna a instância do engine assíncrono (asyncpg) da bd."""
+    global async_engine
+    if async_engine is None:
+        async_engine = create_async_engine(
+            ASYNC_DATABASE_URL,
+            echo=False,
+            poolclass=InstrumentedAsyncQueuePool,
+            connect_args=get_connect_args(is_async=True),
+            **get_pool_settings()
+        )
+    return async_engine
+
+async def dispose_async_engine():
+    """Closes the connections of the async engine, if it was created. Called on shutdown."""
+    global async_engine
+    if async_engine is not None:
+        await async_engine.dispose()
+        async_engine = None
+
+def run_in_session(function: Callable[..., T], *args) -> T:
+    """Calls `function(session, *args)` with the sync session of the request. Meant to be sent to the threadpool."""
+    with session_scope() as session:
+        return function(session, *args)
+
+def get_pool_metrics() -> dict[str, dict[str, int | float]]:
+    """Checkout and wait metrics of the connection pools, in this process."""
+    metrics = {"sync": sync_pool_metrics.get_metrics(engine.pool)}
+    if async_engine is not None:
+        metrics["async"] = async_pool_metrics.get_metrics(async_engine.sync_engine.pool)
+    return metrics
+
 predefined_global_tag_names = ["fun", "work", "personal", "study"]
 
 def seed_global_tags(session: Session):
@@ -2,17 +2,26 @@ from datetime import date, timezone, datetime
 from typing import Optional, List # Importar List
 from uuid import UUID
 
-from sqlalchemy import ForeignKeyConstraint, UniqueConstraint
+from sqlalchemy import BigInteger, DateTime, ForeignKeyConstraint, Index, Sequence, UniqueConstraint
 from sqlmodel import Field, Relationship, SQLModel
 
 from sqlalchemy import Column as SAColumn
 from sqlalchemy.dialects.postgresql import JSON, ARRAY as pg_ARRAY 
 from sqlalchemy import String
 
+# IDs used to be generated at random, in [1, 2^31 - 1]. Sequences start past that range, so they never collide with them.
+ID_SEQUENCE_START = 2147483648
+
+user_id_seq = Sequence("user_id_seq", start=ID_SEQUENCE_START)
+st_event_id_seq = Sequence("st_event_id_seq", start=ID_SEQUENCE_START)
+st_task_id_seq = Sequence("st_task_id_seq", start=ID_SEQUENCE_START)
+batch_id_seq = Sequence("batch_id_seq", start=ID_SEQUENCE_START)
+st_grade_id_seq = Sequence("st_grade_id_seq", start=ID_SEQUENCE_START)
+
 class UserModel(SQLModel, table=True):
     __tablename__ = "user"
 
-    id: int = Field(primary_key=True)
+    id: int = Field(default=None, primary_key=True, sa_type=BigInteger, sa_column_args=[user_id_seq])
     username: str
     hashed_password: str
     avatar_filename: str | None
@@ -61,7 +70,7 @@ class TagModel(SQLModel, table=True):
 class UserTagLink(SQLModel, table=True):
     __tablename__ = "user_tag_link"
 
-    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    user_id: int = Field(foreign_key="user.id", primary_key=True, sa_type=BigInteger)
     tag_id: int = Field(foreign_key="tags.id", primary_key=True)
     is_custom: bool = Field(default=False, nullable=False)
     
@@ -72,8 +81,8 @@ class STEventTagModel(SQLModel, table=True):
     __tablename__ = "st_event_tag"
 
     tag_id: int = Field(foreign_key="tags.id", primary_key=True)
-    event_id: int = Field(primary_key=True)
-    user_id: int
+    event_id: int = Field(primary_key=True, sa_type=BigInteger)
+    user_id: int = Field(sa_type=BigInteger)
 
     event: "STEventModel" = Relationship(back_populates="tags_associations")
     tag_ref: TagModel = Relationship(back_populates="event_links")
@@ -91,8 +100,8 @@ class STTaskTagModel(SQLModel, table=True):
     __tablename__ = "st_task_tag"
 
     tag_id: int = Field(foreign_key="tags.id", primary_key=True)
-    task_id: int = Field(primary_key=True)
-    user_id: int
+    task_id: int = Field(primary_key=True, sa_type=BigInteger)
+    user_id: int = Field(sa_type=BigInteger)
 
     task: "STTaskModel" = Relationship(back_populates="tags_associations")
     tag_ref: TagModel = Relationship(back_populates="task_links")
@@ -109,7 +118,7 @@ class STTaskTagModel(SQLModel, table=True):
 class STEventModel(SQLModel, table=True):
     __tablename__ = "st_event"
 
-    id: int = Field(default=None, primary_key=True)
+    id: int = Field(default=None, primary_key=True, sa_type=BigInteger, sa_column_args=[st_event_id_seq])
     start_date: datetime
     end_date: datetime
     title: str
@@ -120,8 +129,17 @@ class STEventModel(SQLModel, table=True):
     
     tags_associations: List["STEventTagModel"] = Relationship(back_populates="event",sa_relationship_kwargs={"cascade": "all, delete-orphan"})
 
-    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    user_id: int = Field(foreign_key="user.id", primary_key=True, sa_type=BigInteger)
     user: UserModel = Relationship(back_populates="st_events")
+
+    # Task whose work slot this event is, if any
+    task_id: Optional[int] = Field(default=None, nullable=True, sa_type=BigInteger)
+
+    __table_args__ = (
+        # Calendar reads are always scoped by user and bounded by a start date window
+        Index("ix_st_event_user_id_start_date", "user_id", "start_date"),
+        Index("ix_st_event_user_id_task_id", "user_id", "task_id"),
+    )
     
     @property
     def tags(self) -> List[str]:
@@ -133,8 +151,8 @@ class STEventModel(SQLModel, table=True):
 class STTaskModel(SQLModel, table=True):
     __tablename__ = "st_task"
 
-    id: int = Field(primary_key=True, default=None)
-    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    id: int = Field(primary_key=True, default=None, sa_type=BigInteger, sa_column_args=[st_task_id_seq])
+    user_id: int = Field(foreign_key="user.id", primary_key=True, sa_type=BigInteger)
 
     title: str
     description: str
@@ -147,14 +165,16 @@ class STTaskModel(SQLModel, table=True):
 
     tags_associations: List["STTaskTagModel"] = Relationship(back_populates="task")
 
-    parent_task_id: Optional[int] = Field(default=None, nullable=True)
-    parent_user_id: Optional[int] = Field(default=None, nullable=True)
+    parent_task_id: Optional[int] = Field(default=None, nullable=True, sa_type=BigInteger)
+    parent_user_id: Optional[int] = Field(default=None, nullable=True, sa_type=BigInteger)
 
     __table_args__ = (
         ForeignKeyConstraint(
             ['parent_task_id', 'parent_user_id'],
             ['st_task.id', 'st_task.user_id']
         ),
+        # Task listings select the user's root tasks, filtered and ordered by deadline
+        Index("ix_st_task_user_id_parent_task_id_deadline", "user_id", "parent_task_id", "deadline"),
     )
 
     parent_task: Optional["STTaskModel"] = Relationship(
@@ -172,14 +192,14 @@ class DailyTagModel(SQLModel, table=True):
     date_: date = Field(primary_key=True, default=None)
     tag_id: int = Field(foreign_key="tags.id", primary_key=True)
 
-    user_id: int = Field(foreign_key="user.id")
+    user_id: int = Field(foreign_key="user.id", sa_type=BigInteger)
     user: UserModel = Relationship(back_populates="daily_tag")
     tag: TagModel = Relationship(back_populates="daily_tag_links")
 
 class BatchModel(SQLModel, table=True):
     __tablename__ = "batch"
-    id: int = Field(primary_key=True, default=None)
-    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    id: int = Field(primary_key=True, default=None, sa_type=BigInteger, sa_column_args=[batch_id_seq])
+    user_id: int = Field(foreign_key="user.id", primary_key=True, sa_type=BigInteger)
     start_date: datetime
     level: int
     user: UserModel = Relationship(back_populates="user_batches")
@@ -188,8 +208,8 @@ class BatchModel(SQLModel, table=True):
 class BatchDayModel(SQLModel, table=True):
     __tablename__ = "batch_day"
     id: int = Field(primary_key=True)
-    batch_id: int = Field(primary_key=True)
-    user_id: int = Field(primary_key=True)
+    batch_id: int = Field(primary_key=True, sa_type=BigInteger)
+    user_id: int = Field(primary_key=True, sa_type=BigInteger)
     notes: str
     batch: BatchModel = Relationship(back_populates="batch_days")
     challenges: list["ChallengeModel"] = Relationship(back_populates="batch_day")
@@ -204,8 +224,8 @@ class ChallengeModel(SQLModel, table=True):
     __tablename__ = "challenge"
     id: int = Field(primary_key=True)
     batch_day_id: int = Field(primary_key=True)
-    batch_id: int = Field(primary_key=True)
-    user_id: int = Field(primary_key=True)
+    batch_id: int = Field(primary_key=True, sa_type=BigInteger)
+    user_id: int = Field(primary_key=True, sa_type=BigInteger)
     completion_date: datetime | None
     batch_day: BatchDayModel = Relationship(back_populates="challenges")
     __table_args__ = (
@@ -218,14 +238,14 @@ class ChallengeModel(SQLModel, table=True):
 class STAppUseModel(SQLModel, table=True):
     __tablename__ = "st_app_use_model"
     id: int = Field(primary_key=True)
-    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    user_id: int = Field(foreign_key="user.id", primary_key=True, sa_type=BigInteger)
     user: UserModel = Relationship(back_populates="user_st_app_uses")
 
 class STWeekDayPlanningModel(SQLModel, table=True):
     __tablename__ = "st_week_day_planning"
     week_planning_day: int | None
     hour: int | None
-    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    user_id: int = Field(foreign_key="user.id", primary_key=True, sa_type=BigInteger)
     user: UserModel = Relationship(back_populates="st_planning_day")
 
 class STScheduleBlockNotAvailableModel(SQLModel, table=True):
@@ -233,14 +253,14 @@ class STScheduleBlockNotAvailableModel(SQLModel, table=True):
     week_day: int = Field(primary_key=True)
     start_hour: int = Field(primary_key=True)
     duration: int = Field(primary_key=True)
-    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    user_id: int = Field(foreign_key="user.id", primary_key=True, sa_type=BigInteger)
     user: UserModel = Relationship(back_populates="schedule_unavailable_blocks")
 
 class STArchiveModel(SQLModel, table=True):
     __tablename__ = "st_archive"
     name: str = Field(primary_key=True, default=None)
     files: list["STFileModel"] = Relationship(back_populates="archive")
-    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    user_id: int = Field(foreign_key="user.id", primary_key=True, sa_type=BigInteger)
     user: UserModel = Relationship(back_populates="st_archives")
 
 class STFileModel(SQLModel, table=True):
@@ -248,7 +268,7 @@ class STFileModel(SQLModel, table=True):
     name: str = Field(primary_key=True)
     text: str
     archive_name: str = Field(primary_key=True)
-    user_id: int = Field(primary_key=True)
+    user_id: int = Field(primary_key=True, sa_type=BigInteger)
     __table_args__ = (
         ForeignKeyConstraint(
             ['archive_name', 'user_id'],
@@ -261,16 +281,16 @@ class STCurricularUnitModel(SQLModel, table=True):
     __tablename__ = "st_curricular_unit"
     name: str = Field(primary_key=True, default=None)
     grades: list["STGradeModel"] = Relationship(back_populates="curricular_unit")
-    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    user_id: int = Field(foreign_key="user.id", primary_key=True, sa_type=BigInteger)
     user: UserModel = Relationship(back_populates="st_curricular_units")
 
 class STGradeModel(SQLModel, table=True):
     __tablename__ = "st_grade"
-    id: int = Field(primary_key=True)
+    id: int = Field(primary_key=True, default=None, sa_type=BigInteger, sa_column_args=[st_grade_id_seq])
     value: float
     weight: float
     curricular_unit_name: str = Field(primary_key=True)
-    user_id: int = Field(primary_key=True)
+    user_id: int = Field(primary_key=True, sa_type=BigInteger)
     __table_args__ = (
         ForeignKeyConstraint(
             ['curricular_unit_name', 'user_id'],
@@ -284,7 +304,7 @@ class DailyEnergyStatusModel(SQLModel, table=True):
     date_: date = Field(primary_key=True, default=None)
     time_of_day: str
     level: int
-    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    user_id: int = Field(foreign_key="user.id", primary_key=True, sa_type=BigInteger)
     user: UserModel = Relationship(back_populates="daily_energy_status")
 
 class WeekStudyTimeModel(SQLModel, table=True):
@@ -294,12 +314,31 @@ class WeekStudyTimeModel(SQLModel, table=True):
     total: int
     average_by_session: float
     n_of_sessions: int
-    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    user_id: int = Field(foreign_key="user.id", primary_key=True, sa_type=BigInteger)
     user: UserModel = Relationship(back_populates="week_study_time")
 
+class STWeekTagTimeModel(SQLModel, table=True):
+    """Minutes of the (non recurrent) events of each tag, by ISO week. Maintained by StudyTrackerSqlRepo, on each event change."""
+    __tablename__ = "st_week_tag_time"
+    user_id: int = Field(foreign_key="user.id", primary_key=True, sa_type=BigInteger)
+    year: int = Field(primary_key=True)
+    week: int = Field(primary_key=True)
+    tag_id: int = Field(foreign_key="tags.id", primary_key=True)
+    minutes: int = Field(default=0)
+
+class STCacheVersionModel(SQLModel, table=True):
+    """
+    Versions of the user's study tracker data, bumped by StudyTrackerSqlRepo in the transaction of each write to it.
+    The in process caches key their entries by them, so a write through any process invalidates every process' entries.
+    """
+    __tablename__ = "st_cache_version"
+    user_id: int = Field(foreign_key="user.id", primary_key=True, sa_type=BigInteger)
+    events_version: int = Field(default=0, sa_type=BigInteger)
+    unavailable_blocks_version: int = Field(default=0, sa_type=BigInteger)
+
 class UserBadge(SQLModel, table=True):
     __tablename__ = "user_badges"
-    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    user_id: int = Field(foreign_key="user.id", primary_key=True, sa_type=BigInteger)
     badge_id: int = Field(foreign_key="badges.id", primary_key=True)
     awarded_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     
@@ -359,7 +398,7 @@ class Badge(SQLModel, table=True):
 
 class UserMetric(SQLModel, table=True):
     __tablename__ = "user_metrics"
-    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    user_id: int = Field(foreign_key="user.id", primary_key=True, sa_type=BigInteger)
     
     login_streak: int = Field(default=0, nullable=False)
     last_login_at: Optional[datetime] = Field(default=None) 
@@ -370,6 +409,14 @@ class UserMetric(SQLModel, table=True):
     )
     
     study_sessions_completed: int = Field(default=0, nullable=False)
+    total_pomodoro_cycles: int = Field(default=0, nullable=False)
+    total_tasks_completed: int = Field(default=0, nullable=False)
+    total_notepad_entries: int = Field(default=0, nullable=False)
+    total_forum_questions: int = Field(default=0, nullable=False)
+    total_forum_answers: int = Field(default=0, nullable=False)
+    total_events_added: int = Field(default=0, nullable=False)
+    # Máximo de ferramentas usadas em simultâneo
+    simultaneous_tool_uses: int = Field(default=0, nullable=False)
     total_points: int = Field(default=0, nullable=False)
 
     user: UserModel = Relationship(back_populates="metrics")
@@ -377,7 +424,7 @@ class UserMetric(SQLModel, table=True):
 class UserLeague(SQLModel, table=True):
     __tablename__ = "user_leagues"
 
-    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    user_id: int = Field(foreign_key="user.id", primary_key=True, sa_type=BigInteger)
     league_id: int = Field(foreign_key="leagues.id", primary_key=True)
     joined_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     current_level_progress: Optional[int] = Field(default=0) #Para ligas com níveis
@@ -388,3 +435,24 @@ class UserLeague(SQLModel, table=True):
     __table_args__ = (
         UniqueConstraint('user_id', 'league_id', name='_user_league_uc'),
     )
+
+class GamificationOutboxModel(SQLModel, table=True):
+    """
+    Gamification events (e.g. a notepad entry), written in the transaction of the action that caused them,
+    and processed off the request, by the gamification worker. Deleted once processed.
+    """
+    __tablename__ = "gamification_outbox"
+
+    id: Optional[int] = Field(default=None, primary_key=True, sa_type=BigInteger)
+    user_id: int = Field(foreign_key="user.id", sa_type=BigInteger)
+    action: str = Field(nullable=False)
+    context: Optional[dict] = Field(default=None, sa_column=SAColumn(JSON, nullable=True))
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), sa_type=DateTime(timezone=True))
+    # Pushed forward on each failed attempt
+    available_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), sa_type=DateTime(timezone=True))
+    attempts: int = Field(default=0, nullable=False)
+
+    __table_args__ = (
+        Index("ix_gamification_outbox_available_at_id", "available_at", "id"),
+        Index("ix_gamification_outbox_user_id_id", "user_id", "id"),
+    )
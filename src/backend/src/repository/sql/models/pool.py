@@ -0,0 +1,82 @@
+import threading
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+
+
+class PoolMetrics:
+    """Checkout counters of a connection pool, in this process."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.waiting = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def start_wait(self) -> float:
+        with self._lock:
+            self.waiting += 1
+        return time.perf_counter()
+
+    def end_wait(self, started_at: float, checked_out: bool = True, timed_out: bool = False):
+        waited = time.perf_counter() - started_at
+        with self._lock:
+            self.waiting -= 1
+            if timed_out:
+                self.timeouts += 1
+            if checked_out:
+                self.checkouts += 1
+                self.total_wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def get_metrics(self, pool: Pool | None = None) -> dict[str, int | float]:
+        with self._lock:
+            metrics: dict[str, int | float] = {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "waiting": self.waiting,
+                "averageWaitMs": round(1000 * self.total_wait_seconds / self.checkouts, 3) if self.checkouts else 0.0,
+                "maxWaitMs": round(1000 * self.max_wait_seconds, 3),
+            }
+        if isinstance(pool, QueuePool):
+            metrics.update({
+                "size": pool.size(),
+                "checkedIn": pool.checkedin(),
+                "checkedOut": pool.checkedout(),
+                "overflow": pool.overflow(),
+            })
+        return metrics
+
+
+sync_pool_metrics = PoolMetrics()
+async_pool_metrics = PoolMetrics()
+
+
+class InstrumentedPoolMixin:
+    """Times how long each checkout waits for a connection, including the time spent opening a new one."""
+
+    metrics: PoolMetrics
+
+    def _do_get(self):
+        started_at = self.metrics.start_wait()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.end_wait(started_at, checked_out=False, timed_out=True)
+            raise
+        except BaseException:
+            self.metrics.end_wait(started_at, checked_out=False)
+            raise
+        self.metrics.end_wait(started_at)
+        return connection
+
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    metrics = sync_pool_metrics
+
+
+class InstrumentedAsyncQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    metrics = async_pool_metrics
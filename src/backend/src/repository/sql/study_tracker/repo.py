@@ -20,10 +20,6 @@ class StudyTrackerRepo(ABC):
     def delete_event(self, user_id: int, event_id: int):
         pass
     
-    @abstractmethod
-    def delete_events(self, user_id: int, title: str):
-        pass
-
     @abstractmethod
     def get_events(
         self, 
@@ -31,10 +27,31 @@ class StudyTrackerRepo(ABC):
         filter_today: bool, 
         recurrentEvents: bool, 
         study_events: bool, 
-        week_number: int | None
+        week_number: int | None,
+        year: int | None = None
     ) -> list[Event]:
         pass
 
+    @abstractmethod
+    def get_events_in_window(
+        self,
+        user_id: int,
+        start: datetime | None,
+        end: datetime | None,
+        tags: list[str] | None = None,
+        recurrent_only: bool = False,
+        include_recurring_series: bool = False
+    ) -> list[Event]:
+        pass
+
+    @abstractmethod
+    def get_events_version(self, user_id: int) -> int | None:
+        pass
+
+    @abstractmethod
+    def get_unavailable_blocks_version(self, user_id: int) -> int | None:
+        pass
+
     @abstractmethod
     def update_user_study_tracker_use_goals(self, user_id: int, use_goals: set[int]):
         pass
@@ -52,11 +69,23 @@ class StudyTrackerRepo(ABC):
         pass
     
     @abstractmethod
-    def get_tasks(self, user_id: int, order_by_deadline_and_priority: bool, filter_uncompleted_tasks: bool, filter_deadline_is_today: bool, year: int, week: int) -> list[Task]:
+    def get_tasks(self, user_id: int, order_by_deadline_and_priority: bool, filter_uncompleted_tasks: bool, filter_deadline_is_today: bool, year: int | None, week: int | None, limit: int | None = None, after_task_id: int | None = None) -> list[Task]:
+        pass
+
+    @abstractmethod
+    def create_task(self, user_id: int, task: Task, task_id: int | None, work_events: list[Event] | None = None) -> Task:
+        pass
+
+    @abstractmethod
+    def update_task(self, user_id: int, task_id: int, task: Task, work_events: list[Event], previous_task_name: str | None):
+        pass
+
+    @abstractmethod
+    def create_task_work_events(self, user_id: int, task_id: int, work_events: list[Event]) -> list[Event]:
         pass
 
     @abstractmethod
-    def create_task(self, user_id: int, task: Task, task_id: int | None) -> int:
+    def get_task(self, user_id: int, task_id: int) -> Task:
         pass
 
     @abstractmethod
@@ -104,7 +133,7 @@ class StudyTrackerRepo(ABC):
         pass
     
     @abstractmethod
-    def get_total_time_study_per_week(self, user_id: int) -> list[WeekTimeStudy]:
+    def get_total_time_study_per_week(self, user_id: int, target_tag: str | None = None) -> list[WeekTimeStudy]:
         pass
     
     @abstractmethod
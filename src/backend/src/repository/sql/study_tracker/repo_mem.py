@@ -1,3 +1,4 @@
+from datetime import datetime
 from domain.study_tracker import Archive, CurricularUnit, Event, Grade, Task, UnavailableScheduleBlock
 from repository.sql.study_tracker.repo import StudyTrackerRepo
 
@@ -14,6 +15,9 @@ class StudyTrackerMemRepo(StudyTrackerRepo):
 
     def get_events(self, user_id: int, filter_today: bool) -> list[Event]:
         pass
+
+    def get_events_in_window(self, user_id: int, start: datetime | None, end: datetime | None, tags: list[str] | None = None, recurrent_only: bool = False, include_recurring_series: bool = False) -> list[Event]:
+        pass
     
     def create_not_available_schedule_block(self, user_id: int, info: UnavailableScheduleBlock):
         pass
@@ -24,7 +28,16 @@ class StudyTrackerMemRepo(StudyTrackerRepo):
     def get_tasks(self, user_id: int, order_by_deadline_and_priority: bool) -> list[Task]:
         pass
 
-    def create_task(self, user_id: int, data: Task) -> int:
+    def create_task(self, user_id: int, data: Task) -> Task:
+        pass
+
+    def update_task(self, user_id: int, task_id: int, task: Task, work_events: list[Event], previous_task_name: str | None):
+        pass
+
+    def create_task_work_events(self, user_id: int, task_id: int, work_events: list[Event]) -> list[Event]:
+        pass
+
+    def get_task(self, user_id: int, task_id: int) -> Task:
         pass
 
     def update_task_status(self, user_id: int, task_id: int, new_status: str):
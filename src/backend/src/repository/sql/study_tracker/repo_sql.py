@@ -1,26 +1,30 @@
-import random
-from sqlmodel import Session, select, or_
+from sqlmodel import Integer, Session, and_, case, cast, delete, extract, func, literal, select, or_, true, tuple_
 from domain.study_tracker import Archive, CurricularUnit, DailyEnergyStatus, Event, Grade, Priority, Task, UnavailableScheduleBlock, WeekAndYear, WeekTimeStudy
 from exception import NotFoundException
 from repository.sql.commons.repo_sql import CommonsSqlRepo
+from repository.sql.commons.repo_tag import TagCache, TagSqlRepo, tag_cache
 from repository.sql.models import database
-from repository.sql.models.models import DailyEnergyStatusModel, DailyTagModel, STAppUseModel, STArchiveModel, STCurricularUnitModel, STFileModel, STGradeModel, STScheduleBlockNotAvailableModel, STEventModel, STEventTagModel, STTaskModel, STTaskTagModel, STWeekDayPlanningModel, TagModel, UserModel, UserTagLink, WeekStudyTimeModel
+from repository.sql.models.models import DailyEnergyStatusModel, DailyTagModel, STAppUseModel, STArchiveModel, STCacheVersionModel, STCurricularUnitModel, STFileModel, STGradeModel, STScheduleBlockNotAvailableModel, STEventModel, STEventTagModel, STTaskModel, STTaskTagModel, STWeekDayPlanningModel, STWeekTagTimeModel, TagModel, UserModel, WeekStudyTimeModel, st_task_id_seq
+from collections import deque
 from datetime import datetime
 from repository.sql.study_tracker.repo import StudyTrackerRepo
+from sqlalchemy import ColumnElement, Select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import selectinload
-from utils import get_datetime_utc
+from utils import get_day_window, get_iso_week_window
 from datetime import date
 from domain.study_tracker import (
     Event, DateInterval, Task, UnavailableScheduleBlock, Archive,
     CurricularUnit, Grade, DailyEnergyStatus, WeekTimeStudy, WeekAndYear, SlotToWork
 )
-from service.gamification import core as gamification_service
 
-engine = database.get_engine()
+def uncommitted_cache_versions(session: Session) -> set[tuple[int, str]]:
+    """The (user, version) pairs bumped in the session's open transaction. Reads of them can't be cached until it commits."""
+    return session.info.setdefault("uncommitted_cache_versions", set())
 
 class StudyTrackerSqlRepo(StudyTrackerRepo):    
     def update_user_study_tracker_use_goals(self, user_id: int, use_goals: set[int]):
-        with Session(engine) as session:
+        with database.session_scope() as session:
             user_model: UserModel = CommonsSqlRepo.get_user_or_raise(session,user_id)
             new_user_study_tracker_app_uses: list[STAppUseModel] = []
             for use_goal in use_goals:
@@ -33,11 +37,11 @@ class StudyTrackerSqlRepo(StudyTrackerRepo):
                 )
             user_model.user_st_app_uses = new_user_study_tracker_app_uses
             session.add(user_model)
-            session.commit()
+            database.commit(session)
             session.refresh(user_model)
 
     def update_study_tracker_app_planning_day(self, user_id: int, day: int, hour: int):
-        with Session(engine) as session:
+        with database.session_scope() as session:
             user_model: UserModel = CommonsSqlRepo.get_user_or_raise(session,user_id)
             user_model.st_planning_day = STWeekDayPlanningModel(
                 week_planning_day=day,
@@ -46,83 +50,105 @@ class StudyTrackerSqlRepo(StudyTrackerRepo):
                 user=user_model
             )
             session.add(user_model)
-            session.commit()
+            database.commit(session)
             session.refresh(user_model)
 
-    def create_event(self, user_id: int, event: Event):
-        with Session(engine) as session:
-            user_model: UserModel = CommonsSqlRepo.get_user_or_raise(session,user_id)
+    @staticmethod
+    def add_event(session: Session, user_id: int, event: Event) -> STEventModel:
+        """Adds the event, and its tags, to the session. The ID is taken from st_event_id_seq, on flush."""
+        new_event_model = STEventModel(
+            title=event.title,
+            start_date=event.date.start_date,
+            end_date=event.date.end_date,
+            user_id=user_id,
+            every_week=event.every_week,
+            every_day=event.every_day,
+            notes=event.notes,
+            color=event.color,
+            task_id=event.task_id
+        )
 
-            # Generates a random ID, that is not yet taken
-            random_generated_id: int = 0
-            while True:
-                random_generated_id: int = random.randint(1, database.POSTGRES_MAX_INTEGER_VALUE)
-                statement = select(STEventModel).where(STEventModel.id == random_generated_id)
-                result = session.exec(statement)
-                if result.first() is None:
-                    break
-            new_event_model = STEventModel(
-                id=random_generated_id, #automatic ID is not working
-                title=event.title,
-                start_date=event.date.start_date,
-                end_date=event.date.end_date,
+        session.add(new_event_model)
+        session.flush()
+
+        for tag_id in TagSqlRepo.resolve_tag_ids(session, user_id, event.tags):
+            session.add(STEventTagModel(
                 user_id=user_id,
-                user=user_model,
-                every_week=event.every_week,
-                every_day=event.every_day,
-                notes=event.notes,
-                color=event.color
-            )
+                tag_id=tag_id,
+                event_id=new_event_model.id
+            ))
+        return new_event_model
 
-            session.add(new_event_model)
-            session.flush()
-            
-            for tag_input_value in event.tags:
-                tag_model = None
-                    
-                try:
-                    tag_id_from_input = int(tag_input_value)
-                    tag_model = self.get_tag_by_id(session, tag_id_from_input)
-                    if tag_model is None:
-                        tag_model = self.get_tag_by_name(session, str(tag_input_value).lower())
-
-                except ValueError:
-                    tag_model = self.get_tag_by_name(session, str(tag_input_value).lower())
-
-                if tag_model is None:
-                    new_tag_name = str(tag_input_value).lower()
-                    new_tag_model = self.create_tag(session, new_tag_name)
-                    tag_model = new_tag_model
-                    
-                #Cria a associação
-                if tag_model:
-                    association = STEventTagModel(
-                        user_id=user_id,
-                        tag_id=tag_model.id,
-                        event_id=new_event_model.id
-                    )
-                    session.add(association)
-                    
-                    #UserTagLink já existe para este user e esta tag?
-                    existing_user_tag_link = session.exec(
-                        select(UserTagLink).where(
-                            UserTagLink.user_id == user_id,
-                            UserTagLink.tag_id == tag_model.id
-                        )
-                    ).first()
-                    
-                    #Se o link não existe, cria
-                    if not existing_user_tag_link:
-                        new_user_tag_link = UserTagLink(user_id=user_id, tag_id=tag_model.id)
-                        session.add(new_user_tag_link)
+    @staticmethod
+    def add_week_tag_time(session: Session, user_id: int, is_event: ColumnElement[bool], sign: int = 1):
+        """
+        Adds the minutes of the non recurrent events matched by `is_event` to st_week_tag_time, by ISO week and tag,
+        in a single upsert. With a sign of -1 they are removed, before the events are updated or deleted.
+        Recurrent events are expanded when read, occurrence by occurrence.
+        """
+        session.flush()
+        minutes = sign * func.sum(func.trunc(extract("epoch", STEventModel.end_date - STEventModel.start_date) / 60))
+        year = cast(extract("isoyear", STEventModel.start_date), Integer)
+        week = cast(extract("week", STEventModel.start_date), Integer)
+        event_minutes = select(STEventModel.user_id, year, week, STEventTagModel.tag_id, cast(minutes, Integer))\
+            .join(STEventTagModel, and_(STEventTagModel.event_id == STEventModel.id, STEventTagModel.user_id == STEventModel.user_id))\
+            .where(STEventModel.user_id == user_id)\
+            .where(STEventModel.every_week == False, STEventModel.every_day == False)\
+            .where(is_event)\
+            .group_by(STEventModel.user_id, year, week, STEventTagModel.tag_id)
+
+        statement = insert(STWeekTagTimeModel).from_select(
+            ["user_id", "year", "week", "tag_id", "minutes"], event_minutes
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[STWeekTagTimeModel.user_id, STWeekTagTimeModel.year, STWeekTagTimeModel.week, STWeekTagTimeModel.tag_id],
+            set_={"minutes": STWeekTagTimeModel.minutes + statement.excluded.minutes}
+        )
+        session.execute(statement)
+
+    @staticmethod
+    def bump_cache_version(session: Session, user_id: int, version: str):
+        """
+        Bumps one of the user's st_cache_version versions, in the transaction of the write it stands for,
+        so the entries cached under the previous version stop being used, in every process, once it commits.
+        """
+        column = STCacheVersionModel.__table__.c[version]
+        statement = insert(STCacheVersionModel).values(user_id=user_id, **{version: 1})
+        session.execute(statement.on_conflict_do_update(index_elements=[STCacheVersionModel.user_id], set_={version: column + 1}))
+
+        uncommitted = uncommitted_cache_versions(session)
+        uncommitted.add((user_id, version))
+        database.after_commit(lambda: uncommitted.discard((user_id, version)))
+
+    @staticmethod
+    def get_cache_version(user_id: int, version: str) -> int | None:
+        """The user's version, or None when this transaction bumped it, so what it reads must not be cached."""
+        with database.session_scope() as session:
+            if (user_id, version) in uncommitted_cache_versions(session):
+                return None
+            column = STCacheVersionModel.__table__.c[version]
+            return session.scalar(select(column).where(STCacheVersionModel.user_id == user_id)) or 0
+
+    def get_events_version(self, user_id: int) -> int | None:
+        return StudyTrackerSqlRepo.get_cache_version(user_id, "events_version")
+
+    def get_unavailable_blocks_version(self, user_id: int) -> int | None:
+        return StudyTrackerSqlRepo.get_cache_version(user_id, "unavailable_blocks_version")
+
+    def create_event(self, user_id: int, event: Event):
+        with database.session_scope() as session:
+            CommonsSqlRepo.get_user_or_raise(session,user_id)
+            new_event_model = StudyTrackerSqlRepo.add_event(session, user_id, event)
+            StudyTrackerSqlRepo.add_week_tag_time(session, user_id, STEventModel.id == new_event_model.id)
+            StudyTrackerSqlRepo.bump_cache_version(session, user_id, "events_version")
 
-            session.commit()
+            database.commit(session)
             session.refresh(new_event_model)
             
         return new_event_model
                 
     def update_event(self, user_id: int, event_id: int, event: Event):
-            with Session(engine) as session:            
+            with database.session_scope() as session:            
                 statement = select(STEventModel)\
                     .where(STEventModel.user_id == user_id)\
                     .where(STEventModel.id == event_id)
@@ -131,34 +157,29 @@ class StudyTrackerSqlRepo(StudyTrackerRepo):
                 event_model = result.first()
                 if event_model == None:
                     raise NotFoundException(user_id)
+                StudyTrackerSqlRepo.add_week_tag_time(session, user_id, STEventModel.id == event_id, -1)
                 event_model.title = event.title
                 event_model.start_date = event.date.start_date
                 event_model.end_date = event.date.end_date
                 event_model.every_week = event.every_week
                 event_model.every_day = event.every_day
                 event_model.notes = event.notes
-                session.add(event_model)
-                session.commit()
-                session.refresh(event_model)
-                # First, delete all existent tags  
-                for tag in event_model.tags:
-                    session.delete(tag)
-                session.commit()
-                # Now, add new ones
-                tags_model: list[STEventTagModel] = []
-                for tag in event.tags:
-                    tags_model.append(STEventTagModel(
+                # First, delete all existent tags (delete-orphan), then add the new ones
+                event_model.tags_associations.clear()
+                session.flush()
+                for tag_id in TagSqlRepo.resolve_tag_ids(session, user_id, event.tags):
+                    event_model.tags_associations.append(STEventTagModel(
                         user_id=user_id,
-                        tag=tag,
-                        event_id=event_model.id,
-                        event=event_model
+                        tag_id=tag_id,
+                        event_id=event_model.id
                     ))
-                for tag_model in tags_model:
-                    session.add(tag_model)
-                    session.commit()
+                session.add(event_model)
+                StudyTrackerSqlRepo.add_week_tag_time(session, user_id, STEventModel.id == event_id)
+                StudyTrackerSqlRepo.bump_cache_version(session, user_id, "events_version")
+                database.commit(session)
 
     def delete_event(self, user_id: int, event_id: int):
-        with Session(engine) as session:
+        with database.session_scope() as session:
             statement = select(STEventModel)\
                 .where(STEventModel.user_id == user_id)\
                 .where(STEventModel.id == event_id) 
@@ -171,102 +192,144 @@ class StudyTrackerSqlRepo(StudyTrackerRepo):
             for tag in event_model.tags:
                 session.delete(tag) """ 
                 
+            StudyTrackerSqlRepo.add_week_tag_time(session, user_id, STEventModel.id == event_id, -1)
             session.delete(event_model)
-            session.commit()
+            StudyTrackerSqlRepo.bump_cache_version(session, user_id, "events_version")
+            database.commit(session)
         
-    # Delete events with certain title    
-    def delete_events(self, user_id: int, title: str):
-        with Session(engine) as session:
-            statement = select(STEventModel)\
-                .where(STEventModel.user_id == user_id)\
-                .where(STEventModel.title == title)  
-            print(title)  
-            result = session.exec(statement)            
-            events_models = result.all()
-            for event in events_models:
-                StudyTrackerSqlRepo.delete_event(self, user_id, event.id)
-    
-    def get_tag_by_name(self, session: Session, tag_name: str) -> TagModel | None:
-        """Busca uma tag pelo nome (CASE INSENSITIVE)."""
-        statement = select(TagModel).where(TagModel.name.ilike(tag_name))
-        return session.exec(statement).first()
-    
-    def get_tag_by_id(self, session: Session, tag_id: int) -> TagModel | None:
-        """Busca uma tag pelo ID."""
-        statement = select(TagModel).where(TagModel.id == tag_id)
-        return session.exec(statement).first()
-    
-    def create_tag(self, session: Session, tag_name: str) -> TagModel:
-        """Cria uma nova tag com o nome dado."""
-        new_tag = TagModel(name=tag_name)
-        session.add(new_tag)
-        session.flush()
-        session.refresh(new_tag)
-        return new_tag
-    
     @staticmethod
-    def is_today(date_1: datetime) -> bool:
-        today = datetime.today()
-        return date_1.year == today.year and date_1.month == today.month and date_1.day == today.day
+    def delete_task_events(session: Session, user_id: int, task_id: int, legacy_title: str | None):
+        """
+        Deletes the work slot events of the task.
+        Events created before they were linked to their task are matched by the task title instead.
+        """
+        is_task_event = STEventModel.task_id == task_id
+        if legacy_title is not None:
+            is_task_event = or_(is_task_event, and_(STEventModel.task_id == None, STEventModel.title == legacy_title))
+
+        StudyTrackerSqlRepo.add_week_tag_time(session, user_id, is_task_event, -1)
+        event_ids = select(STEventModel.id)\
+            .where(STEventModel.user_id == user_id)\
+            .where(is_task_event)
+        session.execute(
+            delete(STEventTagModel)
+                .where(STEventTagModel.user_id == user_id)
+                .where(STEventTagModel.event_id.in_(event_ids))
+        )
+        session.execute(
+            delete(STEventModel)
+                .where(STEventModel.user_id == user_id)
+                .where(is_task_event)
+        )
     
     @staticmethod
-    def is_study_event(event: STEventModel) -> bool:
-        for tag_name in event.tags:
-            if tag_name.lower() == "study":
-                return True
-        return False
-    
+    def events_window_statement(
+        user_id: int,
+        start: datetime | None,
+        end: datetime | None,
+        tags: list[str] | None,
+        recurrent_only: bool,
+        include_recurring_series: bool = False
+    ):
+        statement = (
+            select(STEventModel)
+            .where(STEventModel.user_id == user_id)
+            .options(
+                selectinload(STEventModel.tags_associations).selectinload(STEventTagModel.tag_ref)
+            )
+            .order_by(STEventModel.start_date)
+        )
+
+        is_recurrent = or_(STEventModel.every_week == True, STEventModel.every_day == True)
+
+        # Events overlapping the window, including those which started before it (e.g. overnight).
+        # The (user_id, start_date) index still drives the query, through the start_date bound
+        in_window = []
+        if start is not None:
+            in_window.append(STEventModel.end_date > start)
+        if end is not None:
+            in_window.append(STEventModel.start_date < end)
+
+        if include_recurring_series and start is not None:
+            # A recurrent event which started before the window may still have occurrences inside it
+            started_before_end = STEventModel.start_date < end if end is not None else true()
+            statement = statement.where(or_(and_(*in_window), and_(is_recurrent, started_before_end)))
+        else:
+            statement = statement.where(*in_window)
+
+        if recurrent_only:
+            statement = statement.where(is_recurrent)
+
+        if tags:
+            tag_names = [tag.lower() for tag in tags]
+            has_tag = (
+                select(STEventTagModel.event_id)
+                .join(TagModel, TagModel.id == STEventTagModel.tag_id)
+                .where(STEventTagModel.user_id == STEventModel.user_id)
+                .where(STEventTagModel.event_id == STEventModel.id)
+                .where(func.lower(TagModel.name).in_(tag_names))
+                .exists()
+            )
+            statement = statement.where(has_tag)
+
+        return statement
+
+    def get_events_in_window(
+        self,
+        user_id: int,
+        start: datetime | None,
+        end: datetime | None,
+        tags: list[str] | None = None,
+        recurrent_only: bool = False,
+        include_recurring_series: bool = False
+    ) -> list[Event]:
+        with database.session_scope() as session:
+            statement = StudyTrackerSqlRepo.events_window_statement(
+                user_id, start, end, tags, recurrent_only, include_recurring_series
+            )
+            events: list[STEventModel] = list(session.exec(statement).all())
+            return Event.from_STEventModel(events)
+
     def get_events(
         self, 
         user_id: int, 
         filter_today: bool, 
         recurrentEvents: bool, 
         study_events: bool, 
-        week_number: int | None
+        week_number: int | None,
+        year: int | None = None
     ) -> list[Event]:
-        with Session(engine) as session:
-            statement = (
-                select(STEventModel)
-                .where(STEventModel.user_id == user_id)
-                .options(
-                    selectinload(STEventModel.tags_associations).selectinload(STEventTagModel.tag_ref)
-                )
-            )
-                
-            if recurrentEvents:
-                statement = statement.where(or_(STEventModel.every_week == True, STEventModel.every_day == True))
-            results = session.exec(statement)
-            events: list[STEventModel] = []
-            for event in results:
-                if (not filter_today or StudyTrackerSqlRepo.is_today(event.start_date)):
-                    #print('From DB: ', event.start_date.timestamp())
-                    events.append(event)    
-                               
-            if study_events:    
-                events_filtered: list[STEventModel] = []
-                for event in events:
-                    if StudyTrackerSqlRepo.is_study_event(event):
-                        events_filtered.append(event)                
-                events = events_filtered
-                
-            if week_number is not None:
-                events_filtered: list[STEventModel] = []
-                for event in events:
-                    if event.start_date.isocalendar().week is week_number:
-                        events_filtered.append(event)                
-                events = events_filtered
-            
+        start: datetime | None = None
+        end: datetime | None = None
+        if filter_today:
+            start, end = get_day_window(date.today())
+
+        if week_number is not None and year is not None:
+            week_start, week_end = get_iso_week_window(year, week_number)
+            start = week_start if start is None else max(start, week_start)
+            end = week_end if end is None else min(end, week_end)
+
+        tags = ["study"] if study_events else None
+
+        with database.session_scope() as session:
+            statement = StudyTrackerSqlRepo.events_window_statement(user_id, start, end, tags, recurrentEvents)
+
+            # Without a year, the week cannot be turned into a range. Still, filter it on the DB side
+            if week_number is not None and year is None:
+                statement = statement.where(func.extract("week", STEventModel.start_date) == week_number)
+
+            events: list[STEventModel] = list(session.exec(statement).all())
             return Event.from_STEventModel(events)
         
     def update_receive_notifications_pref(self, user_id: int, receive: bool):
-        with Session(engine) as session:
+        with database.session_scope() as session:
             user_model: UserModel = CommonsSqlRepo.get_user_or_raise(session,user_id)
             user_model.receive_st_app_notifications = receive            
             session.add(user_model)
-            session.commit()
+            database.commit(session)
 
     def create_not_available_schedule_block(self, user_id: int, info: UnavailableScheduleBlock):
-        with Session(engine) as session:
+        with database.session_scope() as session:
             user_model: UserModel = CommonsSqlRepo.get_user_or_raise(session,user_id)
             user_model.schedule_unavailable_blocks.append(STScheduleBlockNotAvailableModel(
                 week_day=info.week_day,
@@ -275,10 +338,11 @@ class StudyTrackerSqlRepo(StudyTrackerRepo):
                 user_id=user_id
             ))
             session.add(user_model)
-            session.commit()
+            StudyTrackerSqlRepo.bump_cache_version(session, user_id, "unavailable_blocks_version")
+            database.commit(session)
 
     def get_not_available_schedule_blocks(self, user_id: int) -> list[UnavailableScheduleBlock]:
-         with Session(engine) as session:
+         with database.session_scope() as session:
             statement = select(STScheduleBlockNotAvailableModel).where(STScheduleBlockNotAvailableModel.user_id == user_id)
             results = session.exec(statement)
         
@@ -292,26 +356,64 @@ class StudyTrackerSqlRepo(StudyTrackerRepo):
             return blocks
     
     @staticmethod
-    def build_task(task_model: STTaskModel) -> Task:
-        
-        subtasks: list[Task] = []
-        for sub_task_model in task_model.subtasks:
-            subtasks.append(StudyTrackerSqlRepo.build_task(sub_task_model))
-
-        tags: list[str] = []
-        for tag_model in task_model.tags:
-            tags.append(tag_model.tag)
-            
-        return Task(
-            id=task_model.id,
-            title=task_model.title,
-            description=task_model.description,
-            deadline=task_model.deadline,
-            priority=task_model.priority,
-            tags=tags,
-            status=task_model.status,
-            sub_tasks=subtasks
+    def task_order_keys(order_by_deadline_and_priority: bool) -> list:
+        """
+        Sort keys of the task listing, all ascending, so they can also be used as a keyset.
+        Higher priorities come first, then earlier deadlines (tasks without one last), then older tasks.
+        """
+        if not order_by_deadline_and_priority:
+            return [STTaskModel.id]
+        priority_rank = case(
+            {priority.name.lower(): priority.value for priority in Priority},
+            value=STTaskModel.priority,
+            else_=Priority.LOW.value
         )
+        return [-priority_rank, func.coalesce(STTaskModel.deadline, datetime.max), STTaskModel.id]
+
+    @staticmethod
+    def task_tree_statement(roots: Select) -> Select:
+        """
+        Selects the root tasks (a statement selecting their id, user_id and position) and all their descendants,
+        with a single recursive CTE, ordered by the position of their root.
+        Tags are eager loaded, so building the tree doesn't trigger lazy loads.
+        """
+        roots_subquery = roots.subquery("task_roots")
+        tree = select(roots_subquery.c.id, roots_subquery.c.user_id, roots_subquery.c.position)\
+            .cte("task_tree", recursive=True)
+        children = select(STTaskModel.id, STTaskModel.user_id, tree.c.position)\
+            .join(tree, and_(STTaskModel.parent_task_id == tree.c.id, STTaskModel.parent_user_id == tree.c.user_id))
+        tree = tree.union_all(children)
+
+        return select(STTaskModel)\
+            .join(tree, and_(STTaskModel.id == tree.c.id, STTaskModel.user_id == tree.c.user_id))\
+            .options(selectinload(STTaskModel.tags_associations).selectinload(STTaskTagModel.tag_ref))\
+            .order_by(tree.c.position, STTaskModel.id)
+
+    @staticmethod
+    def build_task_trees(task_models: list[STTaskModel]) -> list[Task]:
+        """Assembles the tasks into trees, in memory, by parent_task_id. Returns the root tasks, in the same order."""
+        tasks_by_id: dict[int, Task] = {}
+        for task_model in task_models:
+            tasks_by_id[task_model.id] = Task(
+                id=task_model.id,
+                title=task_model.title,
+                description=task_model.description,
+                deadline=task_model.deadline,
+                priority=task_model.priority,
+                tags=[association.tag_ref.name for association in task_model.tags_associations if association.tag_ref],
+                status=task_model.status,
+                sub_tasks=[]
+            )
+
+        roots: list[Task] = []
+        for task_model in task_models:
+            task = tasks_by_id[task_model.id]
+            parent = tasks_by_id.get(task_model.parent_task_id) if task_model.parent_task_id is not None else None
+            if parent is None:
+                roots.append(task)
+            else:
+                parent.sub_tasks.append(task)
+        return roots
     
     """
     @staticmethod
@@ -335,181 +437,324 @@ class StudyTrackerSqlRepo(StudyTrackerRepo):
         filter_uncompleted_tasks: bool, 
         filter_deadline_is_today: bool,
         year: int | None,
-        week: int | None
+        week: int | None,
+        limit: int | None = None,
+        after_task_id: int | None = None
     ) -> list[Task]:
+        """
+        Returns the user's task trees. Deadline filters drop the tasks whose deadline is outside the window.
+        Pages through the root tasks with `limit`, continuing after the root task `after_task_id` (keyset pagination).
+        """
+        order_keys = StudyTrackerSqlRepo.task_order_keys(order_by_deadline_and_priority)
+        roots = StudyTrackerSqlRepo.task_roots_statement(
+            user_id, order_keys, filter_uncompleted_tasks, filter_deadline_is_today, year, week
+        )
         
-        with Session(engine) as session:
-            statement = select(STTaskModel)\
-                .where(STTaskModel.user_id == user_id)\
-                .where(STTaskModel.parent_task_id == None)\
-                
-            if filter_uncompleted_tasks:
-                statement = statement\
-                    .where(STTaskModel.status == "completed")
+        with database.session_scope() as session:
+            if after_task_id is not None:
+                after_keys = session.exec(StudyTrackerSqlRepo.task_keys_statement(user_id, order_keys, after_task_id)).first()
+                if after_keys is None:
+                    raise NotFoundException(after_task_id)
+                roots = roots.where(tuple_(*order_keys) > tuple_(*after_keys))
 
-            result = session.exec(statement)
+            if limit is not None:
+                roots = roots.limit(limit)
+
+            result = session.exec(StudyTrackerSqlRepo.task_tree_statement(roots))
             
             task_models: list[STTaskModel] = list(result.all())
             
-            """
-            if filter_uncompleted_tasks:
-                for task_model in task_models:
-                    if not StudyTrackerSqlRepo.is_task_or_son_completed(task_model):
-                        task_models.remove(task_model)
-            """
-            
-            # Retrieve Tasks
-            tasks: list[Task] = []
-            for task_model in task_models:
-                tasks.append(StudyTrackerSqlRepo.build_task(task_model))
-            
-            tasks.sort(key=lambda task: task.id if task.id is not None else 0)
+            return StudyTrackerSqlRepo.build_task_trees(task_models)
+
+    @staticmethod
+    def task_roots_statement(
+        user_id: int,
+        order_keys: list,
+        filter_uncompleted_tasks: bool,
+        filter_deadline_is_today: bool,
+        year: int | None,
+        week: int | None
+    ) -> Select:
+        """Selects the id, user_id and position of the user's root tasks matching the filters, for task_tree_statement."""
+        start: datetime | None = None
+        end: datetime | None = None
+        if filter_deadline_is_today:
+            start, end = get_day_window(date.today())
+
+        if year is not None:
+            if week is not None:
+                window_start, window_end = get_iso_week_window(year, week)
+            else:
+                window_start, window_end = datetime(year, 1, 1), datetime(year + 1, 1, 1)
+            start = window_start if start is None else max(start, window_start)
+            end = window_end if end is None else min(end, window_end)
+
+        roots = select(STTaskModel.id, STTaskModel.user_id, func.row_number().over(order_by=order_keys).label("position"))\
+            .where(STTaskModel.user_id == user_id)\
+            .where(STTaskModel.parent_task_id == None)\
+            .order_by(*order_keys)
             
-            # TODO: do this using SQL Model!
-            # Right now, he is just sorting based on the task.deadline plus the priority string size
-            if order_by_deadline_and_priority:
-                tasks.sort(key=lambda task: task.deadline if task.deadline is not None else datetime.max)
-                tasks.sort(key=lambda task: Priority.from_str(task.priority).value, reverse=True)
-                
-            # Ideally, we would use another where statement. Yet, this was not working for me...
-            if filter_deadline_is_today:
-                for task in tasks:
-                    if task.deadline is not None and not StudyTrackerSqlRepo.is_today(task.deadline):
-                        tasks.remove(task)
-                        
-            if year:
-                for task in tasks:
-                    if task.deadline is not None and task.deadline.year != year:
-                        tasks.remove(task)
-                    
-            if week:
-                for task in tasks:
-                    if task.deadline is not None and task.deadline.isocalendar().week != week:
-                        tasks.remove(task)
-                        
-            return tasks
-        
+        if filter_uncompleted_tasks:
+            roots = roots\
+                .where(STTaskModel.status == "completed")
+
+        # Tasks without a deadline are kept by every deadline filter
+        if start is not None:
+            roots = roots.where(or_(STTaskModel.deadline.is_(None), STTaskModel.deadline >= start))
+        if end is not None:
+            roots = roots.where(or_(STTaskModel.deadline.is_(None), STTaskModel.deadline < end))
+
+        # Without a year, the week cannot be turned into a range. Still, filter it on the DB side
+        if week is not None and year is None:
+            roots = roots.where(or_(STTaskModel.deadline.is_(None), func.extract("week", STTaskModel.deadline) == week))
+
+        return roots
+
     @staticmethod
-    def create_task_with_parent(
-        task: Task, 
-        task_id: int | None,
-        user_id: int, 
-        user_model: UserModel, 
-        parent_task_id: int | None, 
-        session: Session
-    ) -> int:
+    def task_keys_statement(user_id: int, order_keys: list, task_id: int) -> Select:
+        """Selects the sort keys of a task, to continue the listing after it."""
+        return select(*order_keys)\
+            .where(STTaskModel.user_id == user_id)\
+            .where(STTaskModel.id == task_id)
+
+    @staticmethod
+    def task_root_statement(user_id: int, task_id: int) -> Select:
+        """Selects a single task as the root, for task_tree_statement."""
+        return select(STTaskModel.id, STTaskModel.user_id, literal(1).label("position"))\
+            .where(STTaskModel.user_id == user_id)\
+            .where(STTaskModel.id == task_id)
         
-        # Generates a random ID, that is not yet taken
+    @staticmethod
+    def reserve_task_ids(session: Session, count: int) -> list[int]:
+        """Takes `count` IDs from st_task_id_seq, in a single round-trip."""
+        if count <= 0:
+            return []
+        statement = select(st_task_id_seq.next_value()).select_from(func.generate_series(1, count))
+        return list(session.exec(statement).all())
+
+    @staticmethod
+    def flatten_task_tree(task: Task) -> list[tuple[Task, int | None]]:
+        """Lists the task and all its sub-tasks, breadth-first (parents always before their sub-tasks), with the index of their parent."""
+        tasks: list[tuple[Task, int | None]] = []
+        pending: deque[tuple[Task, int | None]] = deque([(task, None)])
+        while pending:
+            current, parent_index = pending.popleft()
+            tasks.append((current, parent_index))
+            pending.extend((sub_task, len(tasks) - 1) for sub_task in current.sub_tasks)
+        return tasks
+
+    @staticmethod
+    def task_tag_names(tags: list[str], tag_ids_by_value: dict[str, int]) -> dict[int, str]:
+        """Maps the distinct tag IDs of the task to their names, as they'd be read back (created tags are named after the normalized input)."""
+        tag_names: dict[int, str] = {}
+        for tag in tags:
+            if tag in tag_ids_by_value:
+                tag_id = tag_ids_by_value[tag]
+                tag_names.setdefault(tag_id, tag_cache.get_name(tag_id) or TagCache.normalize(tag))
+        return tag_names
+
+    @staticmethod
+    def create_task_tree(task: Task, task_id: int | None, user_id: int, session: Session) -> Task:
+        """
+        Adds the task, all its sub-tasks and their tags to the session, to be flushed at once.
+        IDs are reserved up front, so the whole tree is built in memory.
+        When task_id is None, the root ID is also taken from st_task_id_seq.
+        Returns the created task tree, as it would be read back.
+        """
+        tasks = StudyTrackerSqlRepo.flatten_task_tree(task)
+
         if task_id is None:
-            while True:
-                task_id = random.randint(1, database.POSTGRES_MAX_INTEGER_VALUE)
-                statement = select(STTaskModel).where(STTaskModel.id == task_id)
-                result = session.exec(statement)
-                if result.first() is None:
-                    break
-        
-        new_task_model = STTaskModel(
-            id=task_id, #automatic ID is not working
-            title=task.title,
-            description=task.description,
-            deadline=task.deadline,
-            priority=task.priority,
-            status=task.status,
-            user_id=user_id,
-            user=user_model,
-            tags=[],
-            subtasks=[],
-            parent_task_id=parent_task_id,
-            parent_user_id=user_id
+            task_ids = StudyTrackerSqlRepo.reserve_task_ids(session, len(tasks))
+        else:
+            task_ids = [task_id] + StudyTrackerSqlRepo.reserve_task_ids(session, len(tasks) - 1)
+
+        tag_ids_by_value = TagSqlRepo.resolve_tag_ids_by_value(
+            session, user_id, [tag for current, _ in tasks for tag in current.tags]
         )
-        session.add(new_task_model)
-        session.commit()
-        session.refresh(new_task_model)
-        
-        # Create associated tags
-        tags_model: list[STTaskTagModel] = []
-        for tag in task.tags:
-            tags_model.append(STTaskTagModel(
-                tag=tag,
-                task_id=new_task_model.id,
-                task=new_task_model,
-                user_id=user_id
+
+        task_models: list[STTaskModel] = []
+        tag_models: list[STTaskTagModel] = []
+        created_tasks: list[Task] = []
+        for index, (current, parent_index) in enumerate(tasks):
+            task_models.append(STTaskModel(
+                id=task_ids[index],
+                title=current.title,
+                description=current.description,
+                deadline=current.deadline,
+                priority=current.priority,
+                status=current.status,
+                user_id=user_id,
+                parent_task_id=task_ids[parent_index] if parent_index is not None else None,
+                parent_user_id=user_id if parent_index is not None else None
             ))
 
-        for tag_model in tags_model:
-            session.add(tag_model)
-            session.commit()
-            
-        # Create associated sub-tags
-        for sub_task in task.sub_tasks:
-            StudyTrackerSqlRepo.create_task_with_parent(
-                sub_task, 
-                None,
-                user_id, 
-                user_model, 
-                parent_task_id=new_task_model.id, 
-                session=session
+            tag_names = StudyTrackerSqlRepo.task_tag_names(current.tags, tag_ids_by_value)
+            tag_models.extend(
+                STTaskTagModel(tag_id=tag_id, task_id=task_ids[index], user_id=user_id)
+                for tag_id in tag_names
             )
-            
-        return new_task_model.id
 
-    def create_task(self, user_id: int, task: Task, task_id: int | None) -> int:
-        with Session(engine) as session:
-            user_model: UserModel = CommonsSqlRepo.get_user_or_raise(session,user_id)
-            
-            # Create parent Task
-            return StudyTrackerSqlRepo.create_task_with_parent(task, task_id, user_id, user_model, parent_task_id=None, session=session)
+            created_tasks.append(Task(
+                id=task_ids[index],
+                title=current.title,
+                description=current.description,
+                deadline=current.deadline,
+                priority=current.priority,
+                tags=list(tag_names.values()),
+                status=current.status,
+                sub_tasks=[]
+            ))
+            if parent_index is not None:
+                created_tasks[parent_index].sub_tasks.append(created_tasks[index])
+
+        session.add_all(task_models)
+        session.add_all(tag_models)
+
+        return created_tasks[0]
+
+    def create_task(self, user_id: int, task: Task, task_id: int | None, work_events: list[Event] | None = None) -> Task:
+        """Creates the task tree and its work slot events, in a single transaction."""
+        work_events = work_events or []
+        with database.session_scope() as session:
+            CommonsSqlRepo.get_user_or_raise(session, user_id)
+            created_task = StudyTrackerSqlRepo.create_task_tree(task, task_id, user_id, session)
+
+            for event in work_events:
+                event.task_id = created_task.id
+                StudyTrackerSqlRepo.add_event(session, user_id, event)
+            if work_events:
+                StudyTrackerSqlRepo.add_week_tag_time(session, user_id, STEventModel.task_id == created_task.id)
+                StudyTrackerSqlRepo.bump_cache_version(session, user_id, "events_version")
+
+            database.commit(session)
+            return created_task
+
+    def create_task_work_events(self, user_id: int, task_id: int, work_events: list[Event]) -> list[Event]:
+        """Adds work slot events to an existing task, in a single transaction. Returns them with their IDs."""
+        with database.session_scope() as session:
+            for event in work_events:
+                event.task_id = task_id
+                event.id = StudyTrackerSqlRepo.add_event(session, user_id, event).id
+            event_ids = [event.id for event in work_events]
+            StudyTrackerSqlRepo.add_week_tag_time(session, user_id, STEventModel.id.in_(event_ids))
+            StudyTrackerSqlRepo.bump_cache_version(session, user_id, "events_version")
+
+            database.commit(session)
+            return work_events
+
+    def get_task(self, user_id: int, task_id: int) -> Task:
+        with database.session_scope() as session:
+            root = StudyTrackerSqlRepo.task_root_statement(user_id, task_id)
+
+            result = session.exec(StudyTrackerSqlRepo.task_tree_statement(root))
+            tasks = StudyTrackerSqlRepo.build_task_trees(list(result.all()))
+            if not tasks:
+                raise NotFoundException(task_id)
+            return tasks[0]
         
-    def update_task(self, user_id: int, task_id: int, task: Task):
-        with Session(engine) as session:
-            
-            statement = select(STTaskTagModel)\
-                .where(STTaskTagModel.user_id == user_id)\
-                .where(STTaskTagModel.task_id == task_id)
-                
-            result = session.exec(statement)
-            child_tasks_models = result.all()
-            
-            # Delete existent tags
-            for tag in child_tasks_models:
-                session.delete(tag)
-            session.commit()
-            
-            statement = select(STTaskModel)\
-                .where(STTaskModel.user_id == user_id)\
-                .where(STTaskModel.id == task_id)
-            
-            result = session.exec(statement)
-            task_model: STTaskModel = result.one()
-            
-            # Delete existent task
-            session.delete(task_model)
-            session.commit()
-            
-            statement = select(STTaskModel)\
-                .where(STTaskModel.user_id == user_id)\
-                .where(STTaskModel.parent_task_id == task_id)
-            
-            result = session.exec(statement)
-            child_tasks_models = result.all()
-            # Delete child tasks
-            for child in child_tasks_models:
-                session.delete(child)
-            session.commit()
-            
-            StudyTrackerSqlRepo.create_task(self, user_id, task, task_id)
+    def update_task(self, user_id: int, task_id: int, task: Task, work_events: list[Event], previous_task_name: str | None):
+        """
+        Updates the task tree in place, in a single transaction.
+        Changed columns are patched, tags and sub-tasks are reconciled by ID (sub-tasks without a known ID are created,
+        missing ones are deleted), and the work slot events of the task are replaced.
+        """
+        with database.session_scope() as session:
+            root = StudyTrackerSqlRepo.task_root_statement(user_id, task_id)
+            existing_models: list[STTaskModel] = list(session.exec(StudyTrackerSqlRepo.task_tree_statement(root)).all())
+            if not existing_models:
+                raise NotFoundException(task_id)
+            models_by_id = {task_model.id: task_model for task_model in existing_models}
+            root_model = models_by_id[task_id]
+
+            tasks = StudyTrackerSqlRepo.flatten_task_tree(task)
+
+            # The root is always the updated task. Sub-tasks keep their ID, if it belongs to this tree
+            kept_ids: list[int | None] = [task_id]
+            for current, _ in tasks[1:]:
+                is_known = current.id in models_by_id and current.id not in kept_ids
+                kept_ids.append(current.id if is_known else None)
+            new_ids = iter(StudyTrackerSqlRepo.reserve_task_ids(session, kept_ids.count(None)))
+            task_ids: list[int] = [kept_id if kept_id is not None else next(new_ids) for kept_id in kept_ids]
+
+            tag_ids_by_value = TagSqlRepo.resolve_tag_ids_by_value(
+                session, user_id, [tag for current, _ in tasks for tag in current.tags]
+            )
+
+            # New tasks are inserted first, since existing ones may be moved under them
+            updates: list[tuple[STTaskModel, dict]] = []
+            for index, (current, parent_index) in enumerate(tasks):
+                values = {
+                    "title": current.title,
+                    "description": current.description,
+                    "deadline": current.deadline,
+                    "priority": current.priority,
+                    "status": current.status,
+                    "parent_task_id": task_ids[parent_index] if parent_index is not None else root_model.parent_task_id,
+                    "parent_user_id": user_id if parent_index is not None else root_model.parent_user_id,
+                }
+                tag_ids = list(StudyTrackerSqlRepo.task_tag_names(current.tags, tag_ids_by_value))
+
+                task_model = models_by_id.get(task_ids[index])
+                if task_model is None:
+                    session.add(STTaskModel(id=task_ids[index], user_id=user_id, **values))
+                    session.add_all(
+                        STTaskTagModel(tag_id=tag_id, task_id=task_ids[index], user_id=user_id)
+                        for tag_id in tag_ids
+                    )
+                    continue
+
+                updates.append((task_model, values))
+
+                associations_by_tag_id = {association.tag_id: association for association in task_model.tags_associations}
+                for tag_id, association in associations_by_tag_id.items():
+                    if tag_id not in tag_ids:
+                        session.delete(association)
+                for tag_id in tag_ids:
+                    if tag_id not in associations_by_tag_id:
+                        session.add(STTaskTagModel(tag_id=tag_id, task_id=task_model.id, user_id=user_id))
+            session.flush()
+
+            for task_model, values in updates:
+                for column, value in values.items():
+                    if getattr(task_model, column) != value:
+                        setattr(task_model, column, value)
+            session.flush()
+
+            # A single statement, so the foreign keys between removed tasks are only checked at its end
+            removed_ids = [task_model.id for task_model in existing_models if task_model.id not in task_ids]
+            if removed_ids:
+                session.execute(
+                    delete(STTaskTagModel)
+                        .where(STTaskTagModel.user_id == user_id)
+                        .where(STTaskTagModel.task_id.in_(removed_ids))
+                )
+                session.execute(
+                    delete(STTaskModel)
+                        .where(STTaskModel.user_id == user_id)
+                        .where(STTaskModel.id.in_(removed_ids))
+                )
+
+            StudyTrackerSqlRepo.delete_task_events(session, user_id, task_id, previous_task_name)
+            for event in work_events:
+                event.task_id = task_id
+                StudyTrackerSqlRepo.add_event(session, user_id, event)
+            if work_events:
+                StudyTrackerSqlRepo.add_week_tag_time(session, user_id, STEventModel.task_id == task_id)
+            StudyTrackerSqlRepo.bump_cache_version(session, user_id, "events_version")
+
+            database.commit(session)
 
     def update_task_status(self, user_id: int, task_id: int, new_status: str):
-        with Session(engine) as session:
+        with database.session_scope() as session:
             statement = select(STTaskModel).where(STTaskModel.user_id == user_id).where(STTaskModel.id == task_id)
             result = session.exec(statement)
             task_model: STTaskModel = result.one()
             task_model.status = new_status
             session.add(task_model)
-            session.commit()
+            database.commit(session)
             
     def create_archive(self, user_id: int, name: str):
-        with Session(engine) as session:
+        with database.session_scope() as session:
             user_model: UserModel = CommonsSqlRepo.get_user_or_raise(session,user_id)
             user_model.st_archives.append(STArchiveModel(
                 name=name,
@@ -517,10 +762,10 @@ class StudyTrackerSqlRepo(StudyTrackerRepo):
             ))
 
             session.add(user_model)
-            session.commit()
+            database.commit(session)
             
     def get_archives(self, user_id: int) -> list[Archive]:
-        with Session(engine) as session:
+        with database.session_scope() as session:
             statement = select(STArchiveModel)\
                 .where(STArchiveModel.user_id == user_id)
             result = session.exec(statement)
@@ -528,7 +773,7 @@ class StudyTrackerSqlRepo(StudyTrackerRepo):
             return Archive.from_STArchiveModel(archive_models)
         
     def create_file(self, user_id: int, archive_name: str, name: str, text_content: str = ""):
-        with Session(engine) as session:
+        with database.session_scope() as session:
             statement = select(STArchiveModel)\
                 .where(STArchiveModel.user_id == user_id)\
                 .where(STArchiveModel.name == archive_name)
@@ -544,13 +789,11 @@ class StudyTrackerSqlRepo(StudyTrackerRepo):
             archive_model.files.append(new_file)
 
             session.add(archive_model)
-            session.commit()
+            database.commit(session)
             session.refresh(new_file)
             
-            gamification_service.add_notepad_entry(session, user_id)
-            
     def update_file_content(self, user_id: int, archive_name: str, filename: str, new_content: str):
-        with Session(engine) as session:
+        with database.session_scope() as session:
             statement = select(STFileModel)\
                 .where(STFileModel.user_id == user_id)\
                 .where(STFileModel.archive_name == archive_name)\
@@ -560,11 +803,11 @@ class StudyTrackerSqlRepo(StudyTrackerRepo):
             file_model: STFileModel = result.one()
             file_model.text = new_content
             session.add(file_model)
-            session.commit()
+            database.commit(session)
             session.refresh(file_model)
             
     def get_curricular_units(self, user_id: int) -> list[CurricularUnit]:
-        with Session(engine) as session:
+        with database.session_scope() as session:
             statement = select(STCurricularUnitModel)\
                 .where(STCurricularUnitModel.user_id == user_id)
             result = session.exec(statement)
@@ -574,7 +817,7 @@ class StudyTrackerSqlRepo(StudyTrackerRepo):
             return CurricularUnit.from_STCurricularUnitModel(cu_models)
         
     def create_curricular_unit(self, user_id: int, name: str):
-        with Session(engine) as session:
+        with database.session_scope() as session:
             user_model: UserModel = CommonsSqlRepo.get_user_or_raise(session,user_id)
             user_model.st_curricular_units.append(STCurricularUnitModel(
                 user_id=user_id,
@@ -582,10 +825,10 @@ class StudyTrackerSqlRepo(StudyTrackerRepo):
                 grades=[]
             ))
             session.add(user_model)
-            session.commit()
+            database.commit(session)
             
     def create_grade(self, user_id: int, curricular_unit: str, grade: Grade):
-        with Session(engine) as session:
+        with database.session_scope() as session:
             statement = select(STCurricularUnitModel)\
                 .where(STCurricularUnitModel.user_id == user_id)\
                 .where(STCurricularUnitModel.name == curricular_unit)
@@ -594,7 +837,6 @@ class StudyTrackerSqlRepo(StudyTrackerRepo):
             
             curricular_unit_model: STCurricularUnitModel = result.one()
             curricular_unit_model.grades.append(STGradeModel(
-                id=random.randint(1, 999999999), # For some reason, automatic ID is not working
                 value=grade.value,
                 weight=grade.weight,
                 curricular_unit_name=curricular_unit,
@@ -602,10 +844,10 @@ class StudyTrackerSqlRepo(StudyTrackerRepo):
             ))
             
             session.add(curricular_unit_model)
-            session.commit()
+            database.commit(session)
             
     def create_or_override_daily_energy_status(self, user_id: int, status: DailyEnergyStatus):
-        with Session(engine) as session:
+        with database.session_scope() as session:
             
             statement = select(DailyEnergyStatusModel)\
                 .where(DailyEnergyStatusModel.user_id == user_id)\
@@ -628,53 +870,45 @@ class StudyTrackerSqlRepo(StudyTrackerRepo):
                 model.time_of_day = status.time_of_day
                 session.add(model)
             
-            session.commit()
+            database.commit(session)
             
     @staticmethod
     def is_same_day(date_1: date, date_2: date) -> bool:
         return date_1.year == date_2.year and date_1.month == date_2.month and date_1.day == date_2.day
     
     def create_daily_tags(self, user_id: int, tags: list[str], _date: date):
-        with Session(engine) as session:
-            
-            for tag in tags:
-                statement = select(DailyTagModel)\
-                    .where(DailyTagModel.user_id == user_id)\
-                    .where(DailyTagModel.tag == tag)
-                    # checking date doesn't work... Check later
-                    
-                result = session.exec(statement)
-                res = result.first()
-                if res is not None:
-                    if StudyTrackerSqlRepo.is_same_day(res.date_, _date):
-                        continue
-                
-                daily_energy_stat = DailyTagModel(
+        with database.session_scope() as session:
+            tag_ids = TagSqlRepo.resolve_tag_ids(session, user_id, tags)
+
+            statement = select(DailyTagModel.tag_id)\
+                .where(DailyTagModel.user_id == user_id)\
+                .where(DailyTagModel.date_ == _date)\
+                .where(DailyTagModel.tag_id.in_(tag_ids))
+            existing_tag_ids = set(session.exec(statement).all())
+
+            for tag_id in tag_ids:
+                if tag_id in existing_tag_ids:
+                    continue
+                session.add(DailyTagModel(
                     date_=_date,
-                    tag=tag,
+                    tag_id=tag_id,
                     user_id=user_id
-                )        
-                session.add(daily_energy_stat)
+                ))
             
-            session.commit()        
+            database.commit(session)        
             
     def get_daily_tags(self, user_id: int, _date: date) -> list[str]:
-        with Session(engine) as session:
-            statement = select(DailyTagModel)\
-                .where(DailyTagModel.user_id == user_id)
+        with database.session_scope() as session:
+            statement = select(TagModel.name)\
+                .join(DailyTagModel, DailyTagModel.tag_id == TagModel.id)\
+                .where(DailyTagModel.user_id == user_id)\
+                .where(DailyTagModel.date_ == _date)
                 
-            result = session.exec(statement)
-            daily_tags_models: list[DailyTagModel] = list(result.all())
-            daily_tags: list[str] = []
-            for tag_model in daily_tags_models:
-                if StudyTrackerSqlRepo.is_same_day(tag_model.date_, _date):
-                    daily_tags.append(tag_model.tag)
-                
-            return daily_tags
+            return list(session.exec(statement).all())
             
     def is_today_energy_status_created(self, user_id: int) -> bool:
         today = date.today()
-        with Session(engine) as session:
+        with database.session_scope() as session:
             statement = select(DailyEnergyStatusModel)\
                 .where(DailyEnergyStatusModel.user_id == user_id)\
                 .where(DailyEnergyStatusModel.date_ == today) # Not working!
@@ -684,7 +918,7 @@ class StudyTrackerSqlRepo(StudyTrackerRepo):
             return model is not None
             
     def get_daily_energy_history(self, user_id: int) -> list[DailyEnergyStatus]:
-        with Session(engine) as session:
+        with database.session_scope() as session:
             statement = select(DailyEnergyStatusModel)\
                 .where(DailyEnergyStatusModel.user_id == user_id)
                 
@@ -702,58 +936,53 @@ class StudyTrackerSqlRepo(StudyTrackerRepo):
                 
             return daily_energy_history
             
-    @staticmethod
-    def compute_elapsed_minutes(date1: datetime, date2: datetime) -> int:
-        return (int) ((get_datetime_utc(date1) - get_datetime_utc(date2)) / 60)
-            
     def get_time_spent_by_tag(self, user_id: int) -> dict[int, dict[int, dict[str, int]]]:
-        # TODO: events that repeat every week
-        
-        with Session(engine) as session:
-            statement = (
-            select(STEventModel)
-            .where(STEventModel.user_id == user_id)
-            .options(
-                selectinload(STEventModel.tags_associations).selectinload(STEventTagModel.tag_ref)
-            )
-        )
-            
-            result = session.exec(statement)
-            events: list[STEventModel] = list(result.all())
-            stats: dict[int, dict[int, dict[str, int]]] = {}
+        # Events that repeat are expanded by the service, occurrence by occurrence
+        with database.session_scope() as session:
+            statement = select(STWeekTagTimeModel.year, STWeekTagTimeModel.week, TagModel.name, STWeekTagTimeModel.minutes)\
+                .join(TagModel, TagModel.id == STWeekTagTimeModel.tag_id)\
+                .where(STWeekTagTimeModel.user_id == user_id)\
+                .where(STWeekTagTimeModel.minutes != 0) # Left behind by updated or deleted events
 
-            for event in events:
-                start_date = event.start_date
-                elapsed_minutes = StudyTrackerSqlRepo.compute_elapsed_minutes(event.end_date, start_date)
-                year = start_date.year
-                week = event.start_date.isocalendar().week
-                            
-                tags = event.tags
-                for tag in tags:
-                    tag_name = tag.tag
-                    
-                    if stats.get(year) is None:
-                        stats[year] = {}
-                        
-                    if stats[year].get(week) is None:
-                        stats[year][week] = {}
-                    if stats[year][week].get(tag_name) is None:
-                        stats[year][week][tag_name] = 0 
-                    stats[year][week][tag_name] += elapsed_minutes
-                    
+            stats: dict[int, dict[int, dict[str, int]]] = {}
+            for year, week, tag_name, minutes in session.exec(statement).all():
+                stats.setdefault(year, {}).setdefault(week, {})[tag_name] = minutes
             return stats
-        
-    def get_total_time_study_per_week(self, user_id: int) -> list[WeekTimeStudy]:
-        with Session(engine) as session:
-            statement = select(WeekStudyTimeModel)\
-                .where(WeekStudyTimeModel.user_id == user_id)
+
+    def get_total_time_study_per_week(self, user_id: int, target_tag: str | None = None) -> list[WeekTimeStudy]:
+        """
+        With a target tag, the target of each week is set to the minutes of its non recurrent events with that tag,
+        read from st_week_tag_time in the same query.
+        """
+        with database.session_scope() as session:
+            if target_tag is None:
+                statement = select(WeekStudyTimeModel)\
+                    .where(WeekStudyTimeModel.user_id == user_id)
                 
-            result = session.exec(statement)
-            week_study_time_history: list[WeekStudyTimeModel] = list(result.all())
-            return WeekTimeStudy.from_STCurricularUnitModel(week_study_time_history)          
+                result = session.exec(statement)
+                week_study_time_history: list[WeekStudyTimeModel] = list(result.all())
+                return WeekTimeStudy.from_STCurricularUnitModel(week_study_time_history)
+
+            # Tag names are matched case insensitively, so every tag spelling the target (e.g. "Study") counts
+            target_tag_ids = select(TagModel.id).where(func.lower(TagModel.name) == TagCache.normalize(target_tag))
+            target_minutes = select(func.coalesce(func.sum(STWeekTagTimeModel.minutes), 0))\
+                .where(STWeekTagTimeModel.user_id == WeekStudyTimeModel.user_id)\
+                .where(STWeekTagTimeModel.year == WeekStudyTimeModel.year)\
+                .where(STWeekTagTimeModel.week == WeekStudyTimeModel.week)\
+                .where(STWeekTagTimeModel.tag_id.in_(target_tag_ids))\
+                .scalar_subquery()
+            statement = select(WeekStudyTimeModel, target_minutes)\
+                .where(WeekStudyTimeModel.user_id == user_id)
+
+            weeks: list[WeekTimeStudy] = []
+            for week_model, target in session.exec(statement).all():
+                week = WeekTimeStudy.from_STCurricularUnitModel([week_model])[0]
+                week.target = target
+                weeks.append(week)
+            return weeks
     
     def increment_week_study_time(self, user_id: int, week_and_year: WeekAndYear, minutes: int):
-        with Session(engine) as session:
+        with database.session_scope() as session:
             statement = select(WeekStudyTimeModel)\
                 .where(WeekStudyTimeModel.user_id == user_id)\
                 .where(WeekStudyTimeModel.year == week_and_year.year)\
@@ -772,14 +1001,14 @@ class StudyTrackerSqlRepo(StudyTrackerRepo):
                     user_id=user_id
                 )
                 session.add(new_model)
-                session.commit()
+                database.commit(session)
             else:
                 week_study_time_model.total += minutes
                 session.add(week_study_time_model)
-                session.commit()
+                database.commit(session)
                 
     def override_study_session_start_date(self, user_id: int):
-        with Session(engine) as session:
+        with database.session_scope() as session:
             statement = select(UserModel)\
                 .where(UserModel.id == user_id)   
             result = session.exec(statement)
@@ -788,10 +1017,10 @@ class StudyTrackerSqlRepo(StudyTrackerRepo):
                 raise NotFoundException(user_id)
             user_model.study_session_time = datetime.now()
             session.add(user_model)
-            session.commit()
+            database.commit(session)
             
     def get_study_session_start_date(self, user_id: int) -> datetime:
-        with Session(engine) as session:
+        with database.session_scope() as session:
             statement = select(UserModel)\
                 .where(UserModel.id == user_id)  
             result = session.exec(statement)
@@ -804,7 +1033,7 @@ class StudyTrackerSqlRepo(StudyTrackerRepo):
             return start
 
     def update_week_time_average_study_time(self, user_id: int, week_and_year: WeekAndYear, study_session_time: int):
-        with Session(engine) as session:
+        with database.session_scope() as session:
             statement = select(WeekStudyTimeModel)\
                 .where(WeekStudyTimeModel.user_id == user_id)\
                 .where(WeekStudyTimeModel.year == week_and_year.year)\
@@ -825,7 +1054,7 @@ class StudyTrackerSqlRepo(StudyTrackerRepo):
                 week_study_time_model.average_by_session = new_average
                 week_study_time_model.n_of_sessions += 1
                 session.add(week_study_time_model)
-                session.commit()
+                database.commit(session)
                 
 
     def delete_tag(session: Session, tag_id) -> bool:
@@ -833,5 +1062,5 @@ class StudyTrackerSqlRepo(StudyTrackerRepo):
         if tag is None:
             return False
         session.delete(tag)
-        session.commit()
+        database.commit(session)
         return True
\ No newline at end of file
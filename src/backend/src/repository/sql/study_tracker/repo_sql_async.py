@@ -0,0 +1,53 @@
+from sqlmodel import tuple_
+from sqlmodel.ext.asyncio.session import AsyncSession
+from domain.study_tracker import Task
+from exception import NotFoundException
+from repository.sql.models import database
+from repository.sql.models.models import STTaskModel
+from repository.sql.study_tracker.repo_sql import StudyTrackerSqlRepo
+
+
+class StudyTrackerAsyncSqlRepo:
+    """
+    AsyncSession (asyncpg) implementation of the study tracker read queries, for the async endpoints.
+    Statements are shared with StudyTrackerSqlRepo, so both return the same results.
+    """
+
+    async def get_tasks(
+        self,
+        user_id: int,
+        order_by_deadline_and_priority: bool,
+        filter_uncompleted_tasks: bool,
+        filter_deadline_is_today: bool,
+        year: int | None,
+        week: int | None,
+        limit: int | None = None,
+        after_task_id: int | None = None
+    ) -> list[Task]:
+        order_keys = StudyTrackerSqlRepo.task_order_keys(order_by_deadline_and_priority)
+        roots = StudyTrackerSqlRepo.task_roots_statement(
+            user_id, order_keys, filter_uncompleted_tasks, filter_deadline_is_today, year, week
+        )
+
+        async with AsyncSession(database.get_async_engine()) as session:
+            if after_task_id is not None:
+                after_keys = (await session.exec(StudyTrackerSqlRepo.task_keys_statement(user_id, order_keys, after_task_id))).first()
+                if after_keys is None:
+                    raise NotFoundException(after_task_id)
+                roots = roots.where(tuple_(*order_keys) > tuple_(*after_keys))
+
+            if limit is not None:
+                roots = roots.limit(limit)
+
+            result = await session.exec(StudyTrackerSqlRepo.task_tree_statement(roots))
+            task_models: list[STTaskModel] = list(result.all())
+            return StudyTrackerSqlRepo.build_task_trees(task_models)
+
+    async def get_task(self, user_id: int, task_id: int) -> Task:
+        async with AsyncSession(database.get_async_engine()) as session:
+            root = StudyTrackerSqlRepo.task_root_statement(user_id, task_id)
+            result = await session.exec(StudyTrackerSqlRepo.task_tree_statement(root))
+            tasks = StudyTrackerSqlRepo.build_task_trees(list(result.all()))
+            if not tasks:
+                raise NotFoundException(task_id)
+            return tasks[0]
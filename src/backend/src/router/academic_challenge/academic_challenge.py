@@ -4,11 +4,14 @@ from typing import Annotated
 from fastapi import APIRouter, Depends, Response
 
 from router.academic_challenge.dtos.input_dtos import CreateBatchInputDto, ChallengeCompletedDto, NewUserNoteDto
+from repository.sql.models.database import get_unit_of_work
 from router.commons.common import get_current_user_id
 from service import academic_challenge as academic_challenge_service
 
 router = APIRouter(
     prefix="/academic-challenge",
+    # Every write of a request is committed at once, when the route returns
+    dependencies=[Depends(get_unit_of_work)],
 )
 
 
@@ -6,11 +6,14 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 import jwt
 from repository.sql.models.models import TagModel, UserModel, UserTagLink
-from pydantic import BaseModel
-from service.common.badge_service import assign_for_event
-from repository.sql.models.database import get_session as get_db_session
+from repository.sql.commons.repo_tag import TagSqlRepo, tag_cache
+from pydantic import BaseModel, ValidationError
+from service.gamification.events import enqueue_gamification_event
+from repository.sql.models.database import run_in_session, get_session as get_db_session
+from starlette.concurrency import run_in_threadpool
 from typing import Annotated, Any, List
 
+from exception import PasswordHashingBusyException, UsernameAlreadyExistsException
 from router.commons.dtos.output_dtos import TagOutputDto
 from router.academic_challenge.dtos.input_dtos import SetShareProgressPreferenceDto
 from router.commons.dtos.input_dtos import CreateUserInputDto, SetUserAvatarDto, CreateTagInputDto
@@ -24,7 +27,12 @@ router = APIRouter(
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def get_current_user_id(token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[Session, Depends(get_db_session)]) -> int:
+async def get_current_user_id(token: Annotated[str, Depends(oauth2_scheme)]) -> int:
+    """
+    Authenticates the request from the token signature alone: the user ID is taken from the "uid" claim.
+    Legacy tokens, with only the username, are resolved through a cache, before reaching the database.
+    Declared async, so authenticating doesn't take a thread from the threadpool.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -35,11 +43,14 @@ def get_current_user_id(token: Annotated[str, Depends(oauth2_scheme)], db: Annot
         username: Any = payload.get("sub")
         if username is None:
             raise credentials_exception
-        token_data = TokenData(username=username)
-    except jwt.InvalidTokenError:
+        token_data = TokenData(username=username, user_id=payload.get("uid"))
+    except (jwt.InvalidTokenError, ValidationError):
         raise credentials_exception
     
-    id = common_service.get_user_id_from_username(db=db, username=token_data.username)
+    if token_data.user_id is not None:
+        return token_data.user_id
+
+    id = await common_service.get_user_id_from_username_async(token_data.username)
     if id is None:
         raise credentials_exception
     return id
@@ -49,11 +60,10 @@ class Token(BaseModel):
     token_type: str
 
 @router.post("/token")
-def login_for_access_token(
-    form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-    db: Annotated[Session, Depends(get_db_session)]
+async def login_for_access_token(
+    form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
 ) -> Token:
-    user = common_service.authenticate_user(db, form_data.username, form_data.password)
+    user = await common_service.authenticate_user(form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -62,9 +72,10 @@ def login_for_access_token(
         )
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data={"sub": user.username, "uid": user.id}, expires_delta=access_token_expires
     )
-    assign_for_event( user.id, "first_login")
+    # Login streak and badges are evaluated off the request, by the gamification worker
+    await run_in_threadpool(enqueue_gamification_event, user.id, "login")
     return Token(access_token=access_token, token_type="bearer")
 
 @router.get("/test-token")
@@ -78,22 +89,20 @@ async def test_token_validity(
     It does not replace the login action, which is required to create the JWT token.
 """
 @router.post("/create-user", response_model=UserOutputDto)
-def create_user_route(
-    dto: CreateUserInputDto,
-    db: Annotated[Session, Depends(get_db_session)] 
+async def create_user_route(
+    dto: CreateUserInputDto
 ):
-    existing_user = (db.exec(select(UserModel).where(UserModel.username == dto.username))).first()
-    if existing_user:
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail={"type": "USERNAME_ALREADY_EXISTS", "field": "username"}
-        )
     try:
-        new_user = common_service.create_user(db, dto)
+        new_user = await common_service.create_user(dto)
         if not new_user:
             raise Exception("Erro: create_user retornou None")
         return UserOutputDto.fromUser(new_user)
-    except HTTPException:
+    except UsernameAlreadyExistsException:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"type": "USERNAME_ALREADY_EXISTS", "field": "username"}
+        )
+    except (HTTPException, PasswordHashingBusyException):
         raise
     except Exception as e:
         print(f"Erro ao criar utilizador com tags: {e}")
@@ -103,11 +112,17 @@ def create_user_route(
         )
 
 @router.get("/users/me", response_model=UserOutputDto)
-def get_user_info( 
+async def get_user_info( 
     user_id: Annotated[int, Depends(get_current_user_id)],
-    db: Annotated[Session, Depends(get_db_session)]
+    includeBatches: bool = True
 ) -> UserOutputDto:
-    user = common_service.get_user_info(db, user_id)
+    if not includeBatches:
+        profile = await common_service.get_user_profile_async(user_id)
+        if profile is None:
+            raise HTTPException(status.HTTP_404_NOT_FOUND, detail="User not found")
+        return UserOutputDto.fromUserProfile(profile)
+
+    user = await run_in_threadpool(run_in_session, common_service.get_user_info, user_id)
     if user is None:
         raise HTTPException(status.HTTP_404_NOT_FOUND, detail="User not found")
     return UserOutputDto.fromUser(user)
@@ -130,16 +145,11 @@ def set_user_avatar(
     common_service.set_user_avatar(db, user_id, input_dto.avatarFilename)
 
 @router.get("/users/me/tags", response_model=List[TagOutputDto])
-def get_user_tags( 
-    current_user_id: Annotated[int, Depends(get_current_user_id)],
-    db: Annotated[Session, Depends(get_db_session)]
+async def get_user_tags( 
+    current_user_id: Annotated[int, Depends(get_current_user_id)]
 ):
     try:
-        user_tag_data = (db.exec(
-            select(UserTagLink, TagModel)
-            .join(TagModel, UserTagLink.tag_id == TagModel.id)
-            .where(UserTagLink.user_id == current_user_id)
-        )).all()
+        user_tag_data = await common_service.get_user_tags_async(current_user_id)
 
         if not user_tag_data:
             return []
@@ -204,9 +214,7 @@ def create_user_tag(
     print(f"DEBUG: Dados recebidos no backend para criar tag: {tag_input.model_dump()}") # Ou tag_input.dict()
     try:
 
-        existing_tag = (db.exec(
-            select(TagModel).where(TagModel.name == tag_input.name)
-        )).first()
+        existing_tag = TagSqlRepo.get_tag_by_name(db, tag_input.name)
 
         if existing_tag:
     
@@ -234,6 +242,7 @@ def create_user_tag(
             db.add(new_tag)
             db.commit()
             db.refresh(new_tag)
+            tag_cache.invalidate(tag_id=new_tag.id, name=new_tag.name)
 
             new_user_tag_link = UserTagLink(user_id=current_user_id, tag_id=new_tag.id,is_custom=True)
             db.add(new_user_tag_link)
@@ -54,6 +54,7 @@ class UserMetricsResponse(BaseModel):
     total_notepad_entries: int
     total_forum_questions: int
     total_forum_answers: int
+    total_events_added: int
     simultaneous_tool_uses: int
     total_points: int
 
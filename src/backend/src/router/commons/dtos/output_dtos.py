@@ -3,7 +3,7 @@ from pydantic import BaseModel, Field
 from typing import List, Optional
 
 from domain.study_tracker import Event
-from domain.commons.user import User
+from domain.commons.user import User, UserProfile
 from router.academic_challenge.dtos.output_dtos import BatchDto
 
 
@@ -28,6 +28,16 @@ class UserOutputDto(BaseModel):
             batches=BatchDto.fromBatches(user.batches)
         )
 
+    @staticmethod
+    def fromUserProfile(profile: UserProfile) -> 'UserOutputDto':
+        return UserOutputDto(
+            id=profile.id,
+            username=profile.username,
+            avatarFilename=profile.avatar_filename,
+            shareProgress=profile.share_progress,
+            batches=None
+        )
+
 class TagOutputDto(BaseModel):
     id: str
     name: str
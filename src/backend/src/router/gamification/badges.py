@@ -3,7 +3,7 @@ from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlmodel import Session
 import logging
 
-from repository.sql.models.database import get_session as get_db_session
+from repository.sql.models.database import get_session as get_db_session, get_unit_of_work
 from router.commons.common import get_current_user_id
 from router.commons.dtos.gamification_dtos import BadgeResponse
 from router.commons.dtos.gamification_dtos import (
@@ -16,40 +16,42 @@ from router.commons.dtos.gamification_dtos import (
 from repository.sql.commons.repo_badge import BadgeRepo
 from service.gamification import core as gamification_service
 
-router = APIRouter(prefix="/gamification", tags=["Gamification"])
+router = APIRouter(
+    prefix="/gamification",
+    tags=["Gamification"],
+    # The metrics, badges and leagues changed by a request are committed at once, when the route returns
+    dependencies=[Depends(get_unit_of_work)],
+)
 
 logger = logging.getLogger(__name__)
 
 @router.get( "/badges",response_model=List[BadgeResponse],summary="Obter todas as definições de medalhas",description="Retorna todas as medalhas disponíveis, filtradas pelo scope da aplicação.")
-def get_all_badges(
-    app_scope: Optional[str] = Query(None, description="Filtrar medalhas por scope da aplicação (ex: 'academic_challenge', 'study_tracker', 'all'). Se omitido, retorna todas as comuns."),
-    db: Session = Depends(get_db_session)
+async def get_all_badges(
+    app_scope: Optional[str] = Query(None, description="Filtrar medalhas por scope da aplicação (ex: 'academic_challenge', 'study_tracker', 'all'). Se omitido, retorna todas as comuns.")
 ):
     scope = app_scope if app_scope else "common"
-    badges = gamification_service.get_all_badges_for_app_scope(db, scope)
+    badges = await gamification_service.get_all_badges_for_app_scope_async(scope)
     return badges
 
 @router.get("/badges/me",response_model=List[BadgeResponse],summary="Obter as medalhas conquistadas pelo utilizador atual",description="Retorna a lista de medalhas que o utilizador autenticado já conquistou.")
-def get_my_earned_badges(
-    user_id: int = Depends(get_current_user_id),
-    db: Session = Depends(get_db_session)
+async def get_my_earned_badges(
+    user_id: int = Depends(get_current_user_id)
 ):
-    earned_badges =  gamification_service.get_user_earned_badges(db, user_id)
+    earned_badges = await gamification_service.get_user_earned_badges_async(user_id)
     return earned_badges
 
 @router.get("/badges/status",response_model=List[UserBadgesStatusDto],summary="Obter todas as medalhas com o status de conquista do utilizador atual",description="Retorna todas as medalhas disponíveis, indicando quais o utilizador autenticado já conquistou.")
-def get_all_badges_with_user_status(
+async def get_all_badges_with_user_status(
     user_id: int = Depends(get_current_user_id),
-    db: Session = Depends(get_db_session),
     app_scope: Optional[str] = Query(None, description="Filtrar medalhas por scope da aplicação. Se omitido, retorna todas as comuns.")
 ) -> List[UserBadgesStatusDto]:
 
     try:
         scope = app_scope if app_scope else "common"
 
-        all_badges =  gamification_service.get_all_badges_for_app_scope(db, scope)
+        all_badges = await gamification_service.get_all_badges_for_app_scope_async(scope)
 
-        earned_badges =  gamification_service.get_user_earned_badges(db, user_id)
+        earned_badges = await gamification_service.get_user_earned_badges_async(user_id)
 
         earned_badge_ids: Set[int] = {badge.id for badge in earned_badges}
 
@@ -136,4 +138,5 @@ def trigger_league_evaluation(
     user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db_session)
 ):
+    gamification_service.evaluate_and_promote_leagues(db, user_id)
     return {"message": "Avaliação de ligas concluída."}
\ No newline at end of file
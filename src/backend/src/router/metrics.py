@@ -0,0 +1,19 @@
+from fastapi import APIRouter
+
+from repository.sql.models import database
+from service.common.security import password_hashing_pool
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["Metrics"],
+)
+
+@router.get("/password-hashing")
+def get_password_hashing_metrics() -> dict[str, int]:
+    """Queue depth and backpressure of the password hashing pool, in this process."""
+    return password_hashing_pool.get_metrics()
+
+@router.get("/db-pool")
+def get_db_pool_metrics() -> dict[str, dict[str, int | float]]:
+    """Checkouts, wait times and saturation of the database connection pools, in this process."""
+    return database.get_pool_metrics()
@@ -50,6 +50,7 @@ class SlotToWorkInputDto(BaseModel):
     endTime: float
     
 class CreateTaskInputDto(BaseModel):
+    id: int | None = None # Set when editing an existing (sub-)task
     title: str
     description: str | None = None
     deadline: float | None = None
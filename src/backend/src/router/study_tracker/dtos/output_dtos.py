@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 
-from domain.study_tracker import Archive, CurricularUnit, DailyEnergyStatus, Event, File, Grade, Task, WeekTimeStudy
+from domain.study_tracker import Archive, CurricularUnit, DailyEnergyStatus, Event, File, Grade, SlotToWork, Task, WeekTimeStudy
 from utils import get_datetime_utc, get_datetime_utc_from_date
 from datetime import date
 
@@ -58,6 +58,20 @@ class UserTaskOutputDto(BaseModel):
             subTasks=sub_tasks_output_dto
         )
 
+class SlotToWorkOutputDto(BaseModel):
+    startTime: int
+    endTime: int
+
+    @staticmethod
+    def from_slots(slots: list[SlotToWork]) -> list['SlotToWorkOutputDto']:
+        return [
+            SlotToWorkOutputDto(
+                startTime=get_datetime_utc(slot.start_time),
+                endTime=get_datetime_utc(slot.end_time)
+            )
+            for slot in slots
+        ]
+
 class EventOutputDto(BaseModel):
     id: int
     startDate: int
@@ -1,16 +1,19 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from http.client import HTTPException
 from typing import Annotated
-from fastapi import APIRouter, Depends, Response
+from fastapi import APIRouter, Depends, Query, Response
 from domain.study_tracker import DateInterval, Event, Grade, SlotToWork, Task, UnavailableScheduleBlock
+from repository.sql.models.database import get_unit_of_work
 from router.commons.common import get_current_user_id
-from router.study_tracker.dtos.input_dtos import CreateArchiveInputDto, CreateCurricularUnitInputDto, CreateDailyEnergyStatus, CreateDailyTags, CreateFileInputDto, CreateGradeInputDto, CreateTaskInputDto, CreateEventInputDto, CreateScheduleNotAvailableBlockInputDto, EditTaskInputDto, SetStudyTrackerAppUseGoalsInputDto, UpdateEventInputDto, UpdateFileInputDto, UpdateStudyTrackerReceiveNotificationsPrefInputDto, UpdateStudyTrackerWeekPlanningDayInputDto, UpdateTaskStatus
-from router.study_tracker.dtos.output_dtos import ArchiveOutputDto, CurricularUnitOutputDto, DailyEnergyStatusOutputDto, DailyTasksProgressOutputDto, EventOutputDto, UserTaskOutputDto, WeekTimeStudyOutputDto
+from router.study_tracker.dtos.input_dtos import CreateArchiveInputDto, CreateCurricularUnitInputDto, CreateDailyEnergyStatus, CreateDailyTags, CreateFileInputDto, CreateGradeInputDto, CreateTaskInputDto, CreateEventInputDto, CreateScheduleNotAvailableBlockInputDto, EditTaskInputDto, SetStudyTrackerAppUseGoalsInputDto, SlotToWorkInputDto, UpdateEventInputDto, UpdateFileInputDto, UpdateStudyTrackerReceiveNotificationsPrefInputDto, UpdateStudyTrackerWeekPlanningDayInputDto, UpdateTaskStatus
+from router.study_tracker.dtos.output_dtos import ArchiveOutputDto, CurricularUnitOutputDto, DailyEnergyStatusOutputDto, DailyTasksProgressOutputDto, EventOutputDto, SlotToWorkOutputDto, UserTaskOutputDto, WeekTimeStudyOutputDto
 from service import study_tracker as study_tracker_service
 
 
 router = APIRouter(
     prefix="/study-tracker",
+    # Every write of a request is committed at once, when the route returns
+    dependencies=[Depends(get_unit_of_work)],
 )
 
 @router.post("/users/me/tasks")
@@ -23,12 +26,11 @@ def create_task(
         slots_to_work = dto.slotsToWork
     
     # This route returns the newly created task!
-    task_id = study_tracker_service.create_task(
+    task = study_tracker_service.create_task(
         user_id, 
         Task.from_create_task_input_dto(dto), 
         SlotToWork.from_slot_to_work_input_dto(slots_to_work)
     )
-    task = study_tracker_service.get_user_task(user_id, task_id)
     return UserTaskOutputDto.from_Task(task)
 
 @router.put("/users/me/tasks/{task_id}")
@@ -60,14 +62,53 @@ def update_task_status(
     study_tracker_service.update_task_status(user_id, task_id, dto.newStatus)
 
 @router.get("/users/me/tasks")
-def get_tasks(
+async def get_tasks(
     user_id: Annotated[int, Depends(get_current_user_id)],
     orderByDeadlineAndPriority: bool,
-    filterUncompletedTasks: bool
+    filterUncompletedTasks: bool,
+    limit: Annotated[int | None, Query(gt=0)] = None,
+    afterTaskId: int | None = None
 ) -> list[UserTaskOutputDto]:
-    tasks = study_tracker_service.get_user_tasks(user_id, orderByDeadlineAndPriority, filterUncompletedTasks, False)
+    tasks = await study_tracker_service.get_user_tasks_async(
+        user_id, orderByDeadlineAndPriority, filterUncompletedTasks, False, limit, afterTaskId
+    )
     return UserTaskOutputDto.from_Tasks(tasks)
 
+@router.get("/users/me/work-slot-proposals")
+def get_work_slot_proposals(
+    user_id: Annotated[int, Depends(get_current_user_id)],
+    effortMinutes: Annotated[int, Query(gt=0)],
+    slotMinutes: Annotated[int, Query(gt=0)] = 60,
+    taskId: int | None = None,
+    deadline: float | None = None,
+    startDate: float | None = None,
+    dayStartHour: Annotated[int, Query(ge=0, le=23)] = 8,
+    dayEndHour: Annotated[int, Query(ge=1, le=24)] = 22,
+    maxMinutesPerDay: Annotated[int | None, Query(gt=0)] = None
+) -> list[SlotToWorkOutputDto]:
+    """Free slots for the task (or until the given deadline), around the user's events and unavailable blocks."""
+    slots = study_tracker_service.propose_task_work_slots(
+        user_id,
+        taskId,
+        datetime.fromtimestamp(deadline) if deadline is not None else None,
+        timedelta(minutes=effortMinutes),
+        timedelta(minutes=slotMinutes),
+        datetime.fromtimestamp(startDate) if startDate is not None else None,
+        dayStartHour,
+        dayEndHour,
+        timedelta(minutes=maxMinutesPerDay) if maxMinutesPerDay is not None else None
+    )
+    return SlotToWorkOutputDto.from_slots(slots)
+
+@router.post("/users/me/tasks/{task_id}/work-slots")
+def create_task_work_slots(
+    user_id: Annotated[int, Depends(get_current_user_id)],
+    task_id: int,
+    dto: list[SlotToWorkInputDto]
+) -> list[EventOutputDto]:
+    events = study_tracker_service.create_task_work_slots(user_id, task_id, SlotToWork.from_slot_to_work_input_dto(dto))
+    return EventOutputDto.from_events(events)
+
 @router.get("/users/me/statistics/daily-tasks-progress")
 def get_daily_tasks_progress(
     user_id: Annotated[int, Depends(get_current_user_id)],
@@ -82,8 +123,22 @@ def get_events(
     user_id: Annotated[int, Depends(get_current_user_id)],
     today: bool,
     recurrentEvents: bool,
+    startDate: float | None = None,
+    endDate: float | None = None,
+    tags: Annotated[list[str] | None, Query()] = None
 ) -> list[EventOutputDto]:
     #print(datetime.fromtimestamp(service.get_user_info(user_id).batches[0].startDate))
+    # When the client gives the visible window, only the events inside it are fetched
+    if startDate is not None or endDate is not None:
+        events = study_tracker_service.get_events_in_window(
+            user_id,
+            datetime.fromtimestamp(startDate) if startDate is not None else None,
+            datetime.fromtimestamp(endDate) if endDate is not None else None,
+            tags,
+            recurrentEvents
+        )
+        return EventOutputDto.from_events(events)
+
     events = study_tracker_service.get_events(user_id, today, recurrentEvents, False, None)
     return EventOutputDto.from_events(events)
 
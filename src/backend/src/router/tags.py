@@ -3,13 +3,15 @@ from fastapi import APIRouter, HTTPException, Depends, status
 from sqlmodel import Session, select, delete
 from sqlmodel.sql.expression import SelectOfScalar
 from sqlalchemy.orm import selectinload
-from repository.sql.models.database import get_engine
+from repository.sql.models.database import session_scope
+from repository.sql.commons.repo_tag import TagSqlRepo, tag_cache
 from repository.sql.models.models import UserTagLink, UserModel, STEventTagModel, STTaskTagModel, DailyTagModel,TagModel
 
 from router.commons.common import get_current_user_id
+from service.common import common as common_service
 
 def get_session():
-    with Session(get_engine()) as session:
+    with session_scope() as session:
         yield session
         
 router = APIRouter(
@@ -24,38 +26,33 @@ class TagCreate(BaseModel):
     name: str
     
 @router.get("/", response_model=List[TagModel])
-async def get_all_global_tags(session: Annotated[Session, Depends(get_session)]):
+async def get_all_global_tags():
     """
     Retorna todas as tags globais disponíveis no sistema.
     """
-    tags = session.exec(select(TagModel)).all()
+    tags = await common_service.get_all_tags_async()
     return tags
 
 
 @router.get("/my-tags/", response_model=List[TagModel])
 async def get_user_custom_tags(
-    current_user: Annotated[UserModel, Depends(get_current_user_id)],
-    session: Annotated[Session, Depends(get_session)]
+    current_user_id: Annotated[int, Depends(get_current_user_id)]
 ):
     """
     Retorna as tags personalizadas (ou "possuídas") pelo usuário autenticado.
     Isso inclui tags criadas pelo usuário e talvez algumas globais que ele marcou como "minhas".
     """
 
-    user_tag_links = session.exec(
-        select(UserTagLink)
-        .where(UserTagLink.user_id == current_user.id)
-        .options(selectinload(UserTagLink.tag))
-    ).all()
+    user_tag_links = await common_service.get_user_tags_async(current_user_id)
     
-    user_tags = [link.tag for link in user_tag_links if link.tag]
+    user_tags = [tag for _, tag in user_tag_links]
     return user_tags
 
 
 @router.post("/", response_model=TagModel, status_code=status.HTTP_201_CREATED)
-async def create_new_tag(
+def create_new_tag(
     tag_data: TagCreate,
-    current_user: Annotated[UserModel, Depends(get_current_user_id)],
+    current_user_id: Annotated[int, Depends(get_current_user_id)],
     session: Annotated[Session, Depends(get_session)]
 ):
     """
@@ -65,9 +62,7 @@ async def create_new_tag(
     """
     tag_name_normalized = tag_data.name.strip().lower() 
     
-    existing_global_tag = session.exec(
-        select(TagModel).where(TagModel.name.ilike(tag_name_normalized))
-    ).first()
+    existing_global_tag = TagSqlRepo.get_tag_by_name(session, tag_name_normalized)
 
     tag_to_associate: TagModel
     if not existing_global_tag:
@@ -82,7 +77,7 @@ async def create_new_tag(
 
     existing_user_tag_link = session.exec(
         select(UserTagLink)
-        .where(UserTagLink.user_id == current_user.id)
+        .where(UserTagLink.user_id == current_user_id)
         .where(UserTagLink.tag_id == tag_to_associate.id)
     ).first()
 
@@ -93,18 +88,19 @@ async def create_new_tag(
             detail=f"Tag '{tag_data.name}' is already associated with your account."
         )
 
-    user_tag_link = UserTagLink(user_id=current_user.id, tag_id=tag_to_associate.id)
+    user_tag_link = UserTagLink(user_id=current_user_id, tag_id=tag_to_associate.id)
     session.add(user_tag_link)
     session.commit()
-    session.refresh(tag_to_associate)
+    if not existing_global_tag:
+        tag_cache.invalidate(tag_id=tag_to_associate.id, name=tag_to_associate.name)
 
     return tag_to_associate
 
 
 @router.delete("/my-tags/{tag_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_user_tag_association(
+def delete_user_tag_association(
     tag_id: int,
-    current_user: Annotated[UserModel, Depends(get_current_user_id)],
+    current_user_id: Annotated[int, Depends(get_current_user_id)],
     session: Annotated[Session, Depends(get_session)]
 ):
     """
@@ -113,7 +109,7 @@ async def delete_user_tag_association(
     """
     user_tag_link = session.exec(
         select(UserTagLink)
-        .where(UserTagLink.user_id == current_user.id)
+        .where(UserTagLink.user_id == current_user_id)
         .where(UserTagLink.tag_id == tag_id)
     ).first()
 
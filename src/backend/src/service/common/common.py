@@ -1,28 +1,53 @@
 from typing import Optional, List
 from sqlmodel import select, Session
-from service.common.security import get_password_hash, verify_password
+from service.common.security import get_password_hash_async, verify_and_update_password_async
 from repository.sql.models.models import UserModel, TagModel, UserTagLink
 from repository.sql.models.database import predefined_global_tag_names
 from repository.sql.commons.repo_sql import CommonsSqlRepo
+from repository.sql.commons.repo_sql_async import CommonsAsyncSqlRepo, TagAsyncSqlRepo
+from repository.sql.commons.repo_tag import TagSqlRepo
+from repository.sql.models import database
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
 from router.commons.dtos.input_dtos import CreateUserInputDto
 from exception import UsernameAlreadyExistsException
-from domain.commons.user import User 
+from domain.commons.user import User, UserCredentials, UserProfile 
+from cache import TTLCache
 
-def authenticate_user(db: Session, username: str, password: str) -> Optional[User]: 
-    user = CommonsSqlRepo.get_user_by_username(db, username) 
+# Usernames never change, so a short TTL is enough to serve tokens without the "uid" claim
+user_id_by_username_cache: TTLCache[str, int] = TTLCache(max_size=4096, ttl_seconds=300)
+
+def get_user_credentials(db: Session, username: str) -> Optional[UserCredentials]:
+    user = CommonsSqlRepo.get_user_credentials_by_username(db, username)
+    db.commit() # Ends the read, returning the connection to the pool while the password is verified
+    return user
+
+async def authenticate_user(username: str, password: str) -> Optional[UserCredentials]: 
+    """
+    Verifies the password in the hashing pool, awaited from the event loop,
+    so neither a thread nor a connection is held meanwhile.
+    """
+    user = await run_in_threadpool(database.run_in_session, get_user_credentials, username)
     if not user:
         return None
-    if not verify_password(password, user.hashed_password): 
+    valid, new_hashed_password = await verify_and_update_password_async(password, user.hashed_password)
+    if not valid: 
         return None
+    if new_hashed_password is not None:
+        await run_in_threadpool(database.run_in_session, CommonsSqlRepo.update_user_password_hash, user.id, new_hashed_password)
+        user.hashed_password = new_hashed_password
     return user
-    
-def create_user(db: Session, user_data: CreateUserInputDto) -> User: 
+
+async def create_user(user_data: CreateUserInputDto) -> User:
+    """The password is hashed before the session is opened, so no connection is held while hashing."""
+    hashed_password = await get_password_hash_async(user_data.password)
+    return await run_in_threadpool(database.run_in_session, create_user_with_password_hash, user_data, hashed_password)
+
+def create_user_with_password_hash(db: Session, user_data: CreateUserInputDto, hashed_password: str) -> User: 
     existing_user = CommonsSqlRepo.exists_user_by_username(db, user_data.username) 
     if existing_user:
         raise UsernameAlreadyExistsException()
 
-    hashed_password = get_password_hash(user_data.password)
-    
     new_user_model = CommonsSqlRepo.create_user(db, user_data.username, hashed_password) 
 
     predefined_tags_in_db = db.exec( 
@@ -40,15 +65,60 @@ def create_user(db: Session, user_data: CreateUserInputDto) -> User:
     db.commit() 
     db.refresh(new_user_model) 
 
-    new_user_domain = CommonsSqlRepo.from_user_model(new_user_model)
+    # A new user has no batches yet, so there's nothing else to load
+    new_user_domain = User(
+        id=new_user_model.id,
+        username=new_user_model.username,
+        hashed_password=new_user_model.hashed_password,
+        avatar_filename=new_user_model.avatar_filename,
+        share_progress=new_user_model.share_progress,
+        batches=[]
+    )
     
     return new_user_domain
 
 def get_user_id_from_username(db: Session, username: str) -> Optional[int]: 
-    user = CommonsSqlRepo.get_user_by_username(db, username) 
-    if user is not None:
-        return user.id
-    return None
+    user_id = user_id_by_username_cache.get(username)
+    if user_id is None:
+        user_id = CommonsSqlRepo.get_user_id_by_username(db, username)
+        if user_id is not None:
+            user_id_by_username_cache.set(username, user_id)
+    return user_id
+
+async def get_user_id_from_username_async(username: str) -> Optional[int]:
+    """Same as get_user_id_from_username, on the async engine when enabled, or else on the threadpool."""
+    user_id = user_id_by_username_cache.get(username)
+    if user_id is not None:
+        return user_id
+    if not database.ASYNC_DATABASE_ENABLED:
+        return await run_in_threadpool(database.run_in_session, get_user_id_from_username, username)
+    async with AsyncSession(database.get_async_engine()) as db:
+        user_id = await CommonsAsyncSqlRepo.get_user_id_by_username(db, username)
+    if user_id is not None:
+        user_id_by_username_cache.set(username, user_id)
+    return user_id
+
+def get_user_profile(db: Session, user_id: int) -> Optional[UserProfile]:
+    return CommonsSqlRepo.get_user_profile_by_id(db, user_id)
+
+async def get_user_profile_async(user_id: int) -> Optional[UserProfile]:
+    if not database.ASYNC_DATABASE_ENABLED:
+        return await run_in_threadpool(database.run_in_session, get_user_profile, user_id)
+    async with AsyncSession(database.get_async_engine()) as db:
+        return await CommonsAsyncSqlRepo.get_user_profile_by_id(db, user_id)
+
+async def get_all_tags_async() -> List[TagModel]:
+    if not database.ASYNC_DATABASE_ENABLED:
+        return await run_in_threadpool(database.run_in_session, TagSqlRepo.get_all_tags)
+    async with AsyncSession(database.get_async_engine()) as db:
+        return await TagAsyncSqlRepo.get_all_tags(db)
+
+async def get_user_tags_async(user_id: int) -> List[tuple[UserTagLink, TagModel]]:
+    """The user's tag links, each with its tag."""
+    if not database.ASYNC_DATABASE_ENABLED:
+        return await run_in_threadpool(database.run_in_session, TagSqlRepo.get_user_tags, user_id)
+    async with AsyncSession(database.get_async_engine()) as db:
+        return await TagAsyncSqlRepo.get_user_tags(db, user_id)
 
 def get_user_info(db: Session, user_id: int) -> Optional[User]:
     user = CommonsSqlRepo.get_user_by_id(db, user_id) 
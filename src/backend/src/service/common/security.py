@@ -1,13 +1,28 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Any
+import multiprocessing
+import os
+import threading
+from typing import Any, Callable, TypeVar
 import jwt
 from pydantic import BaseModel
 from passlib.context import CryptContext
 
+from exception import PasswordHashingBusyException
+
 # Use: $ openssl rand -hex 32
 # to generate a secure random secret key
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Changing the cost makes existing hashes get rehashed, on the next login
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 12))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+# bcrypt is CPU bound (100-300ms per call), so it runs in dedicated processes, away from the request threadpool.
+# Calls beyond the pending limit are rejected right away, instead of queueing and starving every other request.
+PASSWORD_HASHING_WORKERS = int(os.environ.get("PASSWORD_HASHING_WORKERS", 2))
+PASSWORD_HASHING_MAX_PENDING = int(os.environ.get("PASSWORD_HASHING_MAX_PENDING", 16))
 
 # to get a string like this run:
 # openssl rand -hex 32
@@ -18,6 +33,7 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 9999
 
 class TokenData(BaseModel):
     username: str | None = None
+    user_id: int | None = None # "uid" claim. Legacy tokens don't have it
     
 def create_access_token(data: dict[str, Any], expires_delta: timedelta | None = None) -> str:
     to_encode = data.copy()
@@ -29,8 +45,79 @@ def create_access_token(data: dict[str, Any], expires_delta: timedelta | None =
     encoded_jwt: str = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_password(plain_password: str, hashed_password: str):
-    return pwd_context.verify(plain_password, hashed_password)
+T = TypeVar("T")
+
+class PasswordHashingPool:
+    """Size-limited process pool for password hashing, with backpressure."""
+
+    def __init__(self, workers: int, max_pending: int) -> None:
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0 # Submitted calls, either queued or running
+        self.rejected = 0
+        self.completed = 0
+        self._executor: ProcessPoolExecutor | None = None
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Started lazily, and with "spawn", so workers don't inherit the app state (DB connections, threads)
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def _acquire_slot(self):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PasswordHashingBusyException()
+        with self._lock:
+            self.pending += 1
+
+    def _release_slot(self):
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+        self._slots.release()
+
+    async def run_async(self, fn: Callable[..., T], *args: Any) -> T:
+        """Runs fn in a worker, awaiting it without holding a thread. Raises PasswordHashingBusyException when saturated."""
+        self._acquire_slot()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._release_slot()
+            raise
+        # Released once the call leaves the pool, rather than when the caller stops awaiting it (e.g. on a client disconnect)
+        future.add_done_callback(lambda _: self._release_slot())
+        return await asyncio.wrap_future(future)
+
+    def get_metrics(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "maxPending": self.max_pending,
+                "pending": self.pending,
+                "rejected": self.rejected,
+                "completed": self.completed,
+            }
+
+password_hashing_pool = PasswordHashingPool(PASSWORD_HASHING_WORKERS, PASSWORD_HASHING_MAX_PENDING)
+
+# Run inside the pool workers
+def _hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+def _verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """Returns whether the password is valid and, if the hash uses outdated parameters, a new hash to store."""
+    return await password_hashing_pool.run_async(_verify_and_update_password, plain_password, hashed_password)
 
-def get_password_hash(password: str):
-    return pwd_context.hash(password)
\ No newline at end of file
+async def get_password_hash_async(password: str) -> str:
+    return await password_hashing_pool.run_async(_hash_password, password)
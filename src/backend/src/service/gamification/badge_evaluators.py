@@ -1,8 +1,11 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime, timedelta
 
 class BadgeCriteriaEvaluator(ABC):
+    # Métricas (campos de UserMetric) de que o critério depende. Só é reavaliado quando uma delas muda
+    metrics: frozenset[str] = frozenset()
+
     @abstractmethod
     def evaluate(self, user_metrics: Dict[str, Any], context: Dict[str, Any] = None) -> bool:
         """
@@ -12,14 +15,33 @@ class BadgeCriteriaEvaluator(ABC):
         """
         pass
 
-class LoginStreakEvaluator(BadgeCriteriaEvaluator):
+    def threshold_alternatives(self) -> Optional[List[Tuple[str, Any]]]:
+        """
+        Pares (métrica, valor) tais que o critério é cumprido quando alguma das métricas atinge o seu valor.
+        None quando o critério não se reduz a limiares.
+        """
+        return None
+
+class MetricThresholdEvaluator(BadgeCriteriaEvaluator):
+    """Cumprido quando a métrica atinge criteria_value."""
+    metric: str
+
     def __init__(self, criteria_value: int):
         self.criteria_value = criteria_value
+        self.metrics = frozenset({self.metric})
 
     def evaluate(self, user_metrics: Dict[str, Any], context: Dict[str, Any] = None) -> bool:
-        return user_metrics.get("login_streak", 0) >= self.criteria_value
+        return user_metrics.get(self.metric, 0) >= self.criteria_value
+
+    def threshold_alternatives(self) -> Optional[List[Tuple[str, Any]]]:
+        return [(self.metric, self.criteria_value)]
+
+class LoginStreakEvaluator(MetricThresholdEvaluator):
+    metric = "login_streak"
 
 class ChallengeCompleteEvaluator(BadgeCriteriaEvaluator):
+    metrics = frozenset({"completed_challenges"})
+
     def __init__(self, challenge_code: str):
         self.challenge_code = challenge_code
 
@@ -27,57 +49,59 @@ class ChallengeCompleteEvaluator(BadgeCriteriaEvaluator):
         completed_challenges = user_metrics.get("completed_challenges", [])
         return self.challenge_code in completed_challenges
 
-class PomodoroCyclesEvaluator(BadgeCriteriaEvaluator):
-    def __init__(self, criteria_value: int):
-        self.criteria_value = criteria_value
-
-    def evaluate(self, user_metrics: Dict[str, Any], context: Dict[str, Any] = None) -> bool:
-        return user_metrics.get("total_pomodoro_cycles", 0) >= self.criteria_value
-
-class TasksCompletedEvaluator(BadgeCriteriaEvaluator):
-    def __init__(self, criteria_value: int):
-        self.criteria_value = criteria_value
-
-    def evaluate(self, user_metrics: Dict[str, Any], context: Dict[str, Any] = None) -> bool:
-        return user_metrics.get("total_tasks_completed", 0) >= self.criteria_value
+class PomodoroCyclesEvaluator(MetricThresholdEvaluator):
+    metric = "total_pomodoro_cycles"
 
-class NotepadEntriesEvaluator(BadgeCriteriaEvaluator):
-    def __init__(self, criteria_value: int):
-        self.criteria_value = criteria_value
+class TasksCompletedEvaluator(MetricThresholdEvaluator):
+    metric = "total_tasks_completed"
 
-    def evaluate(self, user_metrics: Dict[str, Any], context: Dict[str, Any] = None) -> bool:
-        return user_metrics.get("total_notepad_entries", 0) >= self.criteria_value
+class NotepadEntriesEvaluator(MetricThresholdEvaluator):
+    metric = "total_notepad_entries"
 
-class ForumQuestionsEvaluator(BadgeCriteriaEvaluator):
-    def __init__(self, criteria_value: int):
-        self.criteria_value = criteria_value
+class ForumQuestionsEvaluator(MetricThresholdEvaluator):
+    metric = "total_forum_questions"
 
-    def evaluate(self, user_metrics: Dict[str, Any], context: Dict[str, Any] = None) -> bool:
-        return user_metrics.get("total_forum_questions", 0) >= self.criteria_value
+class ForumAnswersEvaluator(MetricThresholdEvaluator):
+    metric = "total_forum_answers"
 
-class ForumAnswersEvaluator(BadgeCriteriaEvaluator):
-    def __init__(self, criteria_value: int):
-        self.criteria_value = criteria_value
+class EventsAddedEvaluator(MetricThresholdEvaluator):
+    #FALTA métrica para o número total de eventos adicionados
+    metric = "total_events_added"
 
-    def evaluate(self, user_metrics: Dict[str, Any], context: Dict[str, Any] = None) -> bool:
-        return user_metrics.get("total_forum_answers", 0) >= self.criteria_value
-
-class EventsAddedEvaluator(BadgeCriteriaEvaluator):
-    def __init__(self, criteria_value: int):
-        self.criteria_value = criteria_value
+class SimultaneousToolUsesEvaluator(MetricThresholdEvaluator):
+    # Pode ser o valor máximo registado, ou um flag
+    metric = "simultaneous_tool_uses"
 
-    def evaluate(self, user_metrics: Dict[str, Any], context: Dict[str, Any] = None) -> bool:
-        #FALTA métrica para o número total de eventos adicionados
-        return user_metrics.get("total_events_added", 0) >= self.criteria_value
+class OrEvaluator(BadgeCriteriaEvaluator):
+    """Cumprido quando pelo menos um dos critérios é cumprido."""
 
-class SimultaneousToolUsesEvaluator(BadgeCriteriaEvaluator):
-    def __init__(self, criteria_value: int):
-        self.criteria_value = criteria_value
+    def __init__(self, evaluators: List[BadgeCriteriaEvaluator]):
+        self.evaluators = evaluators
+        self.metrics = frozenset().union(*(evaluator.metrics for evaluator in evaluators))
 
     def evaluate(self, user_metrics: Dict[str, Any], context: Dict[str, Any] = None) -> bool:
-        # Pode ser o valor máximo registado, ou um flag
-        return user_metrics.get("simultaneous_tool_uses", 0) >= self.criteria_value
-
+        return any(evaluator.evaluate(user_metrics, context) for evaluator in self.evaluators)
+
+    def threshold_alternatives(self) -> Optional[List[Tuple[str, Any]]]:
+        alternatives = []
+        for evaluator in self.evaluators:
+            evaluator_alternatives = evaluator.threshold_alternatives()
+            if evaluator_alternatives is None:
+                return None
+            alternatives.extend(evaluator_alternatives)
+        return alternatives
+
+
+THRESHOLD_EVALUATORS: Dict[str, type[MetricThresholdEvaluator]] = {
+    "login_streak": LoginStreakEvaluator,
+    "pomodoro_cycles": PomodoroCyclesEvaluator,
+    "tasks_completed": TasksCompletedEvaluator,
+    "notepad_entries": NotepadEntriesEvaluator,
+    "forum_questions": ForumQuestionsEvaluator,
+    "forum_answers": ForumAnswersEvaluator,
+    "events_added": EventsAddedEvaluator,
+    "simultaneous_tool_uses": SimultaneousToolUsesEvaluator,
+}
 
 # Factory para criar a instância de avaliador correta
 def create_badge_criteria_evaluator(criteria_json: Dict[str, Any]) -> Optional[BadgeCriteriaEvaluator]:
@@ -85,23 +109,14 @@ def create_badge_criteria_evaluator(criteria_json: Dict[str, Any]) -> Optional[B
         return None
 
     criteria_type = criteria_json.get("type")
-    if criteria_type == "login_streak":
-        return LoginStreakEvaluator(criteria_json["value"])
+    if criteria_type in THRESHOLD_EVALUATORS:
+        return THRESHOLD_EVALUATORS[criteria_type](criteria_json["value"])
     elif criteria_type == "challenge_complete":
         return ChallengeCompleteEvaluator(criteria_json["challenge_id"])
-    elif criteria_type == "pomodoro_cycles":
-        return PomodoroCyclesEvaluator(criteria_json["value"])
-    elif criteria_type == "tasks_completed":
-        return TasksCompletedEvaluator(criteria_json["value"])
-    elif criteria_type == "notepad_entries":
-        return NotepadEntriesEvaluator(criteria_json["value"])
-    elif criteria_type == "forum_questions":
-        return ForumQuestionsEvaluator(criteria_json["value"])
-    elif criteria_type == "forum_answers":
-        return ForumAnswersEvaluator(criteria_json["value"])
-    elif criteria_type == "events_added":
-        return EventsAddedEvaluator(criteria_json["value"])
-    elif criteria_type == "simultaneous_tool_uses":
-        return SimultaneousToolUsesEvaluator(criteria_json["value"])
+    elif criteria_type == "or":
+        evaluators = [create_badge_criteria_evaluator(criteria) for criteria in criteria_json.get("criteria", [])]
+        if not evaluators or None in evaluators:
+            return None
+        return OrEvaluator(evaluators)
     #TODO: Adicionar mais tipos de critérios aqui
-    return None
\ No newline at end of file
+    return None
@@ -0,0 +1,125 @@
+import bisect
+import logging
+import threading
+import time
+from typing import Any, Iterable, Optional
+
+from sqlmodel import Session, select
+
+from repository.sql.models.models import Badge
+from service.gamification.badge_evaluators import BadgeCriteriaEvaluator, create_badge_criteria_evaluator
+
+logger = logging.getLogger(__name__)
+
+# As medalhas mudam raramente, e fora da aplicação (seed, ou à mão na base de dados), por isso o registo é reconstruído
+# com esta frequência: medalhas novas ou alteradas só são usadas depois, no máximo, deste tempo
+BADGE_REGISTRY_TTL_SECONDS = 300
+
+class CompiledBadge:
+    def __init__(self, badge_id: int, code: str, title: str, evaluator: BadgeCriteriaEvaluator):
+        self.badge_id = badge_id
+        self.code = code
+        self.title = title
+        self.evaluator = evaluator
+
+class CompiledBadges:
+    """Snapshot imutável das medalhas ativas, com os seus avaliadores, indexadas pelas métricas de que dependem."""
+
+    def __init__(self, badges: list[CompiledBadge]):
+        self.badges = badges
+        self.by_metric: dict[str, list[CompiledBadge]] = {}
+        for badge in badges:
+            for metric in badge.evaluator.metrics:
+                self.by_metric.setdefault(metric, []).append(badge)
+
+        # Por métrica, os limiares ordenados (e as medalhas de cada um), e as medalhas com outros critérios
+        self.threshold_values: dict[str, list[Any]] = {}
+        self.threshold_badges: dict[str, list[CompiledBadge]] = {}
+        self.unindexed_by_metric: dict[str, list[CompiledBadge]] = {}
+        thresholds: dict[str, list[tuple[Any, CompiledBadge]]] = {}
+        for badge in badges:
+            alternatives = badge.evaluator.threshold_alternatives()
+            if alternatives is None:
+                for metric in badge.evaluator.metrics:
+                    self.unindexed_by_metric.setdefault(metric, []).append(badge)
+                continue
+            for metric, value in alternatives:
+                thresholds.setdefault(metric, []).append((value, badge))
+        for metric, metric_thresholds in thresholds.items():
+            metric_thresholds.sort(key=lambda threshold: threshold[0])
+            self.threshold_values[metric] = [value for value, _ in metric_thresholds]
+            self.threshold_badges[metric] = [badge for _, badge in metric_thresholds]
+
+    def affected_by(self, changed_metrics: Optional[Iterable[str]]) -> list[CompiledBadge]:
+        """As medalhas que podem ser ganhas depois de as métricas dadas mudarem. Todas, sem métricas."""
+        if changed_metrics is None:
+            return self.badges
+        affected: dict[int, CompiledBadge] = {}
+        for metric in changed_metrics:
+            for badge in self.by_metric.get(metric, []):
+                affected[badge.badge_id] = badge
+        return list(affected.values())
+
+    def crossed_by(self, metric: str, previous_value: Any, value: Any) -> list[CompiledBadge]:
+        """
+        As medalhas com um limiar da métrica em ]previous_value, value], encontradas por pesquisa binária,
+        e as medalhas da métrica com critérios que não são limiares, que têm de ser avaliadas.
+        """
+        crossed: dict[int, CompiledBadge] = {}
+        values = self.threshold_values.get(metric)
+        if values is not None and value > previous_value:
+            start = bisect.bisect_right(values, previous_value)
+            end = bisect.bisect_right(values, value)
+            for badge in self.threshold_badges[metric][start:end]:
+                crossed[badge.badge_id] = badge
+        for badge in self.unindexed_by_metric.get(metric, []):
+            crossed[badge.badge_id] = badge
+        return list(crossed.values())
+
+class BadgeEvaluatorRegistry:
+    """
+    Registo, partilhado pelo processo, dos avaliadores de medalhas compilados. Os critérios de cada medalha são
+    interpretados uma vez, quando o registo é (re)construído, em vez de em cada evento de gamificação.
+    """
+
+    def __init__(self, ttl_seconds: float = BADGE_REGISTRY_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._compiled: CompiledBadges | None = None
+        self._expires_at = 0.0
+
+    def get(self, db: Session) -> CompiledBadges:
+        compiled = self._compiled
+        if compiled is not None and time.monotonic() < self._expires_at:
+            return compiled
+        with self._lock:
+            if self._compiled is None or time.monotonic() >= self._expires_at:
+                self._compiled = self._compile(db)
+                self._expires_at = time.monotonic() + self.ttl_seconds
+            return self._compiled
+
+    def _compile(self, db: Session) -> CompiledBadges:
+        rows = db.exec(
+            select(Badge.id, Badge.code, Badge.title, Badge.criteria_json)
+            .where(Badge.is_active == True)
+            .order_by(Badge.id)
+        ).all()
+
+        badges: list[CompiledBadge] = []
+        for badge_id, code, title, criteria_json in rows:
+            if not criteria_json:
+                continue
+            try:
+                evaluator = create_badge_criteria_evaluator(criteria_json)
+            except (KeyError, TypeError, AttributeError):
+                evaluator = None
+            if evaluator is None:
+                logger.warning(f"Critérios inválidos ou não suportados na medalha '{code}' (ID: {badge_id}): {criteria_json}")
+                continue
+            badges.append(CompiledBadge(badge_id, code, title, evaluator))
+
+        logger.info(f"Registo de avaliadores de medalhas compilado ({len(badges)} medalhas).")
+        return CompiledBadges(badges)
+
+
+badge_registry = BadgeEvaluatorRegistry()
@@ -1,39 +1,41 @@
 from sqlmodel import Session, select, and_
-from datetime import datetime, timedelta, timezone # Adicionado timezone
-from typing import List, Dict, Any, Optional
+from datetime import datetime, timezone # Adicionado timezone
+from typing import Iterable, List, Dict, Any, Optional
 import logging
-from sqlalchemy.orm import selectinload
+from starlette.concurrency import run_in_threadpool
+from repository.sql.commons.repo_badge import AsyncBadgeRepo, BadgeRepo
+from repository.sql.commons.repo_metrics import UserMetricRepo
+from repository.sql.models import database
 from repository.sql.models.models import Badge, UserBadge, UserMetric, UserModel, League, UserLeague
 
-from service.gamification.badge_evaluators import create_badge_criteria_evaluator
+from service.gamification.badge_registry import CompiledBadge, badge_registry
 
 logger = logging.getLogger(__name__)
 
+async_badge_repo = AsyncBadgeRepo()
+
 def get_all_badges_for_app_scope(db: Session, app_scope: str) -> List[Badge]:
     """Obtém todas as definições de medalhas ativas para um dado scope de aplicação."""
-    query = select(Badge).options(selectinload(Badge.league))
-    
-    if app_scope and app_scope != "all":
-        if app_scope == "common":
-            query = query.where(Badge.app_scope == "common")
-        else:
-            query = query.where(
-                (Badge.app_scope == "common") | (Badge.app_scope == app_scope)
-            )
-
-    badges = db.exec(query).all()
+    badges = db.exec(BadgeRepo.app_scope_badges_statement(app_scope)).all()
     return badges
 
 def get_user_earned_badges(db: Session, user_id: int) -> List[Badge]:
     """Obtém as medalhas conquistadas por um utilizador específico."""
-    statement = (
-        select(UserBadge)
-        .where(UserBadge.user_id == user_id)
-        .options(selectinload(UserBadge.badge).selectinload(Badge.league)) # Carrega UserBadge -> Badge -> League
-    )
-    user_badge_associations = db.exec(statement).all()
+    user_badge_associations = db.exec(BadgeRepo.user_badges_statement(user_id)).all() # Carrega UserBadge -> Badge -> League
     return [ub.badge for ub in user_badge_associations if ub.badge] # Retorna a lista de objetos Badge
 
+async def get_all_badges_for_app_scope_async(app_scope: str) -> List[Badge]:
+    """Versão assíncrona de get_all_badges_for_app_scope, sem ocupar uma thread."""
+    if not database.ASYNC_DATABASE_ENABLED:
+        return await run_in_threadpool(database.run_in_session, get_all_badges_for_app_scope, app_scope)
+    return await async_badge_repo.list_for_app_scope(app_scope)
+
+async def get_user_earned_badges_async(user_id: int) -> List[Badge]:
+    """Versão assíncrona de get_user_earned_badges, sem ocupar uma thread."""
+    if not database.ASYNC_DATABASE_ENABLED:
+        return await run_in_threadpool(database.run_in_session, get_user_earned_badges, user_id)
+    return await async_badge_repo.list_user(user_id)
+
 def get_all_leagues(db: Session) -> List[League]:
     """Obtém todas as definições de ligas, ordenadas por rank."""
     result = db.execute(  
@@ -53,22 +55,18 @@ def get_user_current_league(db: Session, user_id: int) -> Optional[League]:
 
 def _get_or_create_user_metrics(db: Session, user_id: int) -> UserMetric:
     """Helper para obter ou criar o registo de métricas do utilizador."""
-    result = db.execute(  
-        select(UserMetric).where(UserMetric.user_id == user_id)
-    )
-    user_metrics = result.scalar_one_or_none()
-    if not user_metrics:
-        user_metrics = UserMetric(user_id=user_id)
-        db.add(user_metrics)
-        db.commit() 
-        db.refresh(user_metrics) 
-        logger.info(f"Criado novo registo de métricas para o utilizador {user_id}")
-    return user_metrics
-
-def evaluate_and_award_badges(db: Session, user_id: int, context: Dict[str, Any] = None):
+    return UserMetricRepo.get_or_create(db, user_id)
+
+def evaluate_and_award_badges(db: Session, user_id: int, context: Dict[str, Any] = None, changed_metrics: Optional[Iterable[str]] = None):
     """
     Avalia e atribui medalhas a um utilizador com base nas suas métricas atuais.
+    Com changed_metrics, só são avaliadas as medalhas cujos critérios dependem dessas métricas.
+    Tal como a avaliação de ligas, não faz commit: as medalhas ficam na transação de quem a chama.
     """
+    candidate_badges = badge_registry.get(db).affected_by(changed_metrics)
+    if not candidate_badges:
+        return []
+
     user_metrics = _get_or_create_user_metrics(db, user_id) 
     
     # Converter UserMetric para um dicionário para os avaliadores
@@ -76,39 +74,50 @@ def evaluate_and_award_badges(db: Session, user_id: int, context: Dict[str, Any]
     if user_metrics_dict.get('last_login_at'):
         user_metrics_dict['last_login_at'] = user_metrics_dict['last_login_at'].date() # Apenas a data para streaks
 
-    # Obter IDs das medalhas que o utilizador já tem
+    return _award_badges(db, user_id, candidate_badges, user_metrics_dict, context)
+
+def award_crossed_badges(db: Session, user_id: int, user_metrics: UserMetric, metric: str, previous_value: Any, context: Dict[str, Any] = None) -> List[Badge]:
+    """
+    Atribui as medalhas cujo limiar da métrica foi ultrapassado, de previous_value para o valor atual, por pesquisa
+    binária nos limiares ordenados. Medalhas com limiares já abaixo de previous_value (p.ex. medalhas novas, ou alteradas)
+    não são atribuídas aqui, mas por evaluate_and_award_badges, que avalia todas no primeiro login de cada dia.
+    """
+    candidate_badges = badge_registry.get(db).crossed_by(metric, previous_value, getattr(user_metrics, metric))
+    if not candidate_badges:
+        return []
+
+    user_metrics_dict = user_metrics.model_dump()
+    if user_metrics_dict.get('last_login_at'):
+        user_metrics_dict['last_login_at'] = user_metrics_dict['last_login_at'].date()
+    return _award_badges(db, user_id, candidate_badges, user_metrics_dict, context)
+
+def _award_badges(db: Session, user_id: int, candidate_badges: List[CompiledBadge], user_metrics_dict: Dict[str, Any], context: Dict[str, Any] = None) -> List[Badge]:
+    """Atribui as medalhas candidatas, ainda não ganhas, cujos critérios são cumpridos."""
+    # Obter IDs das medalhas candidatas que o utilizador já tem
     earned_badge_ids_result = db.execute(  
-        select(UserBadge.badge_id).where(UserBadge.user_id == user_id)
+        select(UserBadge.badge_id)
+        .where(UserBadge.user_id == user_id)
+        .where(UserBadge.badge_id.in_([badge.badge_id for badge in candidate_badges]))
     )
     earned_badge_ids = {id_ for id_ in earned_badge_ids_result.scalars().all()} # Set para lookup rápido
 
-    # Obter todas as medalhas ativas
-    all_active_badges_result = db.execute(  
-        select(Badge).where(Badge.is_active == True)
-    )
-    all_active_badges: List[Badge] = all_active_badges_result.all()
-
     newly_awarded_badges = []
-    for badge in all_active_badges:
-        # Só avalia se a medalha ainda não foi ganha e se tem critérios definidos
-        if badge.id not in earned_badge_ids and badge.criteria_json:
-            evaluator = create_badge_criteria_evaluator(badge.criteria_json)
-            if evaluator and evaluator.evaluate(user_metrics_dict, context):
-                new_user_badge = UserBadge(
-                    user_id=user_id,
-                    badge_id=badge.id,
-                    awarded_at=datetime.now(timezone.utc)
-                )
-                db.add(new_user_badge)
-                newly_awarded_badges.append(badge)
-                logger.info(f"Medalha '{badge.title}' (ID: {badge.id}) atribuída a {user_id}!")
+    for badge in candidate_badges:
+        # Só avalia se a medalha ainda não foi ganha
+        if badge.badge_id not in earned_badge_ids and badge.evaluator.evaluate(user_metrics_dict, context):
+            new_user_badge = UserBadge(
+                user_id=user_id,
+                badge_id=badge.badge_id,
+                awarded_at=datetime.now(timezone.utc)
+            )
+            db.add(new_user_badge)
+            newly_awarded_badges.append(badge)
+            logger.info(f"Medalha '{badge.title}' (ID: {badge.badge_id}) atribuída a {user_id}!")
 
     if newly_awarded_badges:
-        db.commit() 
-        for badge in newly_awarded_badges:
-            db.refresh(badge) 
+        db.flush() 
 
-    return newly_awarded_badges
+    return [db.get(Badge, badge.badge_id) for badge in newly_awarded_badges]
 
 def evaluate_and_promote_leagues(db: Session, user_id: int):
     """
@@ -178,139 +187,79 @@ def evaluate_and_promote_leagues(db: Session, user_id: int):
                     )
                     db.add(new_user_league)
                     logger.info(f"Utilizador {user_id} promovido para a Liga '{league.name}' (ID: {league.id})!")
-                    db.commit() 
-                    db.refresh(new_user_league) 
-                    db.refresh(league) 
 
                     if league.code.startswith("self_efficacy_"):
                         pass # Implementar lógica de nível aqui
 
-    db.commit() 
+    db.flush() 
     logger.info(f"Avaliação de ligas concluída para o utilizador {user_id}.")
 
-def update_login_streak(db: Session, user_id: int):
-    """Atualiza a sequência de login do utilizador e avalia as medalhas/ligas."""
-    user_metrics = _get_or_create_user_metrics(db, user_id) 
-
-    today = datetime.now(timezone.utc).date()
-    if user_metrics.last_login_at:
-        last_login_date = user_metrics.last_login_at.date()
-        if last_login_date == today:
-            return 
-        elif last_login_date == today - timedelta(days=1):
-            user_metrics.login_streak += 1
-        else:
-            user_metrics.login_streak = 1
-    else:
-        user_metrics.login_streak = 1
-
-    user_metrics.last_login_at = datetime.now(timezone.utc)
-    db.add(user_metrics) 
-    db.commit() 
-    db.refresh(user_metrics) 
+def update_login_streak(db: Session, user_id: int, login_at: Optional[datetime] = None):
+    """
+    Atualiza a sequência de login do utilizador e avalia as medalhas/ligas, numa só transação.
+    login_at é o momento do login, por omissão agora.
+    """
+    user_metrics = UserMetricRepo.record_login(db, user_id, login_at or datetime.now(timezone.utc))
+    if user_metrics is None: # Já tinha feito login nesse dia
+        database.commit(db)
+        return
 
     logger.info(f"Métricas de login atualizadas para o utilizador {user_id}: streak {user_metrics.login_streak}")
-    # Avaliar e atribuir medalhas/ligas após a atualização das métricas
-    evaluate_and_award_badges(db, user_id, context={"action": "login"}) 
-    evaluate_and_promote_leagues(db, user_id) 
+    # No primeiro login do dia são avaliadas todas as medalhas, e não só os limiares ultrapassados: assim, medalhas
+    # novas ou alteradas chegam, no máximo num dia, a quem já tinha ultrapassado o seu limiar
+    if evaluate_and_award_badges(db, user_id, context={"action": "login"}):
+        evaluate_and_promote_leagues(db, user_id) 
+    database.commit(db)
 
 def add_completed_challenge(db: Session, user_id: int, challenge_code: str):
-    """Adiciona um desafio completo às métricas do utilizador e avalia as medalhas/ligas."""
-    user_metrics = _get_or_create_user_metrics(db, user_id) 
+    """Adiciona um desafio completo às métricas do utilizador e avalia as medalhas/ligas, numa só transação."""
+    if UserMetricRepo.add_completed_challenge(db, user_id, challenge_code) is not None:
+        logger.info(f"Desafio '{challenge_code}' adicionado para o utilizador {user_id}")
+        evaluate_and_award_badges(db, user_id, context={"action": "challenge_complete", "challenge_id": challenge_code}, changed_metrics=("completed_challenges",)) 
+        # Há ligas que dependem do próprio desafio, por isso são sempre avaliadas
+        evaluate_and_promote_leagues(db, user_id) 
+    database.commit(db)
 
-    if challenge_code not in user_metrics.completed_challenges:
-        user_metrics.completed_challenges.append(challenge_code)
-        db.add(user_metrics)
-        db.commit() 
-        db.refresh(user_metrics) 
+def _add_to_counter(db: Session, user_id: int, metric: str, action: str, log_message: str, amount: int = 1):
+    """Incrementa o contador e atribui as medalhas (e ligas) que daí resultam. Um só commit, no fim."""
+    user_metrics, previous_value = UserMetricRepo.increment(db, user_id, metric, amount)
+    logger.info(f"{log_message} para o utilizador {user_id}. Total: {getattr(user_metrics, metric)}")
 
-        logger.info(f"Desafio '{challenge_code}' adicionado para o utilizador {user_id}")
-        evaluate_and_award_badges(db, user_id, context={"action": "challenge_complete", "challenge_id": challenge_code}) 
+    # As ligas dependem das medalhas ganhas, por isso só são avaliadas quando há novas
+    if award_crossed_badges(db, user_id, user_metrics, metric, previous_value, context={"action": action}):
         evaluate_and_promote_leagues(db, user_id) 
+    database.commit(db)
 
-def add_pomodoro_cycle(db: Session, user_id: int):
+def add_pomodoro_cycle(db: Session, user_id: int, amount: int = 1):
     """Incrementa o contador de ciclos Pomodoro completos e avalia as medalhas/ligas."""
-    user_metrics = _get_or_create_user_metrics(db, user_id) 
-    user_metrics.total_pomodoro_cycles += 1
-    db.add(user_metrics)
-    db.commit() 
-    db.refresh(user_metrics) 
+    _add_to_counter(db, user_id, "total_pomodoro_cycles", "pomodoro_cycle", "Ciclo Pomodoro incrementado", amount)
 
-    logger.info(f"Ciclo Pomodoro incrementado para o utilizador {user_id}. Total: {user_metrics.total_pomodoro_cycles}")
-    evaluate_and_award_badges(db, user_id, context={"action": "pomodoro_cycle"}) 
-    evaluate_and_promote_leagues(db, user_id) 
-
-def add_completed_task(db: Session, user_id: int):
+def add_completed_task(db: Session, user_id: int, amount: int = 1):
     """Incrementa o contador de tarefas completas e avalia as medalhas/ligas."""
-    user_metrics = _get_or_create_user_metrics(db, user_id) 
-    user_metrics.total_tasks_completed += 1
-    db.add(user_metrics)
-    db.commit() 
-    db.refresh(user_metrics) 
-
-    logger.info(f"Tarefa completada para o utilizador {user_id}. Total: {user_metrics.total_tasks_completed}")
-    evaluate_and_award_badges(db, user_id, context={"action": "task_complete"}) 
-    evaluate_and_promote_leagues(db, user_id) 
+    _add_to_counter(db, user_id, "total_tasks_completed", "task_complete", "Tarefa completada", amount)
 
-def add_notepad_entry(db: Session, user_id: int):
+def add_notepad_entry(db: Session, user_id: int, amount: int = 1):
     """Incrementa o contador de registos no bloco de notas e avalia as medalhas/ligas."""
-    user_metrics = _get_or_create_user_metrics(db, user_id) 
-    user_metrics.total_notepad_entries += 1
-    db.add(user_metrics)
-    db.commit() 
-    db.refresh(user_metrics) 
-
-    logger.info(f"Registo no bloco de notas adicionado para o utilizador {user_id}. Total: {user_metrics.total_notepad_entries}")
-    evaluate_and_award_badges(db, user_id, context={"action": "notepad_entry"}) 
-    evaluate_and_promote_leagues(db, user_id) 
+    _add_to_counter(db, user_id, "total_notepad_entries", "notepad_entry", "Registo no bloco de notas adicionado", amount)
 
-def add_forum_question(db: Session, user_id: int):
+def add_forum_question(db: Session, user_id: int, amount: int = 1):
     """Incrementa o contador de perguntas no fórum e avalia as medalhas/ligas."""
-    user_metrics = _get_or_create_user_metrics(db, user_id) 
-    user_metrics.total_forum_questions += 1
-    db.add(user_metrics)
-    db.commit() 
-    db.refresh(user_metrics) 
+    _add_to_counter(db, user_id, "total_forum_questions", "forum_question", "Pergunta no fórum adicionada", amount)
 
-    logger.info(f"Pergunta no fórum adicionada para o utilizador {user_id}. Total: {user_metrics.total_forum_questions}")
-    evaluate_and_award_badges(db, user_id, context={"action": "forum_question"}) 
-    evaluate_and_promote_leagues(db, user_id) 
-
-def add_forum_answer(db: Session, user_id: int):
+def add_forum_answer(db: Session, user_id: int, amount: int = 1):
     """Incrementa o contador de respostas no fórum e avalia as medalhas/ligas."""
-    user_metrics = _get_or_create_user_metrics(db, user_id) 
-    user_metrics.total_forum_answers += 1
-    db.add(user_metrics)
-    db.commit() 
-    db.refresh(user_metrics) 
-
-    logger.info(f"Resposta no fórum adicionada para o utilizador {user_id}. Total: {user_metrics.total_forum_answers}")
-    evaluate_and_award_badges(db, user_id, context={"action": "forum_answer"}) 
-    evaluate_and_promote_leagues(db, user_id) 
+    _add_to_counter(db, user_id, "total_forum_answers", "forum_answer", "Resposta no fórum adicionada", amount)
 
-def add_event_to_calendar(db: Session, user_id: int):
+def add_event_to_calendar(db: Session, user_id: int, amount: int = 1):
     """Incrementa o contador de eventos adicionados ao calendário e avalia as medalhas/ligas."""
-    user_metrics = _get_or_create_user_metrics(db, user_id) 
-    if not hasattr(user_metrics, 'total_events_added'):
-        user_metrics.total_events_added = 0 # Inicializa se não existir no modelo
-    user_metrics.total_events_added += 1
-    db.add(user_metrics)
-    db.commit() 
-    db.refresh(user_metrics) 
-
-    logger.info(f"Evento adicionado ao calendário para o utilizador {user_id}. Total: {user_metrics.total_events_added}")
-    evaluate_and_award_badges(db, user_id, context={"action": "add_event"}) 
-    evaluate_and_promote_leagues(db, user_id) 
+    _add_to_counter(db, user_id, "total_events_added", "add_event", "Evento adicionado ao calendário", amount)
 
 def update_simultaneous_tool_uses(db: Session, user_id: int, current_count: int):
-    """Atualiza o máximo de ferramentas usadas em simultâneo e avalia as medalhas/ligas."""
-    user_metrics = _get_or_create_user_metrics(db, user_id) 
-    if current_count > user_metrics.simultaneous_tool_uses:
-        user_metrics.simultaneous_tool_uses = current_count
-        db.add(user_metrics)
-        db.commit() 
-        db.refresh(user_metrics) 
-
+    """Atualiza o máximo de ferramentas usadas em simultâneo e avalia as medalhas/ligas, numa só transação."""
+    raised = UserMetricRepo.raise_to(db, user_id, "simultaneous_tool_uses", current_count)
+    if raised is not None:
+        user_metrics, previous_value = raised
         logger.info(f"Ferramentas simultâneas atualizadas para o utilizador {user_id}. Max: {user_metrics.simultaneous_tool_uses}")
-        evaluate_and_award_badges(db, user_id, context={"action": "simultaneous_tools"}) 
-        evaluate_and_promote_leagues(db, user_id) 
+        if award_crossed_badges(db, user_id, user_metrics, "simultaneous_tool_uses", previous_value, context={"action": "simultaneous_tools"}):
+            evaluate_and_promote_leagues(db, user_id)
+    database.commit(db)
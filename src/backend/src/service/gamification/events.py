@@ -0,0 +1,163 @@
+import logging
+import os
+import threading
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List
+
+from sqlmodel import Session
+
+from repository.sql.commons.repo_outbox import GamificationOutboxRepo
+from repository.sql.models import database
+from repository.sql.models.models import GamificationOutboxModel
+from service.gamification import core
+
+logger = logging.getLogger(__name__)
+
+# Os eventos de gamificação são avaliados fora do pedido, por um worker no processo.
+# A outbox (tabela gamification_outbox) garante que não se perdem, mesmo que o processo pare a meio.
+GAMIFICATION_WORKER_ENABLED = database.get_env_bool("GAMIFICATION_WORKER_ENABLED", True)
+# Sem avisos (p.ex. eventos de outros processos, ou tentativas adiadas), a outbox é verificada com esta frequência
+GAMIFICATION_WORKER_POLL_SECONDS = float(os.environ.get("GAMIFICATION_WORKER_POLL_SECONDS", 5))
+# Depois de um aviso, espera este tempo, para juntar os eventos de uma rajada do mesmo utilizador
+GAMIFICATION_WORKER_DEBOUNCE_SECONDS = float(os.environ.get("GAMIFICATION_WORKER_DEBOUNCE_SECONDS", 0.2))
+GAMIFICATION_EVENT_BATCH_SIZE = int(os.environ.get("GAMIFICATION_EVENT_BATCH_SIZE", 100))
+GAMIFICATION_EVENT_MAX_ATTEMPTS = int(os.environ.get("GAMIFICATION_EVENT_MAX_ATTEMPTS", 5))
+GAMIFICATION_EVENT_RETRY_BACKOFF = timedelta(seconds=30)
+
+# Ações que só incrementam um contador: uma rajada é aplicada de uma vez
+COUNTER_ACTIONS: Dict[str, Callable[[Session, int, int], None]] = {
+    "pomodoro_cycle": core.add_pomodoro_cycle,
+    "task_complete": core.add_completed_task,
+    "notepad_entry": core.add_notepad_entry,
+    "forum_question": core.add_forum_question,
+    "forum_answer": core.add_forum_answer,
+    "add_event": core.add_event_to_calendar,
+}
+
+def enqueue_gamification_event(user_id: int, action: str, context: Dict[str, Any] | None = None):
+    """
+    Regista o evento na outbox, na transação do pedido, para ser avaliado pelo worker depois do commit.
+    Assim, a avaliação de medalhas e ligas não atrasa o pedido, e o evento só existe se o pedido tiver sucesso.
+    """
+    with database.session_scope() as session:
+        GamificationOutboxRepo.add(session, user_id, action, context)
+        database.commit(session)
+    database.after_commit(gamification_worker.wake)
+
+def apply_user_events(db: Session, user_id: int, events: List[GamificationOutboxModel]):
+    """Aplica, juntos, os eventos de um utilizador. Eventos repetidos são aplicados uma só vez (contadores somados)."""
+    events_by_action: Dict[str, List[GamificationOutboxModel]] = defaultdict(list)
+    for event in events:
+        events_by_action[event.action].append(event)
+
+    for action, action_events in events_by_action.items():
+        contexts = [event.context or {} for event in action_events]
+        if action in COUNTER_ACTIONS:
+            COUNTER_ACTIONS[action](db, user_id, len(contexts))
+        elif action == "login":
+            # O dia da sequência é o do login, e não o do processamento (que pode ser horas depois): um login por dia
+            logins_by_day: Dict[date, datetime] = {}
+            for event in action_events:
+                login_at = event.created_at.astimezone(timezone.utc)
+                logins_by_day.setdefault(login_at.date(), login_at)
+            for login_at in sorted(logins_by_day.values()):
+                core.update_login_streak(db, user_id, login_at)
+        elif action == "challenge_complete":
+            for challenge_code in dict.fromkeys(context["challenge_id"] for context in contexts):
+                core.add_completed_challenge(db, user_id, challenge_code)
+        elif action == "simultaneous_tools":
+            core.update_simultaneous_tool_uses(db, user_id, max(context["count"] for context in contexts))
+        else:
+            logger.warning(f"Evento de gamificação desconhecido '{action}', do utilizador {user_id}, ignorado.")
+
+class GamificationWorker:
+    """Thread que processa a outbox de gamificação, um utilizador (e uma transação) de cada vez."""
+
+    def __init__(self, poll_seconds: float, debounce_seconds: float, batch_size: int, max_attempts: int) -> None:
+        self.poll_seconds = poll_seconds
+        self.debounce_seconds = debounce_seconds
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="gamification-worker", daemon=True)
+        self._thread.start()
+        logger.info("Worker de gamificação iniciado.")
+
+    def stop(self, timeout: float = 10):
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._wake.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def wake(self):
+        """Avisa o worker de que há novos eventos."""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            # Limpo antes de esvaziar a outbox: um aviso recebido entretanto leva a outra passagem, sem esperar pelo poll
+            self._wake.clear()
+            try:
+                while not self._stopping.is_set() and self.process_next_user():
+                    pass
+            except Exception:
+                logger.exception("Erro no worker de gamificação.")
+
+            if self._wake.wait(self.poll_seconds):
+                self._stopping.wait(self.debounce_seconds)
+
+    def process_next_user(self) -> bool:
+        """
+        Processa os eventos disponíveis do próximo utilizador, e apaga-os, numa só transação.
+        Se falharem, são adiados, até max_attempts tentativas. Devolve False quando não há eventos.
+        """
+        # Um unit of work, como num pedido: os commits das ações de gamificação só fazem flush
+        scope = database.RequestSessionScope()
+        scope.unit_of_work = True
+        token = database.request_session_scope.set(scope)
+        unit_of_work = database.UnitOfWork(scope)
+        try:
+            events = GamificationOutboxRepo.claim_next_user_events(unit_of_work.session, self.batch_size)
+            if not events:
+                unit_of_work.rollback()
+                return False
+
+            user_id = events[0].user_id
+            event_ids = [event.id for event in events]
+            # Guardadas antes do rollback, que liberta os locks: retry_later volta a bloquear só os eventos inalterados
+            claimed_attempts = {event.id: event.attempts for event in events}
+            try:
+                apply_user_events(unit_of_work.session, user_id, events)
+                GamificationOutboxRepo.delete(unit_of_work.session, event_ids)
+                unit_of_work.commit()
+            except Exception:
+                logger.exception(f"Erro ao processar {len(event_ids)} eventos de gamificação do utilizador {user_id}.")
+                unit_of_work.rollback()
+                dropped = GamificationOutboxRepo.retry_later(
+                    unit_of_work.session, claimed_attempts, GAMIFICATION_EVENT_RETRY_BACKOFF, self.max_attempts
+                )
+                unit_of_work.commit()
+                if dropped:
+                    logger.error(f"{dropped} eventos de gamificação do utilizador {user_id} descartados, após {self.max_attempts} tentativas.")
+            return True
+        finally:
+            database.request_session_scope.reset(token)
+            scope.close()
+
+
+gamification_worker = GamificationWorker(
+    GAMIFICATION_WORKER_POLL_SECONDS,
+    GAMIFICATION_WORKER_DEBOUNCE_SECONDS,
+    GAMIFICATION_EVENT_BATCH_SIZE,
+    GAMIFICATION_EVENT_MAX_ATTEMPTS
+)
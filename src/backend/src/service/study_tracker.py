@@ -1,12 +1,29 @@
-from datetime import datetime
-from domain.study_tracker import Archive, CurricularUnit, DailyEnergyStatus, DateInterval, Event, Grade, SlotToWork, Task, UnavailableScheduleBlock, WeekAndYear, WeekTimeStudy, verify_time_of_day
+from datetime import datetime, timedelta
+from cache import TTLCache
+from domain.study_tracker import DEFAULT_EVENT_COLOR, Archive, CurricularUnit, DailyEnergyStatus, DateInterval, Event, Grade, SlotToWork, Task, UnavailableScheduleBlock, WeekAndYear, WeekTimeStudy, WeeklyIntervalIndex, expand_occurrences, get_outside_of_day_hours, propose_work_slots, verify_time_of_day
 from exception import InvalidDate, NotAvailableScheduleBlockCollision, NotFoundException
+from repository.sql.models import database
 from repository.sql.study_tracker.repo_sql import StudyTrackerSqlRepo
-from utils import get_datetime_utc
+from repository.sql.study_tracker.repo_sql_async import StudyTrackerAsyncSqlRepo
+from service.gamification.events import enqueue_gamification_event
+from starlette.concurrency import run_in_threadpool
+from utils import get_datetime_utc, get_day_window, get_iso_week_window
 from datetime import date
 
 
 study_tracker_repo = StudyTrackerSqlRepo()
+study_tracker_async_repo = StudyTrackerAsyncSqlRepo()
+
+# Events with this tag count towards the weekly study time target
+STUDY_TAG = "study"
+
+# Expanded event occurrences, keyed by (user, user events version, window).
+# The version is read from the database, and bumped by every event write, so the previous windows
+# become unreachable in every process as soon as the write commits.
+occurrences_cache: TTLCache[tuple, list[Event]] = TTLCache(max_size=2048, ttl_seconds=60)
+
+# Weekly index of the unavailable schedule blocks, keyed by (user, user unavailable blocks version), like the occurrences
+unavailable_blocks_index_cache: TTLCache[tuple[int, int], WeeklyIntervalIndex] = TTLCache(max_size=4096, ttl_seconds=600)
 
 def update_user_study_tracker_use_goals(user_id: int, use_goals: set[int]):
     study_tracker_repo.update_user_study_tracker_use_goals(user_id, use_goals)
@@ -14,15 +31,41 @@ def update_user_study_tracker_use_goals(user_id: int, use_goals: set[int]):
 def update_study_tracker_app_planning_day(user_id: int, day: int, hour: int):
     study_tracker_repo.update_study_tracker_app_planning_day(user_id, day, hour)
     
+def get_unavailable_blocks_index(user_id: int) -> WeeklyIntervalIndex:
+    # Read before the blocks, as in get_event_occurrences
+    blocks_version = study_tracker_repo.get_unavailable_blocks_version(user_id)
+
+    def build() -> WeeklyIntervalIndex:
+        return WeeklyIntervalIndex(study_tracker_repo.get_not_available_schedule_blocks(user_id))
+
+    if blocks_version is None:
+        return build()
+    return unavailable_blocks_index_cache.get_or_compute((user_id, blocks_version), build)
+
 def does_not_collide_with_unavailable_block(
     user_id: int,
-    event_date_interval: DateInterval
+    event: Event,
+    blocks_index: WeeklyIntervalIndex | None = None
 ):
     # Don't allow to create event where schedule block is of type: not available
-    not_available_blocks = study_tracker_repo.get_not_available_schedule_blocks(user_id)
-    for block in not_available_blocks:
-        if event_date_interval.collides_with_unavailable_block(block):
+    if blocks_index is None:
+        blocks_index = get_unavailable_blocks_index(user_id)
+    if blocks_index.is_empty():
+        return
+
+    # Blocks repeat every week, so the occurrences of the first week cover every possible collision
+    first_week_end = event.date.start_date + timedelta(weeks=1)
+    for occurrence in event.occurrences(None, first_week_end):
+        if blocks_index.collides_with(occurrence.date):
             raise NotAvailableScheduleBlockCollision()
+
+def do_not_collide_with_unavailable_blocks(user_id: int, events: list[Event]):
+    """Checks a batch of events against the same index."""
+    if not events:
+        return
+    blocks_index = get_unavailable_blocks_index(user_id)
+    for event in events:
+        does_not_collide_with_unavailable_block(user_id, event, blocks_index)
         
 def verify_start_end_date_validity(date: DateInterval):
     if date.start_date >= date.end_date:
@@ -34,14 +77,14 @@ def create_event(user_id: int, event: Event) -> Event:
     print(f"Cor: {event.color}")
     print(f"Notas: {event.notes}")
     
-    does_not_collide_with_unavailable_block(user_id, event.date)
+    does_not_collide_with_unavailable_block(user_id, event)
     verify_start_end_date_validity(event.date)
     #study_tracker_repo.create_event(user_id, event)
     created_event = study_tracker_repo.create_event(user_id, event)
     return created_event
     
 def update_event(user_id: int, event_id: int, event: Event):
-    does_not_collide_with_unavailable_block(user_id, event.date)
+    does_not_collide_with_unavailable_block(user_id, event)
     study_tracker_repo.update_event(user_id, event_id, event)
 
 def delete_event(user_id: int, event_id: int):
@@ -50,14 +93,57 @@ def delete_event(user_id: int, event_id: int):
 def update_receive_notifications_pref(user_id: int, receive: bool):
     study_tracker_repo.update_receive_notifications_pref(user_id, receive)
 
-def get_events(user_id: int, today: bool, recurrentEvents: bool, study_events: bool, week_number: int | None) -> list[Event]:
-    return study_tracker_repo.get_events(user_id, today, recurrentEvents, study_events, week_number)
+def get_events(user_id: int, today: bool, recurrentEvents: bool, study_events: bool, week_number: int | None, year: int | None = None) -> list[Event]:
+    return study_tracker_repo.get_events(user_id, today, recurrentEvents, study_events, week_number, year)
+
+def get_events_in_window(user_id: int, start: datetime | None, end: datetime | None, tags: list[str] | None, recurrent_only: bool) -> list[Event]:
+    if start is None or end is None:
+        # An open window can't be expanded, since recurrent events never end
+        return study_tracker_repo.get_events_in_window(user_id, start, end, tags, recurrent_only)
+
+    verify_start_end_date_validity(DateInterval(start, end))
+    return get_event_occurrences(user_id, start, end, tags, recurrent_only, overlapping=True)
+
+def get_event_occurrences(
+    user_id: int,
+    start: datetime,
+    end: datetime,
+    tags: list[str] | None = None,
+    recurrent_only: bool = False,
+    overlapping: bool = False
+) -> list[Event]:
+    """
+    Returns every occurrence, of every event (recurrent or not), which starts inside [start, end[ or, when overlapping,
+    which overlaps it. Statistics use the former, so each occurrence counts towards a single day or week.
+    """
+    # Read before the events, so they are never older than the version they are cached under
+    events_version = study_tracker_repo.get_events_version(user_id)
+    key = (
+        user_id,
+        events_version,
+        start,
+        end,
+        tuple(sorted(tag.lower() for tag in tags)) if tags else None,
+        recurrent_only,
+        overlapping
+    )
+
+    def expand() -> list[Event]:
+        events = study_tracker_repo.get_events_in_window(
+            user_id, start, end, tags, recurrent_only, include_recurring_series=True
+        )
+        return list(expand_occurrences(events, start, end, overlapping))
+
+    if events_version is None:
+        # This transaction wrote events, which are not committed yet
+        return expand()
+    return occurrences_cache.get_or_compute(key, expand)
 
 def create_schedule_not_available_block(user_id: int, info: UnavailableScheduleBlock):
     study_tracker_repo.create_not_available_schedule_block(user_id, info)
 
-def create_event_from_task(user_id: int, task: Task, slot: SlotToWork):
-    associatedEvent = Event(
+def build_work_slot_event(task: Task, slot: SlotToWork) -> Event:
+    return Event(
         id=None,
         title=task.title,
         date=DateInterval(
@@ -66,21 +152,70 @@ def create_event_from_task(user_id: int, task: Task, slot: SlotToWork):
         ),
         tags=task.tags,
         every_week=False,
-        every_day=False
+        every_day=False,
+        color=DEFAULT_EVENT_COLOR
     )
-    create_event(user_id, associatedEvent)
 
-def create_task(user_id: int, task: Task, slotsToWork: list[SlotToWork]) -> int:
-    for slot in slotsToWork:
-        create_event_from_task(user_id, task, slot)
-        
-    return study_tracker_repo.create_task(user_id, task, task_id=None) # Generates random and available task ID
+def build_work_slot_events(user_id: int, task: Task, slotsToWork: list[SlotToWork]) -> list[Event]:
+    work_events = [build_work_slot_event(task, slot) for slot in slotsToWork]
+    do_not_collide_with_unavailable_blocks(user_id, work_events)
+    for event in work_events:
+        verify_start_end_date_validity(event.date)
+    return work_events
+
+def propose_task_work_slots(
+    user_id: int,
+    task_id: int | None,
+    deadline: datetime | None,
+    effort: timedelta,
+    slot_length: timedelta,
+    start: datetime | None = None,
+    day_start_hour: int = 8,
+    day_end_hour: int = 22,
+    max_per_day: timedelta | None = None
+) -> list[SlotToWork]:
+    """
+    Proposes free work slots, from `start` (now, by default) until the deadline, around the user's events
+    (recurrent ones included), unavailable blocks and the hours outside of [day_start_hour, day_end_hour[.
+    Without a deadline, the deadline of the task is used.
+    """
+    if deadline is None and task_id is not None:
+        deadline = study_tracker_repo.get_task(user_id, task_id).deadline
+    if deadline is None:
+        raise InvalidDate()
+    if not 0 <= day_start_hour < day_end_hour <= 24 or effort <= timedelta(0) or slot_length <= timedelta(0):
+        raise InvalidDate()
+
+    # Proposals start at a whole minute
+    window_start = start or datetime.now()
+    if window_start.second or window_start.microsecond:
+        window_start = window_start.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    verify_start_end_date_validity(DateInterval(window_start, deadline))
+
+    # Starting the day before catches the events still running at window_start. Whole days keep the occurrences cache warm
+    events_start = datetime.combine(window_start.date() - timedelta(days=1), datetime.min.time())
+    busy = [
+        (event.date for event in get_event_occurrences(user_id, events_start, deadline)),
+        get_unavailable_blocks_index(user_id).occurrences(window_start, deadline),
+        get_outside_of_day_hours(window_start, deadline, day_start_hour, day_end_hour),
+    ]
+    return propose_work_slots(busy, window_start, deadline, effort, slot_length, max_per_day)
+
+def create_task_work_slots(user_id: int, task_id: int, slotsToWork: list[SlotToWork]) -> list[Event]:
+    """Creates the work slot events of an existing task, such as the chosen proposals, all at once."""
+    task = study_tracker_repo.get_task(user_id, task_id)
+    work_events = build_work_slot_events(user_id, task, slotsToWork)
+    created_events = study_tracker_repo.create_task_work_events(user_id, task_id, work_events)
+    return created_events
+
+def create_task(user_id: int, task: Task, slotsToWork: list[SlotToWork]) -> Task:
+    work_events = build_work_slot_events(user_id, task, slotsToWork)
+    created_task = study_tracker_repo.create_task(user_id, task, None, work_events) # The task ID is taken from a sequence
+    return created_task
 
 def update_task(user_id: int, task_id: int, updated_task: Task, slotsToWork: list[SlotToWork], previous_task_name: str):
-    study_tracker_repo.update_task(user_id, task_id, updated_task)
-    study_tracker_repo.delete_events(user_id, previous_task_name)
-    for slot in slotsToWork:
-        create_event_from_task(user_id, updated_task, slot)
+    work_events = build_work_slot_events(user_id, updated_task, slotsToWork)
+    study_tracker_repo.update_task(user_id, task_id, updated_task, work_events, previous_task_name)
 
 def get_user_daily_tasks_progress(user_id: int, year: int, week: int) -> list[tuple[date, float]]:
     week_tasks = study_tracker_repo.get_tasks(user_id, False, False, False, year, week)
@@ -89,9 +224,9 @@ def get_user_daily_tasks_progress(user_id: int, year: int, week: int) -> list[tu
     for task in week_tasks:
         deadline = task.deadline
         
-        # Should not happen because we asked for tasks with a specific year and week
+        # Tasks without a deadline are listed in every week, but belong to none of its days
         if deadline is None:
-            raise
+            continue
         
         
         task_date = deadline.date()
@@ -118,7 +253,9 @@ def get_user_tasks(
     user_id: int,
     order_by_deadline_and_priority: bool, 
     filter_uncompleted_tasks: bool, 
-    filter_deadline_is_today: bool    
+    filter_deadline_is_today: bool,
+    limit: int | None = None,
+    after_task_id: int | None = None
 ) -> list[Task]:
     return study_tracker_repo.get_tasks(
         user_id, 
@@ -126,16 +263,37 @@ def get_user_tasks(
         filter_uncompleted_tasks, 
         filter_deadline_is_today,
         None,
-        None
+        None,
+        limit,
+        after_task_id
+    )
+
+async def get_user_tasks_async(
+    user_id: int,
+    order_by_deadline_and_priority: bool, 
+    filter_uncompleted_tasks: bool, 
+    filter_deadline_is_today: bool,
+    limit: int | None = None,
+    after_task_id: int | None = None
+) -> list[Task]:
+    """Same as get_user_tasks, on the async engine when enabled, or else on the threadpool."""
+    if not database.ASYNC_DATABASE_ENABLED:
+        return await run_in_threadpool(
+            get_user_tasks, user_id, order_by_deadline_and_priority, filter_uncompleted_tasks, filter_deadline_is_today, limit, after_task_id
+        )
+    return await study_tracker_async_repo.get_tasks(
+        user_id, 
+        order_by_deadline_and_priority, 
+        filter_uncompleted_tasks, 
+        filter_deadline_is_today,
+        None,
+        None,
+        limit,
+        after_task_id
     )
 
 def get_user_task(user_id: int, task_id: int) -> Task:
-    # TODO: improve later
-    user_tasks = get_user_tasks(user_id, False, False, False)
-    for task in user_tasks:
-        if task.id == task_id:
-            return task
-    raise NotFoundException(user_id)
+    return study_tracker_repo.get_task(user_id, task_id)
 
 def update_task_status(user_id: int, task_id: int, new_status: str):
     study_tracker_repo.update_task_status(user_id, task_id, new_status)
@@ -148,6 +306,7 @@ def get_archives(user_id: int) -> list[Archive]:
 
 def create_file(user_id: int, archive_name: str, name: str):
     study_tracker_repo.create_file(user_id, archive_name, name)
+    enqueue_gamification_event(user_id, "notepad_entry")
 
 def update_file_content(user_id: int, archive_name: str, filename: str, new_content: str):
     study_tracker_repo.update_file_content(user_id, archive_name, filename, new_content)
@@ -185,13 +344,41 @@ def get_daily_energy_history(user_id: int) -> list[DailyEnergyStatus]:
     return study_tracker_repo.get_daily_energy_history(user_id)
 
 def get_task_time_distribution(user_id: int) -> dict[int, dict[int, dict[str, int]]]:
-    return study_tracker_repo.get_time_spent_by_tag(user_id)
+    # Non recurrent events are aggregated by the repository, as events change
+    stats = study_tracker_repo.get_time_spent_by_tag(user_id)
+
+    # Recurrent events count once per occurrence, until the end of today
+    recurrent_events = study_tracker_repo.get_events_in_window(user_id, None, None, None, recurrent_only=True)
+    _, today_end = get_day_window(date.today())
+    for occurrence in expand_occurrences(recurrent_events, None, today_end):
+        start_date = occurrence.date.start_date
+        iso_year, iso_week, _ = start_date.isocalendar()
+        week_stats = stats.setdefault(iso_year, {}).setdefault(iso_week, {})
+        minutes = elapsed_minutes(start_date, occurrence.date.end_date)
+        for tag_name in occurrence.tags:
+            week_stats[tag_name] = week_stats.get(tag_name, 0) + minutes
+
+    return stats
 
 def get_total_time_study_per_week(user_id: int) -> list[WeekTimeStudy]:
-    stats_by_week = study_tracker_repo.get_total_time_study_per_week(user_id)
+    # The targets of non recurrent study events come with the weeks, from the time by tag aggregate
+    stats_by_week = study_tracker_repo.get_total_time_study_per_week(user_id, STUDY_TAG)
+    if not stats_by_week:
+        return stats_by_week
+
+    # Recurrent study events are expanded once, over all the weeks
+    week_windows = [get_iso_week_window(week.week_and_year.year, week.week_and_year.week) for week in stats_by_week]
+    window_start = min(week_start for week_start, _ in week_windows)
+    window_end = max(week_end for _, week_end in week_windows)
+    recurrent_minutes: dict[tuple[int, int], int] = {}
+    for occurrence in get_event_occurrences(user_id, window_start, window_end, [STUDY_TAG], recurrent_only=True):
+        iso_year, iso_week, _ = occurrence.date.start_date.isocalendar()
+        minutes = elapsed_minutes(occurrence.date.start_date, occurrence.date.end_date)
+        recurrent_minutes[(iso_year, iso_week)] = recurrent_minutes.get((iso_year, iso_week), 0) + minutes
+
     for week in stats_by_week:
-        week_study_time_target = get_week_study_time_target(user_id, week.week_and_year.week)
-        week.target = week_study_time_target
+        week_key = (week.week_and_year.year, week.week_and_year.week)
+        week.target = (week.target or 0) + recurrent_minutes.get(week_key, 0)
     return stats_by_week
 
 """
@@ -202,8 +389,12 @@ def elapsed_minutes(dat_1: datetime, dat_2: datetime) -> int:
     minutes_2 = get_datetime_utc(dat_2) / 60
     return (int) (minutes_2 - minutes_1)
 
-def get_week_study_time_target(user_id: int, week_number: int) -> int:
-    events = get_events(user_id, False, False, True, week_number)
+def get_week_study_time_target(user_id: int, week_number: int, year: int | None = None) -> int:
+    if year is None:
+        events = get_events(user_id, False, False, True, week_number)
+    else:
+        week_start, week_end = get_iso_week_window(year, week_number)
+        events = get_event_occurrences(user_id, week_start, week_end, [STUDY_TAG])
     total: int = 0
     for event in events:
         total += elapsed_minutes(event.date.start_date, event.date.end_date)
@@ -227,9 +418,10 @@ def finish_study_session(user_id: int):
     
     study_session_duration_min = elapsed_minutes(start_time, now)
     
-    cur_week_number = now.isocalendar()[1]
+    # ISO year, the same as the time by tag aggregate, so weeks at the turn of the year match their targets
+    iso_year, cur_week_number, _ = now.isocalendar()
     week_and_year = WeekAndYear(
-        year=now.year,
+        year=iso_year,
         week=cur_week_number
     )
     
@@ -1,4 +1,4 @@
-from datetime import datetime, date
+from datetime import datetime, date, time, timedelta
 
 
 def get_datetime_utc(datetime: datetime) -> int:
@@ -6,4 +6,12 @@ def get_datetime_utc(datetime: datetime) -> int:
 
 def get_datetime_utc_from_date(date: date) -> int:
     tmp = datetime(date.year, date.month, date.day)
-    return get_datetime_utc(tmp)
\ No newline at end of file
+    return get_datetime_utc(tmp)
+
+def get_day_window(day: date) -> tuple[datetime, datetime]:
+    start = datetime.combine(day, time.min)
+    return start, start + timedelta(days=1)
+
+def get_iso_week_window(year: int, week: int) -> tuple[datetime, datetime]:
+    start = datetime.combine(date.fromisocalendar(year, week, 1), time.min)
+    return start, start + timedelta(weeks=1)